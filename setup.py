@@ -22,5 +22,5 @@ setup(
     "seaborn>=0.11.2",
     "qgrid>=1.3.1",
     ],
-    scripts=['src/dynawo_validation/dynaflow/pipeline/add_contg_job.py','src/dynawo_validation/dynaflow/pipeline/top_10_diffs_dflow.py', 'src/dynawo_validation/dynawaltz/pipeline/top_10_diffs_dwaltz.py','src/dynawo_validation/dynawaltz/pipeline/dynawaltz_run_validation', 'src/dynawo_validation/dynaflow/pipeline/dynaflow_run_validation', 'src/dynawo_validation/commons/xml_utils/convert_dwaltz2dwoAdwoB.sh', 'src/dynawo_validation/commons/xml_utils/convert_dflow2dwoAdwoB.sh', 'src/dynawo_validation/commons/xml_utils/xml_format_dir.sh','src/dynawo_validation/commons/dynawo_validation_find_path', 'src/dynawo_validation/commons/create_graph.py', 'src/dynawo_validation/commons/dynawo_validation_extract_bus', 'src/dynawo_validation/dynawaltz/pipeline/prepare_pipeline_basecase.py',],
+    scripts=['src/dynawo_validation/dynaflow/pipeline/add_contg_job.py','src/dynawo_validation/dynaflow/pipeline/top_10_diffs_dflow.py', 'src/dynawo_validation/dynawaltz/pipeline/top_10_diffs_dwaltz.py','src/dynawo_validation/dynawaltz/pipeline/dynawaltz_run_validation', 'src/dynawo_validation/dynaflow/pipeline/dynaflow_run_validation', 'src/dynawo_validation/commons/xml_utils/convert_dwaltz2dwoAdwoB.sh', 'src/dynawo_validation/commons/xml_utils/convert_dflow2dwoAdwoB.sh', 'src/dynawo_validation/commons/xml_utils/xml_format_dir.sh','src/dynawo_validation/commons/dynawo_validation_find_path', 'src/dynawo_validation/commons/create_graph.py', 'src/dynawo_validation/commons/dynawo_validation_extract_bus', 'src/dynawo_validation/commons/dynawo_validation_monitor', 'src/dynawo_validation/commons/dynawo_validation_worker', 'src/dynawo_validation/commons/dynawo_validation_campaign', 'src/dynawo_validation/dynawaltz/pipeline/prepare_pipeline_basecase.py',],
 )
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_calibrate.py:
+#
+# Finds the split of the CPUs of this machine between concurrent jobs and threads
+# per job (see contg_scheduler.py, options -j and --threads) that gives the best
+# throughput, for a given set of contingency cases. The best split depends both on
+# the machine (cores, memory bandwidth, caches) and on the size of the cases, so it
+# is measured rather than guessed:
+#
+#   * a sample of the cases (by default, twice as many as the CPUs), evenly spread
+#     over them, is run once under each split: 1 thread x NCPUS jobs, 2 threads x
+#     NCPUS/2 jobs, 4 threads x NCPUS/4 jobs, and so on, with every job pinned to
+#     its own CPUs
+#
+#   * the cases are run just as in the campaign (same command, same
+#     post-processing), but without retries and without using the results cache
+#     (DWO_VALIDATION_CACHE), which would otherwise make every split look instant
+#
+#   * the throughput of each split (cases per minute) is printed, together with the
+#     recommended one, and also appended to a CSV file, with columns:
+#
+#        TIME; HOST; NCPUS; CASE_PREFIX; NCASES; JOBS; THREADS; CASES_PER_MIN
+#
+# The results of the sample cases are written wherever the command writes them, so
+# it should be given a temporary output dir (this is what run_all_contg.sh does in
+# its --calibrate mode). Note that the post-processing workers are forked from this
+# process, so they keep the BLAS threads of the first split (one thread).
+#
+# Usage example:
+#
+#    contg_calibrate.py -C RESULTS/calibration.csv \
+#        -P dynawo_validation.dynaflow.pipeline.contg_postproc \
+#        -O "-o /tmp/calib BASECASE" CASE_DIR gen# -- \
+#        run_one_contg.sh -p -o /tmp/calib -A dynawo.sh -B hades BASECASE
+#
+
+import argparse
+import csv
+import importlib
+import os
+import shlex
+import socket
+import sys
+import tempfile
+import time
+from dynawo_validation.commons import contg_scheduler
+from dynawo_validation.commons.contg_cpus import CpuAllocator, thread_env
+from dynawo_validation.commons.contg_ledger import JobLedger
+from dynawo_validation.commons.contg_scheduler import ContgScheduler, find_cases
+
+
+CALIBRATION_FILE = "calibration.csv"
+CALIBRATION_COLUMNS = [
+    "TIME",
+    "HOST",
+    "NCPUS",
+    "CASE_PREFIX",
+    "NCASES",
+    "JOBS",
+    "THREADS",
+    "CASES_PER_MIN",
+]
+MAX_THREADS = 8
+
+
+def sample_cases(cases, n):
+    """n cases, evenly spread over the (sorted) list of cases"""
+    if n >= len(cases):
+        return cases
+    return [cases[i * len(cases) // n] for i in range(n)]
+
+
+def candidate_splits(ncpus, max_threads=MAX_THREADS):
+    """(jobs, threads) with threads = 1, 2, 4... using all the CPUs"""
+    splits = []
+    threads = 1
+    while threads <= min(ncpus, max_threads):
+        splits.append((ncpus // threads, threads))
+        threads *= 2
+    return splits
+
+
+def run_split(command, cases, jobs, threads, postproc_opts, ab_opt):
+    """Run the cases with the given split; return (cases done, elapsed seconds)"""
+    os.environ.update(thread_env(threads))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scheduler = ContgScheduler(
+            command,
+            JobLedger(os.path.join(tmp_dir, "jobs_ledger.csv")),
+            jobs,
+            retries=0,
+            postproc_opts=postproc_opts,
+            ab_opt=ab_opt,
+            threads=threads,
+            cpus=CpuAllocator(),
+        )
+        t0 = time.monotonic()
+        failed = scheduler.run(cases)
+        elapsed = time.monotonic() - t0
+    return len(cases) - len(failed) - len(scheduler.timedout), elapsed
+
+
+def record(calibration_file, case_prefix, ncases, results):
+    ncpus = len(os.sched_getaffinity(0))
+    new_file = not os.path.isfile(calibration_file)
+    with open(calibration_file, "a", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        if new_file:
+            writer.writerow(CALIBRATION_COLUMNS)
+        for jobs, threads, throughput in results:
+            writer.writerow(
+                [
+                    "%.3f" % time.time(),
+                    socket.gethostname(),
+                    ncpus,
+                    case_prefix,
+                    ncases,
+                    jobs,
+                    threads,
+                    "%.2f" % throughput,
+                ]
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find the best split of the CPUs between concurrent jobs and "
+        "threads per job, by running a sample of the cases CASE_DIR/CASE_PREFIX* "
+        "under each split"
+    )
+    parser.add_argument(
+        "-n",
+        "--sample",
+        type=int,
+        default=None,
+        help="number of cases to run under each split (default: twice the CPUs)",
+    )
+    parser.add_argument(
+        "-t",
+        "--max-threads",
+        type=int,
+        default=MAX_THREADS,
+        help="maximum threads per job to try (default: %d)" % MAX_THREADS,
+    )
+    parser.add_argument(
+        "-P",
+        "--postproc",
+        default=None,
+        help="python module providing postprocess(argv), to be run on each case "
+        "(see contg_scheduler.py)",
+    )
+    parser.add_argument(
+        "-O",
+        "--postproc-opts",
+        default="",
+        help="options for the post-processing (the case dir is appended to them)",
+    )
+    parser.add_argument(
+        "-a",
+        "--ab-opt",
+        default=None,
+        help="option of the command for running the A and B simulations of a case "
+        "concurrently (see contg_scheduler.py)",
+    )
+    parser.add_argument(
+        "-C",
+        "--calibration-file",
+        default=CALIBRATION_FILE,
+        help="CSV file where the results are appended (default: %s)"
+        % CALIBRATION_FILE,
+    )
+    parser.add_argument("case_dir", help="directory containing the contingency cases")
+    parser.add_argument("case_prefix", help="prefix of the contingency cases to run")
+    parser.add_argument(
+        "command",
+        nargs=argparse.REMAINDER,
+        help="command to run for each case (the case dir is appended to it)",
+    )
+    args = parser.parse_args()
+    command = args.command
+    if len(command) != 0 and command[0] == "--":
+        command = command[1:]
+    if len(command) == 0:
+        parser.error("no command given for running the cases")
+
+    cases = find_cases(args.case_dir, args.case_prefix)
+    if len(cases) == 0:
+        print(f"No cases with pattern {args.case_prefix}* found under {args.case_dir}")
+        return 1
+    ncpus = len(os.sched_getaffinity(0))
+    sample = sample_cases(cases, args.sample if args.sample else 2 * ncpus)
+    # Every split must really run the cases
+    os.environ.pop("DWO_VALIDATION_CACHE", None)
+
+    postproc_opts = None
+    if args.postproc is not None:
+        os.environ.update(thread_env(1))
+        contg_scheduler.postproc_module = importlib.import_module(args.postproc)
+        postproc_opts = shlex.split(args.postproc_opts)
+
+    print(
+        "*** Calibrating on %d of the %d cases %s* (%d CPUs)"
+        % (len(sample), len(cases), args.case_prefix, ncpus),
+        flush=True,
+    )
+    results = []
+    for jobs, threads in candidate_splits(ncpus, args.max_threads):
+        print("*** Running %d jobs x %d threads" % (jobs, threads), flush=True)
+        ndone, elapsed = run_split(
+            command, sample, jobs, threads, postproc_opts, args.ab_opt
+        )
+        if ndone == 0:
+            print("*** No case succeeded with %d jobs x %d threads" % (jobs, threads))
+            continue
+        results.append((jobs, threads, ndone / elapsed * 60))
+    if len(results) == 0:
+        print("Calibration failed: no case succeeded")
+        return 1
+    record(args.calibration_file, args.case_prefix, len(sample), results)
+
+    print()
+    print("%6s %8s %10s" % ("JOBS", "THREADS", "CASES/MIN"))
+    for jobs, threads, throughput in results:
+        print("%6d %8d %10.2f" % (jobs, threads, throughput))
+    jobs, threads, _ = max(results, key=lambda x: x[2])
+    print()
+    print("Recommended split: %d jobs x %d threads" % (jobs, threads))
+    print("(results appended to %s)" % args.calibration_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_campaign.py:
+#
+# Runs the validation pipeline (dynaflow_run_validation or dynawaltz_run_validation,
+# plus any options) on a list of basecases, e.g. the snapshots of many hours and
+# seasons, on this host, sharing its CPUs among all of them. Instead of running the
+# basecases one after the other (leaving the machine idle while each one creates its
+# contingency cases, computes its metrics and notebooks, or simulates the last few
+# cases of each type of device), several pipelines are run at once (option -b), and
+# their contingency schedulers take their job slots from one shared pool (see
+# contg_slots.py), so that the machine stays busy and the basecases running at the
+# same time get fair shares of it. As soon as a pipeline finishes, the next basecase
+# is started.
+#
+# The basecases are given in a text file, one per line (empty lines and lines
+# starting with # are ignored), as either BASECASE or LABEL=BASECASE. Each one is
+# run into RESULTS_DIR/LABEL (by default, LABEL is the name of the basecase dir),
+# with its output kept in RESULTS_DIR/LABEL.log. Since the contingency cases are
+# created next to each basecase, each basecase must be in a dir of its own.
+#
+# The outcome of every pipeline is appended to RESULTS_DIR/campaign.csv, and the
+# results of all of them are summarized in RESULTS_DIR/campaign_summary.csv, one row
+# per basecase and type of device, with columns:
+#
+#    BASECASE; DEVICE; NCASES; DONE; FAILED; TIMEOUT; ...
+#
+# followed by the scores: for DynaFlow, the compound scores of the contingencies
+# (see get_and_define_weights.py), as the worst score of each metric (MAX, P95 and
+# MEAN), the contingency having the worst MAX score, and the number of contingencies
+# above each threshold; for DynaWaltz, the median over all cases of the absolute
+# difference of each reduced parameter of the curves (see calc_curve_diffmetrics.py).
+# The summary can also be recomputed at any time with option --summary-only.
+#
+# Usage example:
+#
+#    dynawo_validation_campaign -j 100% -b 4 basecases.txt RESULTS -- \
+#        dynaflow_run_validation -A dynawo.sh -B hades -a
+#
+
+import argparse
+import csv
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import pandas as pd
+from dynawo_validation.commons.contg_ledger import LEDGER_FILE, read_ledger
+from dynawo_validation.commons.contg_nway import pair_metrics
+from dynawo_validation.commons.contg_scheduler import parse_njobs
+from dynawo_validation.commons.contg_slots import SlotPool
+from dynawo_validation.dynaflow.pipeline.common_funcs import calc_global_score
+
+
+CAMPAIGN_FILE = "campaign.csv"
+CAMPAIGN_COLUMNS = ["TIME", "BASECASE", "PATH", "EXIT_CODE", "WALL_TIME"]
+SUMMARY_FILE = "campaign_summary.csv"
+MAX_BASECASES = 4
+POLL_INTERVAL = 5  # seconds between checks of the running pipelines
+
+
+def read_basecases(basecases_file):
+    """List of (label, basecase path), from lines BASECASE or LABEL=BASECASE"""
+    basecases = []
+    with open(basecases_file) as f:
+        for line in f:
+            line = line.strip()
+            if line == "" or line[0] == "#":
+                continue
+            if "=" in line:
+                label, basecase = [x.strip() for x in line.split("=", 1)]
+            else:
+                basecase = line
+                label = os.path.basename(os.path.normpath(basecase))
+            label = re.sub(r"[^A-Za-z0-9._-]", "_", label)
+            if label == "" or basecase == "":
+                raise ValueError("Bad basecase line: %s" % line)
+            if label in [x[0] for x in basecases]:
+                raise ValueError(
+                    "Duplicate basecase label: %s (use LABEL=BASECASE)" % label
+                )
+            basecases.append((label, basecase))
+    # The contingency cases of each basecase are created next to it
+    case_dirs = [os.path.dirname(os.path.abspath(x[1])) for x in basecases]
+    for case_dir in set(case_dirs):
+        if case_dirs.count(case_dir) > 1:
+            raise ValueError(
+                "Several basecases under %s: each one must be in a dir of its own"
+                % case_dir
+            )
+    return basecases
+
+
+def record(campaign_file, label, basecase, exit_code, wall_time):
+    new_file = not os.path.isfile(campaign_file)
+    with open(campaign_file, "a", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        if new_file:
+            writer.writerow(CAMPAIGN_COLUMNS)
+        writer.writerow(
+            ["%.3f" % time.time(), label, basecase, exit_code, "%.2f" % wall_time]
+        )
+
+
+def run_campaign(basecases, results_dir, command, max_basecases, pool_dir):
+    """Run the pipeline on all the basecases; return how many of them failed"""
+    campaign_file = os.path.join(results_dir, CAMPAIGN_FILE)
+    env = dict(os.environ, DWO_VALIDATION_POOL=os.path.abspath(pool_dir))
+    pending = list(basecases)
+    running = []
+    nfailed = 0
+    try:
+        while pending or running:
+            while pending and len(running) < max_basecases:
+                label, basecase = pending.pop(0)
+                log_file = open(os.path.join(results_dir, label + ".log"), "w")
+                cmd = command + [basecase, os.path.join(results_dir, label)]
+                print("*** Starting basecase %s: %s" % (label, " ".join(cmd)))
+                print("    (output in %s)" % log_file.name, flush=True)
+                proc = subprocess.Popen(
+                    cmd, stdout=log_file, stderr=subprocess.STDOUT, env=env
+                )
+                running.append((label, basecase, proc, log_file, time.monotonic()))
+            time.sleep(POLL_INTERVAL)
+            for entry in [x for x in running if x[2].poll() is not None]:
+                label, basecase, proc, log_file, t_start = entry
+                running.remove(entry)
+                log_file.close()
+                wall_time = time.monotonic() - t_start
+                record(campaign_file, label, basecase, proc.returncode, wall_time)
+                if proc.returncode != 0:
+                    nfailed += 1
+                print(
+                    "*** Finished basecase %s (exit code: %d, %.1f min); %d running, "
+                    "%d pending"
+                    % (
+                        label,
+                        proc.returncode,
+                        wall_time / 60,
+                        len(running),
+                        len(pending),
+                    ),
+                    flush=True,
+                )
+    except KeyboardInterrupt:
+        # The pipelines got the Ctrl-C too (same process group)
+        for label, basecase, proc, log_file, t_start in running:
+            proc.wait()
+            log_file.close()
+        raise
+    return nfailed
+
+
+def dynaflow_scores(device_dir, weights_file):
+    """Compound scores of a DynaFlow device results dir"""
+    df_metrics = pd.read_csv(
+        os.path.join(device_dir, "pf_metrics", "metrics.csv.xz"), index_col=0
+    )
+    df_weights = pd.read_csv(weights_file, sep=";", index_col=0)
+    weights = [
+        df_weights[x].to_list()[0]
+        for x in [
+            "W_V",
+            "W_P",
+            "W_Q",
+            "W_T",
+            "MAX_THRESH",
+            "MEAN_THRESH",
+            "P95_THRESH",
+        ]
+    ]
+    df_score, max_n, p95_n, mean_n, total_n = calc_global_score(df_metrics, *weights)
+    if total_n == 0:
+        return {}
+    worst = df_score.loc[df_score.MAX_SCORE.idxmax()]
+    return {
+        "MAX_SCORE": df_score.MAX_SCORE.max(),
+        "P95_SCORE": df_score.P95_SCORE.max(),
+        "MEAN_SCORE": df_score.MEAN_SCORE.max(),
+        "WORST_CONTG": worst.CONTG,
+        "MAX_ABOVE_THRESH": max_n,
+        "P95_ABOVE_THRESH": p95_n,
+        "MEAN_ABOVE_THRESH": mean_n,
+    }
+
+
+def device_summary(basecase_dir, device):
+    device_dir = os.path.join(basecase_dir, device)
+    states = [
+        x["STATE"] for x in read_ledger(os.path.join(device_dir, LEDGER_FILE)).values()
+    ]
+    row = {
+        "NCASES": len(states),
+        "DONE": states.count("done"),
+        "FAILED": states.count("failed") + states.count("oom"),
+        "TIMEOUT": states.count("timeout"),
+    }
+    weights_file = os.path.join(basecase_dir, "score_weights.csv")
+    if os.path.isfile(os.path.join(device_dir, "pf_metrics", "metrics.csv.xz")):
+        if os.path.isfile(weights_file):
+            row.update(dynaflow_scores(device_dir, weights_file))
+    else:
+        metrics = pair_metrics(device_dir)
+        if metrics is not None:
+            row.update(metrics[1])
+    return row
+
+
+def summarize(basecases, results_dir):
+    rows = []
+    for label, _ in basecases:
+        basecase_dir = os.path.join(results_dir, label)
+        if not os.path.isdir(basecase_dir):
+            continue
+        for device in sorted(os.listdir(basecase_dir)):
+            if not os.path.isfile(os.path.join(basecase_dir, device, LEDGER_FILE)):
+                continue
+            row = {"BASECASE": label, "DEVICE": device}
+            row.update(device_summary(basecase_dir, device))
+            rows.append(row)
+    if len(rows) == 0:
+        raise ValueError("No results found for any basecase under %s" % results_dir)
+    df = pd.DataFrame(rows)
+    # (missing for the devices without scores)
+    for col in [c for c in df.columns if c.endswith("_ABOVE_THRESH")]:
+        df[col] = df[col].astype("Int64")
+    df.to_csv(
+        os.path.join(results_dir, SUMMARY_FILE),
+        sep=";",
+        index=False,
+        float_format="%.4f",
+    )
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the validation pipeline on a list of basecases, several "
+        "at a time, sharing the CPUs of this host among them"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default="100%",
+        help="total number of contingency jobs to run concurrently, for all the "
+        "basecases, or a percentage of the CPU cores (default: 100%%)",
+    )
+    parser.add_argument(
+        "-b",
+        "--max-basecases",
+        type=int,
+        default=MAX_BASECASES,
+        help="maximum number of basecases run at the same time (default: %d)"
+        % MAX_BASECASES,
+    )
+    parser.add_argument(
+        "-p",
+        "--pool-dir",
+        default=None,
+        help="dir of the pool of job slots, which must be on a local filesystem "
+        "(default: a temporary dir)",
+    )
+    parser.add_argument(
+        "-s",
+        "--summary-only",
+        action="store_true",
+        help="do not run anything, just summarize the results already in "
+        "RESULTS_DIR",
+    )
+    parser.add_argument(
+        "basecases_file",
+        help="text file listing the basecases, one per line, as BASECASE or "
+        "LABEL=BASECASE",
+    )
+    parser.add_argument("results_dir", help="results dir of the whole campaign")
+    parser.add_argument(
+        "command",
+        nargs=argparse.REMAINDER,
+        help="pipeline command (e.g. dynaflow_run_validation plus its options), to "
+        "which the basecase and its results dir are appended",
+    )
+    args = parser.parse_args()
+    command = args.command
+    if len(command) != 0 and command[0] == "--":
+        command = command[1:]
+    if len(command) == 0 and not args.summary_only:
+        parser.error("no pipeline command given")
+    try:
+        basecases = read_basecases(args.basecases_file)
+    except (OSError, ValueError) as e:
+        print("ERROR: %s" % e)
+        return 1
+    os.makedirs(args.results_dir, exist_ok=True)
+
+    nfailed = 0
+    if not args.summary_only:
+        njobs = parse_njobs(args.jobs)
+        pool_dir = args.pool_dir
+        if pool_dir is None:
+            pool_dir = tempfile.mkdtemp(prefix="dwo_slot_pool_")
+        SlotPool.create(pool_dir, njobs)
+        print(
+            "*** Running %d basecases, %d at a time, sharing %d job slots (pool: %s)"
+            % (len(basecases), args.max_basecases, njobs, pool_dir),
+            flush=True,
+        )
+        try:
+            nfailed = run_campaign(
+                basecases, args.results_dir, command, args.max_basecases, pool_dir
+            )
+        finally:
+            if args.pool_dir is None:
+                shutil.rmtree(pool_dir, ignore_errors=True)
+
+    try:
+        df = summarize(basecases, args.results_dir)
+    except ValueError as e:
+        print("ERROR: %s" % e)
+        return 1
+    print("\nSummary of all the basecases (%s):\n" % SUMMARY_FILE)
+    print(df.to_string(index=False, float_format="%.4f"))
+    if nfailed != 0:
+        print("\nWARNING: the pipeline failed on %d basecases" % nfailed)
+    return min(nfailed, 1)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
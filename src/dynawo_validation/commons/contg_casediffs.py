@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_casediffs.py:
+#
+# Re-creates the contingency cases of an existing results dir (e.g. RESULTS/gen)
+# from the diffs w.r.t. the BASECASE that run_one_contg.sh always keeps under
+# RESULTS/gen/casediffs. This is used when re-simulating only one of the two sides
+# of an existing run (option --only-side of the pipeline), so that exactly the same
+# contingency set is run again, regardless of the options (random sample, regex
+# list, etc.) it was originally created with.
+#
+# Only the cases whose results are complete are re-created (see contg_resume.py),
+# since the results of the side that is not re-simulated are needed. Cases are
+# created next to the BASECASE, just like the create_*_contg.py scripts do, and
+# their names are printed, one per line.
+#
+
+import lzma
+import os
+import shutil
+import subprocess
+import sys
+from dynawo_validation.commons.contg_resume import completed_cases
+
+
+def patch_strip_level(diff, case_name):
+    """The -p level for the patch, from the path of the contingency case in the diff"""
+    for line in diff.splitlines():
+        if line.startswith("+++ "):
+            path = line[4:].split("\t")[0]
+            return path.split("/").index(case_name) + 1
+    raise ValueError("No files found in the case diff of %s" % case_name)
+
+
+def recreate_case(basecase, patch_file, case_dir):
+    """Same as: cp -a BASECASE CONTG_CASE; cd CONTG_CASE; xzcat PATCH | patch -p1"""
+    case_name = os.path.basename(case_dir)
+    with lzma.open(patch_file, "rt") as f:
+        diff = f.read()
+    strip = patch_strip_level(diff, case_name)
+    if os.path.exists(case_dir):
+        shutil.rmtree(case_dir)
+    shutil.copytree(basecase, case_dir, symlinks=True)
+    subprocess.run(
+        ["patch", "-s", "-p%d" % strip], input=diff, text=True, cwd=case_dir, check=True
+    )
+
+
+def main():
+    if len(sys.argv) != 4:
+        print("\nUsage: %s BASECASE RESULTS_DIR CASE_PREFIX\n" % sys.argv[0])
+        print(
+            "   Re-creates, next to BASECASE, the contingency cases CASE_PREFIX* that "
+            "were completed in RESULTS_DIR (e.g. RESULTS/gen), from their diffs.\n"
+        )
+        return 2
+    basecase = sys.argv[1].rstrip("/")
+    results_dir = sys.argv[2]
+    case_dir = os.path.dirname(os.path.abspath(basecase))
+    for case_name in completed_cases(results_dir, sys.argv[3]):
+        patch_file = os.path.join(results_dir, "casediffs", case_name + "-patch.xz")
+        if not os.path.isfile(patch_file):
+            print("WARNING: case diff %s not found" % patch_file, file=sys.stderr)
+            continue
+        recreate_case(basecase, patch_file, os.path.join(case_dir, case_name))
+        print(case_name)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_compress.py:
+#
+# Compression of the results of a contingency case, done as a background stage of
+# the contingency scheduler (see contg_scheduler.py) instead of inside the case's
+# job. Compressing the outputs with xz -9 (in particular the output IIDM of large
+# networks) can take longer than the DynaFlow simulation itself, and it would keep
+# the job slot busy all that time. So, when called with option -z, run_one_contg.sh
+# does not compress its results but just lists them in CASE_DIR/.compress_list,
+# one per line, as:
+#
+#    SOURCE_FILE;COMPRESSED_FILE
+#
+# and, once the job finishes, the scheduler runs this script on that list, with a
+# bounded number of them running at a time (option --compress-jobs), while the job
+# slot is already taken by the next case. The case is only recorded as done in the
+# job ledger once its results are compressed. Moreover, each compressed file is
+# first written under a temporary name and then renamed, so that nobody (e.g. the
+# aggregation of the results, or a resumed run) can ever see a half-written one.
+#
+# The list is deleted once all its files are compressed. Relative paths are taken
+# from the current dir, which is the one where run_one_contg.sh was run.
+#
+
+import os
+import subprocess
+import sys
+
+
+COMPRESS_LIST = ".compress_list"
+TMP_SUFFIX = ".tmp"
+
+
+def compress(src, dest):
+    tmp_file = dest + TMP_SUFFIX
+    try:
+        with open(src, "rb") as f_in, open(tmp_file, "wb") as f_out:
+            subprocess.run(["xz", "-c9"], stdin=f_in, stdout=f_out, check=True)
+    except BaseException:
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+        raise
+    os.replace(tmp_file, dest)
+
+
+def compress_list(list_file):
+    with open(list_file) as f:
+        entries = [line.rstrip("\n").split(";") for line in f if line.strip()]
+    for src, dest in entries:
+        compress(src, dest)
+    os.remove(list_file)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("\nUsage: %s LIST_FILE...\n" % sys.argv[0])
+        print(
+            "   Compresses with xz the files listed in each LIST_FILE (as lines "
+            "SOURCE_FILE;COMPRESSED_FILE), and then deletes it.\n"
+        )
+        return 2
+    for list_file in sys.argv[1:]:
+        try:
+            compress_list(list_file)
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            print("ERROR: compressing the results listed in %s: %s" % (list_file, e))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
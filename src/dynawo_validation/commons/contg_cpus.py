@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_cpus.py:
+#
+# CPU affinity and thread control for the contingency scheduler (see
+# contg_scheduler.py, options --threads and --pin). When running one job per core,
+# the threads of the simulators, of numpy/BLAS (and any other OpenMP code), and of
+# xz all compete for the same cores, and the resulting oversubscription hurts the
+# throughput. So:
+#
+#   * every job gets a fixed number of threads (by default, one), through the
+#     environment variables honored by OpenMP, the usual BLAS libraries, numexpr,
+#     and xz (see THREAD_VARS). When not given explicitly, any such variable
+#     already set by the user is respected.
+#
+#   * optionally, every job is pinned to its own set of CPUs (as many as its
+#     threads), and so is every post-processing task. CPUs are handed out in the
+#     order of the machine's topology (package, core), so that the CPUs of a job
+#     are on the same socket, and hyperthread siblings go together.
+#
+
+import os
+import shutil
+
+
+THREAD_VARS = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+TASKSET = shutil.which("taskset")
+
+
+def thread_env(threads, force=True):
+    """The environment variables that limit a process to the given threads"""
+    env = {var: str(threads) for var in THREAD_VARS}
+    env["XZ_DEFAULTS"] = "-T%d" % threads
+    if not force:
+        env = {var: value for var, value in env.items() if var not in os.environ}
+    return env
+
+
+def topology_key(cpu):
+    """Sorting key of a CPU: (package, core, cpu)"""
+    topology_dir = "/sys/devices/system/cpu/cpu%d/topology" % cpu
+    key = []
+    for field in ["physical_package_id", "core_id"]:
+        try:
+            with open(os.path.join(topology_dir, field)) as f:
+                key.append(int(f.read()))
+        except (OSError, ValueError):
+            key.append(0)
+    return tuple(key) + (cpu,)
+
+
+class CpuAllocator:
+    """Hands out disjoint sets of the CPUs available to this process"""
+
+    def __init__(self):
+        self.all_cpus = os.sched_getaffinity(0)
+        self.order = sorted(self.all_cpus, key=topology_key)
+        self.free = set(self.all_cpus)
+
+    def ncpus(self):
+        return len(self.order)
+
+    def take(self, n):
+        """Take n free CPUs; return None if there aren't that many"""
+        if n > len(self.free):
+            return None
+        cpus = [cpu for cpu in self.order if cpu in self.free][:n]
+        self.free.difference_update(cpus)
+        return cpus
+
+    def give_back(self, cpus):
+        if cpus is not None:
+            self.free.update(cpus)
+
+
+def pinned_command(cmd, cpus):
+    """The command, prefixed so that it runs on the given CPUs (if available)"""
+    if cpus is None or TASKSET is None:
+        return cmd
+    return [TASKSET, "-c", ",".join(str(cpu) for cpu in cpus)] + cmd
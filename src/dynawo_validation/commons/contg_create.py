@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_create.py:
+#
+# Creates the contingency cases of a create_*_contg.py script in parallel (see their
+# option --jobs). The script parses the basecase once, selects the cases to create
+# (so that the random sample does not depend on the number of jobs), and then a pool
+# of worker processes is forked, which inherit the parsed XML trees as copy-on-write
+# memory and create one case at a time each. The changes that a script makes to the
+# parsed trees for a case are either undone right after writing it, or completely
+# replaced by those of the next case, so every case comes out exactly as in a serial
+# run, whichever worker creates it and whatever it created before. The output of each
+# case is captured, and printed in the original order, together with the values
+# returned for each case (e.g. the (P,Q) of the disconnected element), so the output
+# of the script and its summary files are also the same as in a serial run.
+#
+# In serve mode (option --serve of the scripts), the cases are not created up front,
+# but just in time, as the contingency scheduler asks for them (see its option
+# --materialize, and contg_materialize.py). The protocol is line-based: the script
+# first prints the case dir of every selected case, as lines SERVE_CASE=DIR,
+# followed by a line SERVE_READY; it then reads the case dirs to create from its
+# stdin, one per line, and answers each of them with a line CREATED=DIR (or
+# FAILED=DIR), right after the output of its creation. Any other lines are just
+# output. When its stdin is closed, the script finishes as usual, writing its
+# summary files for the cases actually created.
+#
+
+import contextlib
+import io
+import multiprocessing
+import sys
+import threading
+import traceback
+
+
+# The function that creates one case, set *before* forking the pool of workers, so
+# that they all inherit it (and the parsed basecase it works on)
+create_case = None
+
+
+def run_create_case(contg_name):
+    """Worker side: create one case, capturing all its output"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = create_case(contg_name)
+    return output.getvalue(), result
+
+
+def create_cases(create_one, contg_names, njobs=1, case_dirs=None):
+    """Create the given cases, calling create_one(contg_name) in njobs worker
+    processes; return a dict with the value it returned for each case, in the same
+    order. With case_dirs (the case dir of each case), serve them instead."""
+    global create_case
+    if case_dirs is not None:
+        return serve_cases(create_one, contg_names, case_dirs, njobs)
+    if njobs <= 1 or len(contg_names) <= 1:
+        return {x: create_one(x) for x in contg_names}
+    create_case = create_one
+    # Or else the workers would print again whatever is still in the buffer
+    sys.stdout.flush()
+    results = dict()
+    with multiprocessing.get_context("fork").Pool(min(njobs, len(contg_names))) as pool:
+        for contg_name, (output, result) in zip(
+            contg_names, pool.imap(run_create_case, contg_names)
+        ):
+            print(output, end="", flush=True)
+            results[contg_name] = result
+    return results
+
+
+def serve_cases(create_one, contg_names, case_dirs, njobs=1):
+    """Serve mode: create the cases as they are requested on stdin (see above)"""
+    global create_case
+    create_case = create_one
+    for case_dir in case_dirs:
+        print("SERVE_CASE=" + case_dir)
+    print("SERVE_READY", flush=True)
+    contg_name_of = dict(zip(case_dirs, contg_names))
+    results = dict()
+    lock = threading.Lock()  # the pool's callbacks are run by one of its threads
+
+    def reply(case_dir, output, ok):
+        with lock:
+            print(output, end="")
+            print(("CREATED=" if ok else "FAILED=") + case_dir, flush=True)
+
+    def created(case_dir, output_result):
+        output, result = output_result
+        results[contg_name_of[case_dir]] = result
+        reply(case_dir, output, True)
+
+    def failed(case_dir, e):
+        output = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+        reply(case_dir, output, False)
+
+    with multiprocessing.get_context("fork").Pool(max(1, njobs)) as pool:
+        for line in sys.stdin:
+            case_dir = line.rstrip("\n")
+            if case_dir not in contg_name_of:
+                reply(case_dir, "Unknown case: %s\n" % case_dir, False)
+                continue
+            pool.apply_async(
+                run_create_case,
+                (contg_name_of[case_dir],),
+                callback=lambda x, case_dir=case_dir: created(case_dir, x),
+                error_callback=lambda e, case_dir=case_dir: failed(case_dir, e),
+            )
+        pool.close()
+        pool.join()
+    # In the original order, as if created serially
+    return {x: results[x] for x in contg_names if x in results}
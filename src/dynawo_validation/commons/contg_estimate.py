@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_estimate.py:
+#
+# Estimates the cost of a campaign before launching it (see run_pipeline.sh, options
+# --estimate and --time-budget), from the contingency cases that the create_*_contg.py
+# scripts would generate for each type of device (their output in --dry-run mode,
+# i.e. lines DRY_RUN_CASE=NAME, plus DRY_RUN_ALL=N, the number of elements they
+# could have picked from). For each case:
+#
+#   * the simulation time is taken from the runtime history (see contg_runtimes.py),
+#     including its estimates for unseen elements. When there is no history at all,
+#     it is taken from the BASECASE itself: the time span of its Dynawo logs (and,
+#     for Hades or Astre, assuming that the other simulator takes about as long)
+#
+#   * the post-processing time (when done by the scheduler's worker pool) is the
+#     mean time spent in the "postproc" state in the job ledgers of previous runs in
+#     the same results dir (if any)
+#
+#   * the disk usage is the size of the BASECASE for its case dir (all cases are
+#     created before running them), plus the average size of the results of a case
+#     in previous runs in the same results dir (if any)
+#
+# The expected wall time of each type of device is then the total time of its cases
+# spread over the jobs, but never less than its longest case, and the types of
+# device are run one after the other.
+#
+# With a time budget (in hours), it also chooses how many contingency cases to
+# sample for each type of device (the --max-ncases option of the create scripts),
+# so that the whole campaign fits in (BUDGET_MARGIN of) the budget: the same
+# fraction of all the elements of each type is sampled, so that the sample stays
+# representative of the network. The rest of the budget is left for creating the
+# cases and aggregating the results. For this, the dry runs must list all the cases
+# (option -a of the create scripts).
+#
+# Usage example:
+#
+#    contg_estimate.py -j 100% -H RESULTS/runtime_history.csv -b 8 \
+#        -o /tmp/ncases.csv BASECASE RESULTS gen=/tmp/gen.txt load=/tmp/load.txt
+#
+# where /tmp/ncases.csv gets lines DEVICE;NCASES.
+#
+
+import argparse
+import csv
+import os
+import re
+import statistics
+import sys
+from datetime import datetime
+from dynawo_validation.commons.contg_ledger import (
+    LEDGER_FILE,
+    ledger_files,
+    read_ledger,
+)
+from dynawo_validation.commons.contg_runtimes import RuntimeHistory
+from dynawo_validation.commons.contg_scheduler import parse_njobs
+
+
+BUDGET_MARGIN = 0.9
+LOG_TIMESTAMP = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)")
+
+
+def read_dry_run(dry_run_file):
+    """(cases, number of elements) from the output of a create script's dry run"""
+    cases = []
+    nall = 0
+    with open(dry_run_file) as f:
+        for line in f:
+            if line.startswith("DRY_RUN_CASE="):
+                cases.append(line.rstrip("\n").split("=", 1)[1])
+            elif line.startswith("DRY_RUN_ALL="):
+                nall = int(line.split("=", 1)[1])
+    return cases, nall
+
+
+def dir_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            file = os.path.join(root, name)
+            if not os.path.islink(file):
+                size += os.path.getsize(file)
+    return size
+
+
+def log_span(log_file):
+    """Seconds between the first and the last timestamped lines of a Dynawo log"""
+    stamps = []
+    with open(log_file, errors="replace") as f:
+        for line in f:
+            match = LOG_TIMESTAMP.match(line)
+            if match:
+                stamps.append(match.group(1))
+    if len(stamps) < 2:
+        return None
+    t0, t1 = [
+        datetime.strptime(x, "%Y-%m-%d %H:%M:%S") for x in (stamps[0], stamps[-1])
+    ]
+    return (t1 - t0).total_seconds()
+
+
+def basecase_runtime(basecase):
+    """Simulation time of the BASECASE (both sides), from its Dynawo logs"""
+    spans = []
+    for root, _, files in os.walk(basecase):
+        if "dynawo.log" in files:
+            span = log_span(os.path.join(root, "dynawo.log"))
+            if span is not None:
+                spans.append(span)
+    if len(spans) == 0:
+        return None
+    # Hades and Astre don't leave such logs: assume they take about as long
+    return sum(spans) if len(spans) > 1 else 2 * spans[0]
+
+
+def postproc_time(results_dir):
+    """Mean time spent by the cases in the postproc state, in previous runs"""
+    rows = []
+    for file in ledger_files(os.path.join(results_dir, LEDGER_FILE)):
+        if os.path.isfile(file):
+            with open(file, newline="") as f:
+                rows += list(csv.DictReader(f, delimiter=";"))
+    t_postproc = dict()
+    durations = []
+    for row in sorted(rows, key=lambda x: float(x["TIME"])):
+        case = row["CONTG_CASE"]
+        if case in t_postproc:
+            durations.append(float(row["TIME"]) - t_postproc.pop(case))
+        if row["STATE"] == "postproc":
+            t_postproc[case] = float(row["TIME"])
+    return statistics.mean(durations) if durations else None
+
+
+def results_size(results_dir):
+    """Average size of the results of a case, in previous runs"""
+    last_rows = read_ledger(os.path.join(results_dir, LEDGER_FILE))
+    ndone = len([x for x in last_rows.values() if x["STATE"] == "done"])
+    if ndone == 0:
+        return None
+    return dir_size(results_dir) / ndone
+
+
+class Estimate:
+    """Expected cost of the cases of one type of device"""
+
+    def __init__(self, device, cases, nall, sim_times, postproc, results):
+        self.device = device
+        self.cases = cases
+        self.nall = nall
+        self.sim_times = sim_times  # None if unknown
+        self.postproc = postproc if postproc is not None else 0
+        self.results = results  # bytes per case, None if unknown
+
+    def case_time(self):
+        """Mean time (in a job slot) per case"""
+        if self.sim_times is None or len(self.sim_times) == 0:
+            return None
+        return statistics.mean(self.sim_times) + self.postproc
+
+    def wall_time(self, njobs, ncases=None):
+        if self.sim_times is None:
+            return None
+        if len(self.sim_times) == 0:
+            return 0
+        if ncases is None:
+            ncases = len(self.sim_times)
+        longest = max(self.sim_times) + self.postproc
+        return max(ncases * self.case_time() / njobs, longest)
+
+
+def estimate(device, dry_run_file, history, basecase, results_basedir):
+    cases, nall = read_dry_run(dry_run_file)
+    results_dir = os.path.join(results_basedir, device)
+    if history.median is not None:
+        sim_times = [history.estimate(case) for case in cases]
+    else:
+        runtime = basecase_runtime(basecase)
+        sim_times = [runtime] * len(cases) if runtime is not None else None
+    return Estimate(
+        device,
+        cases,
+        nall,
+        sim_times,
+        postproc_time(results_dir),
+        results_size(results_dir),
+    )
+
+
+def budget_ncases(estimates, njobs, budget):
+    """Cases to sample per type of device, for the campaign to fit in the budget"""
+    total = sum(e.case_time() * len(e.cases) for e in estimates if e.case_time())
+    if total == 0:
+        return {e.device: len(e.cases) for e in estimates}
+    fraction = min(1, budget * BUDGET_MARGIN * njobs / total)
+    return {e.device: max(1, int(fraction * len(e.cases))) for e in estimates}
+
+
+def format_hours(seconds):
+    if seconds is None:
+        return "?"
+    return "%.2f" % (seconds / 3600)
+
+
+def format_gb(size):
+    if size is None:
+        return "?"
+    return "%.2f" % (size / 1024**3)
+
+
+def print_report(estimates, ncases, njobs, case_size):
+    print(
+        "%-10s %8s %8s %10s %10s %10s %10s"
+        % ("DEVICE", "CASES", "OF", "SLOT_H", "WALL_H", "CASES_GB", "RESULTS_GB")
+    )
+    total_wall = 0
+    total_disk = 0
+    for e in estimates:
+        n = ncases[e.device]
+        wall = e.wall_time(njobs, n)
+        case_time = e.case_time()
+        results = e.results * n if e.results is not None else None
+        print(
+            "%-10s %8d %8d %10s %10s %10s %10s"
+            % (
+                e.device,
+                n,
+                e.nall,
+                format_hours(case_time * n if case_time is not None else None),
+                format_hours(wall),
+                format_gb(case_size * n),
+                format_gb(results),
+            )
+        )
+        if None in (total_wall, wall):
+            total_wall = None
+        else:
+            total_wall += wall
+        if None in (total_disk, results):
+            total_disk = None
+        else:
+            total_disk += results
+    print()
+    print(
+        "Expected wall time: %s h, with %d jobs (plus creating the cases and "
+        "aggregating the results)" % (format_hours(total_wall), njobs)
+    )
+    print(
+        "Expected disk usage: %s GB for the case dirs (largest type of device), "
+        "%s GB for the results"
+        % (
+            format_gb(max([case_size * n for n in ncases.values()], default=0)),
+            format_gb(total_disk),
+        )
+    )
+    if any(e.sim_times is None for e in estimates):
+        print(
+            "(no runtime history, and no Dynawo logs in the BASECASE: the times "
+            "could not be estimated)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Estimate the wall time and disk usage of a campaign, from the "
+        "dry runs of the create_*_contg.py scripts"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default="100%",
+        help="number of jobs run concurrently, or a percentage of the CPU cores "
+        "(default: 100%%)",
+    )
+    parser.add_argument(
+        "-n",
+        "--threads",
+        type=int,
+        default=1,
+        help="threads per job (default: 1)",
+    )
+    parser.add_argument(
+        "-H",
+        "--history",
+        required=True,
+        help="runtime history file (see contg_runtimes.py)",
+    )
+    parser.add_argument(
+        "-b",
+        "--budget",
+        type=float,
+        default=None,
+        help="time budget, in hours: choose the number of cases of each type of "
+        "device to fit in it",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="with --budget, write the number of cases of each type of device to "
+        "this file, as lines DEVICE;NCASES",
+    )
+    parser.add_argument("basecase", help="the BASECASE dir")
+    parser.add_argument(
+        "results_basedir", help="results dir (for the data of previous runs)"
+    )
+    parser.add_argument(
+        "dry_runs",
+        nargs="+",
+        help="output of the dry run of the create script of each type of device, "
+        "as DEVICE=FILE",
+    )
+    args = parser.parse_args()
+    njobs = parse_njobs(args.jobs, args.threads)
+    history = RuntimeHistory(args.history)
+    estimates = []
+    for spec in args.dry_runs:
+        device, dry_run_file = spec.split("=", 1)
+        estimates.append(
+            estimate(device, dry_run_file, history, args.basecase, args.results_basedir)
+        )
+    case_size = dir_size(args.basecase)
+
+    if args.budget is None:
+        ncases = {e.device: len(e.cases) for e in estimates}
+        print_report(estimates, ncases, njobs, case_size)
+        return 0
+
+    if any(e.sim_times is None for e in estimates):
+        print(
+            "ERROR: cannot fit the campaign in a time budget without a runtime "
+            "history (run a small sample first) or Dynawo logs in the BASECASE"
+        )
+        return 1
+    ncases = budget_ncases(estimates, njobs, args.budget * 3600)
+    print("*** Time budget: %.2f h, with %d jobs" % (args.budget, njobs))
+    print_report(estimates, ncases, njobs, case_size)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            for device, n in ncases.items():
+                f.write("%s;%d\n" % (device, n))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
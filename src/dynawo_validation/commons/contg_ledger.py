@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_ledger.py:
+#
+# The job ledger kept by the contingency scheduler (see contg_scheduler.py) under
+# the results dir of each type of device.
+#
+# The job ledger is a CSV file that is only ever appended to (one row per state
+# change), so that it is cheap to write and it can be read at any time while the
+# campaign is running. The current state of each case is given by its last row.
+# Its columns are:
+#
+#    TIME; CONTG_CASE; STATE; ATTEMPT; EXIT_CODE; WALL_TIME
+#
+# where STATE is one of: queued, create (i.e., its case dir being created just in
+# time, see contg_materialize.py), running, postproc (i.e., being post-processed by
+# the worker pool), compress (i.e., waiting for its results to be compressed, see
+# contg_compress.py), done, failed, timeout, oom (killed for memory; see
+# contg_memory.py).
+#
+# When the cases are run through a shared work queue (see contg_queue.py), each
+# worker keeps its own ledger next to the main one, named jobs_ledger.WORKER_ID.csv,
+# since appending to the same file from several hosts is not safe on NFS. Readers
+# then merge all of them (see ledger_files).
+#
+
+import csv
+import glob
+import os
+import time
+
+
+LEDGER_FILE = "jobs_ledger.csv"
+LEDGER_COLUMNS = ["TIME", "CONTG_CASE", "STATE", "ATTEMPT", "EXIT_CODE", "WALL_TIME"]
+
+
+class JobLedger:
+    """Append-only record of the state changes of all contingency jobs"""
+
+    def __init__(self, ledger_file):
+        self.ledger_file = ledger_file
+        if not os.path.isfile(ledger_file):
+            with open(ledger_file, "w", newline="") as f:
+                csv.writer(f, delimiter=";").writerow(LEDGER_COLUMNS)
+
+    def record(self, contg_case, state, attempt=0, exit_code="", wall_time=""):
+        if wall_time != "":
+            wall_time = "%.2f" % wall_time
+        row = [
+            "%.3f" % time.time(),
+            contg_case,
+            state,
+            attempt,
+            exit_code,
+            wall_time,
+        ]
+        # Each row goes in a single small append, so it is safe to read the file
+        # (or append to it from other processes) while the campaign is running
+        with open(self.ledger_file, "a", newline="") as f:
+            csv.writer(f, delimiter=";").writerow(row)
+
+
+def worker_ledger_file(ledger_file, worker_id):
+    stem, ext = os.path.splitext(ledger_file)
+    return "%s.%s%s" % (stem, worker_id, ext)
+
+
+def ledger_files(ledger_file):
+    """The main ledger, plus the ledgers of the queue workers (if any)"""
+    stem, ext = os.path.splitext(ledger_file)
+    return [ledger_file] + sorted(glob.glob(glob.escape(stem) + ".*" + ext))
+
+
+def read_ledger(ledger_file):
+    """Return a dict with the last recorded row (as a dict) of each contingency case"""
+    rows = []
+    for file in ledger_files(ledger_file):
+        if not os.path.isfile(file):
+            continue
+        with open(file, newline="") as f:
+            rows += list(csv.DictReader(f, delimiter=";"))
+    last_rows = dict()
+    for row in sorted(rows, key=lambda x: float(x["TIME"])):
+        last_rows[row["CONTG_CASE"]] = row
+    return last_rows
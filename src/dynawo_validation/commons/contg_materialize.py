@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_materialize.py:
+#
+# Just-in-time creation of the contingency cases, for the contingency scheduler (see
+# its option --materialize). Instead of creating all the case dirs up front (each
+# one a full copy of the BASECASE, with its rewritten Hades or Astre file), the
+# create_*_contg.py script of the type of device is kept running in serve mode (see
+# contg_create.py): it parses the BASECASE and selects the cases once, and then
+# creates each case only when the scheduler is about to run it. Since the scheduler
+# deletes each case dir as soon as its results are compressed, the disk used by the
+# case dirs is then bounded by the concurrency, rather than by the number of cases.
+#
+# The Materializer is the scheduler's side of the protocol: it starts the script,
+# reads the list of cases it will serve, and then sends it requests and collects its
+# answers without ever blocking, so that the scheduler can keep running the other
+# cases in the meantime. All other output of the script is passed through.
+#
+
+import os
+import subprocess
+import sys
+
+
+class Materializer:
+    """Creates the contingency cases on demand, through a create script in serve
+    mode"""
+
+    def __init__(self, command):
+        self.command = command
+        self.cases = []
+        self.pending = set()  # cases requested and not answered yet
+        self.answers = []  # (case dir, whether it was created)
+        self.buffer = b""
+        self.proc = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        # Read the list of cases (this is when the BASECASE gets parsed)
+        for line in self.proc.stdout:
+            line = line.decode(errors="replace")
+            if line.startswith("SERVE_CASE="):
+                self.cases.append(line.rstrip("\n").split("=", 1)[1])
+            elif line.rstrip("\n") == "SERVE_READY":
+                break
+            else:
+                sys.stdout.write(line)
+        else:
+            self.proc.wait()
+            raise RuntimeError(
+                "the create script exited before serving any cases (exit code: %s)"
+                % self.proc.returncode
+            )
+        sys.stdout.flush()
+        os.set_blocking(self.proc.stdout.fileno(), False)
+
+    def request(self, case_dir):
+        """Ask for a case to be created (see poll() for the answer)"""
+        self.pending.add(case_dir)
+        try:
+            self.proc.stdin.write((case_dir + "\n").encode())
+            self.proc.stdin.flush()
+        except BrokenPipeError:
+            self.fail_pending()
+
+    def poll(self):
+        """The cases created (or failed) since the last call, as (case_dir, ok)"""
+        if self.pending:
+            self.read_answers()
+        answers = self.answers
+        self.answers = []
+        return answers
+
+    def read_answers(self):
+        gone = False
+        while True:
+            try:
+                data = os.read(self.proc.stdout.fileno(), 65536)
+            except BlockingIOError:
+                break
+            if len(data) == 0:
+                gone = True
+                break
+            self.buffer += data
+        *lines, self.buffer = self.buffer.split(b"\n")
+        for line in lines:
+            line = line.decode(errors="replace")
+            key, _, case_dir = line.partition("=")
+            if key in ("CREATED", "FAILED") and case_dir in self.pending:
+                self.pending.remove(case_dir)
+                self.answers.append((case_dir, key == "CREATED"))
+            else:
+                sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+        # The script is gone: whatever it didn't answer will never be created
+        if gone:
+            self.fail_pending()
+
+    def fail_pending(self):
+        self.answers += [(case_dir, False) for case_dir in sorted(self.pending)]
+        self.pending.clear()
+
+    def close(self):
+        """No more requests: let the script finish (it writes its summary files for
+        the cases it created), and return its exit code"""
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        os.set_blocking(self.proc.stdout.fileno(), True)
+        rest = self.buffer + self.proc.stdout.read()
+        sys.stdout.write(rest.decode(errors="replace"))
+        sys.stdout.flush()
+        return self.proc.wait()
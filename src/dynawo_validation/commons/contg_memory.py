@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_memory.py:
+#
+# Memory-aware admission control for the contingency scheduler (see
+# contg_scheduler.py). On large networks, running one simulation per core (plus the
+# post-processing of the finished cases) can easily exhaust the RAM of the machine,
+# and then the OOM killer starts killing simulations halfway through the run. To
+# avoid this:
+#
+#   * the peak RSS of the simulations of each case (obtained for free when reaping
+#     its process, from its rusage) and of its post-processing (the high-water mark
+#     of the worker process that did it) are kept in a history file, across runs
+#
+#   * a new case is started only when the projected memory, i.e. the sum of the
+#     expected peaks of everything that is running plus that of the new case, fits
+#     in the memory budget. When nothing else is running, a case is always started.
+#
+#   * cases killed by the OOM killer are recorded as such in the job ledger, and
+#     retried (up to MAX_OOM_RETRIES times) with a lower concurrency limit for the
+#     rest of the run, and a higher expected peak
+#
+# The expected peaks of unseen cases are estimated just like their runtimes (see
+# contg_runtimes.py), i.e., from the most similar elements of the same type. The
+# history file is a CSV that is only ever appended to, with columns:
+#
+#    TIME; DEVICE_TYPE; ELEMENT; STAGE; MAX_RSS
+#
+# where STAGE is either "sim" or "postproc", and MAX_RSS is in MB. For the
+# simulations, MAX_RSS is the peak of the largest process of the case (i.e., of one
+# simulator), so it counts twice when the A and B sides run concurrently.
+#
+
+import csv
+import os
+import time
+from dynawo_validation.commons.contg_runtimes import RuntimeHistory, split_case_name
+
+
+MEMORY_FILE = "memory_history.csv"
+MEMORY_COLUMNS = ["TIME", "DEVICE_TYPE", "ELEMENT", "STAGE", "MAX_RSS"]
+MAX_OOM_RETRIES = 2
+OOM_MARGIN = 1.5  # a case killed for memory needed at least this much more
+
+
+def meminfo(field):
+    """A field of /proc/meminfo, in MB"""
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise ValueError("Field %s not found in /proc/meminfo" % field)
+
+
+def parse_budget(budget):
+    """Accept either a number of MB, or a percentage of the total RAM"""
+    if budget.endswith("%"):
+        return meminfo("MemTotal") * float(budget[:-1]) / 100
+    return float(budget)
+
+
+def oom_kill_count():
+    """Number of processes killed by the OOM killer since boot"""
+    try:
+        with open("/proc/vmstat") as f:
+            for line in f:
+                if line.startswith("oom_kill "):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def reset_peak_rss():
+    """Reset the high-water mark of the RSS of this process (Linux >= 4.0)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """The high-water mark of the RSS of this process, in MB"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+class MemoryHistory(RuntimeHistory):
+    """Known peak RSS of the cases in one stage, and estimates for the unseen ones"""
+
+    def __init__(self, history_file, stage, readonly=False):
+        self.history_file = history_file
+        self.stage = stage
+        self.readonly = readonly
+        self.runtimes = dict()  # (device_type, element) --> max_rss
+        self.nrecorded = 0
+        if os.path.isfile(history_file):
+            with open(history_file, newline="") as f:
+                for row in csv.DictReader(f, delimiter=";"):
+                    if row["STAGE"] == stage:
+                        key = (row["DEVICE_TYPE"], row["ELEMENT"])
+                        self.runtimes[key] = float(row["MAX_RSS"])
+        self.build_index()
+
+    def record(self, case_name, max_rss):
+        device_type, element = split_case_name(case_name)
+        self.runtimes[(device_type, element)] = max_rss
+        # The estimates for unseen cases are refined as the run goes (but the index
+        # is not rebuilt on every record, since that's O(N log N))
+        self.nrecorded += 1
+        if self.nrecorded >= max(10, len(self.runtimes) // 10):
+            self.build_index()
+            self.nrecorded = 0
+        if self.readonly:
+            return
+        row = ["%.3f" % time.time(), device_type, element, self.stage, "%.1f" % max_rss]
+        new_file = not os.path.isfile(self.history_file)
+        with open(self.history_file, "a", newline="") as f:
+            writer = csv.writer(f, delimiter=";")
+            if new_file:
+                writer.writerow(MEMORY_COLUMNS)
+            writer.writerow(row)
+
+
+class MemoryAdmission:
+    def __init__(self, budget, history_file, readonly=False):
+        self.budget = budget  # MB
+        self.sim = MemoryHistory(history_file, "sim", readonly)
+        self.postproc = MemoryHistory(history_file, "postproc", readonly)
+
+    def sim_estimate(self, job, slots=None):
+        estimate = self.sim.estimate(job.name) or 0
+        return estimate * (slots if slots is not None else job.slots)
+
+    def postproc_estimate(self, job):
+        return self.postproc.estimate(job.name) or 0
+
+    def admits(self, job, slots, running, postprocessing, reserved=0):
+        projected = reserved + self.sim_estimate(job, slots)
+        projected += sum(self.sim_estimate(x) for x in running)
+        projected += sum(self.postproc_estimate(x) for x in postprocessing)
+        return projected <= self.budget
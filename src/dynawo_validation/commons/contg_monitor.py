@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_monitor.py:
+#
+# Live progress report of a running validation campaign. Given a results basedir
+# (e.g. RESULTS, containing the results dirs gen, load, shunt, branchB...) or the
+# results dir of a single type of device, it reports, for each type of device:
+#
+#   * the number of contingency cases done, failed, timed out, running, being
+#     post-processed, having their results compressed, and queued
+#
+#   * the throughput (cases finished per minute, over the last THROUGHPUT_WINDOW
+#     seconds of the run)
+#
+#   * the average time spent in each stage of the scheduler: waiting in the queue
+#     (or for the case to be created, when created just in time), simulating (run_one_contg.sh), waiting for the compression of the results,
+#     and post-processing (once compressed)
+#
+#   * the estimated time to finish the cases that are still pending
+#
+# Everything is obtained from the job ledgers that the contingency scheduler keeps
+# in each results dir (see contg_ledger.py), including those of the queue workers,
+# if any. Since they are only ever appended to, the monitor keeps its read position
+# in each ledger and only parses the rows added since the previous poll, so it can
+# be left polling every few seconds, for the whole campaign, without any noticeable
+# load on the machine running it. Types of device whose ledger does not exist yet
+# (i.e., not started) are not shown.
+#
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter, deque
+from dynawo_validation.commons.contg_ledger import (
+    LEDGER_FILE,
+    LEDGER_COLUMNS,
+    ledger_files,
+)
+
+
+THROUGHPUT_WINDOW = 600  # seconds
+PENDING_STATES = ["queued", "create", "running", "postproc", "compress"]
+FINISHED_STATES = ["done", "failed", "timeout"]
+STAGES = {
+    "queued": "wait",
+    "create": "wait",
+    "running": "sim",
+    "postproc": "postproc",
+    "compress": "compress",
+}
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "-"
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return "%dh%02dm" % (seconds // 3600, seconds % 3600 // 60)
+    if seconds >= 60:
+        return "%dm%02ds" % (seconds // 60, seconds % 60)
+    return "%ds" % seconds
+
+
+class LedgerTail:
+    """Incremental reader of a job ledger, keeping the progress of its cases"""
+
+    def __init__(self, ledger_file):
+        self.ledger_file = ledger_file
+        self.offsets = dict()  # ledger file --> read position
+        self.cases = dict()  # case --> (state, time of the state change)
+        self.stage_time = Counter()
+        self.stage_count = Counter()
+        self.finish_times = deque()
+        self.run_start = None
+        self.new_run = True
+
+    def update(self):
+        """Parse the rows appended since the last call"""
+        for ledger_file in ledger_files(self.ledger_file):
+            self.update_file(ledger_file)
+
+    def update_file(self, ledger_file):
+        offset = self.offsets.get(ledger_file, 0)
+        try:
+            with open(ledger_file, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except OSError:
+            return
+        # Only consume whole lines (the last one may still be being written)
+        end = data.rfind(b"\n") + 1
+        self.offsets[ledger_file] = offset + end
+        for line in data[:end].decode(errors="replace").splitlines():
+            row = line.split(";")
+            if len(row) != len(LEDGER_COLUMNS) or row[0] == LEDGER_COLUMNS[0]:
+                continue
+            self.process(float(row[0]), row[1], row[2], row[3])
+
+    def process(self, t, case, state, attempt):
+        # Each new run of the scheduler starts by queueing all its cases (attempt 0)
+        if state == "queued" and attempt == "0":
+            if self.new_run:
+                self.run_start = t
+                self.finish_times.clear()
+                self.new_run = False
+        else:
+            self.new_run = True
+        prev_state, t_prev = self.cases.get(case, (None, None))
+        if prev_state in STAGES:
+            self.stage_time[STAGES[prev_state]] += t - t_prev
+            self.stage_count[STAGES[prev_state]] += 1
+        if state in FINISHED_STATES:
+            self.finish_times.append(t)
+        self.cases[case] = (state, t)
+
+    def report(self, now):
+        counts = Counter(state for state, _ in self.cases.values())
+        while self.finish_times and self.finish_times[0] < now - THROUGHPUT_WINDOW:
+            self.finish_times.popleft()
+        pending = sum(counts[state] for state in PENDING_STATES)
+        throughput = None  # cases per second
+        if self.run_start is not None and self.finish_times:
+            elapsed = min(THROUGHPUT_WINDOW, now - self.run_start)
+            if elapsed > 0:
+                throughput = len(self.finish_times) / elapsed
+        eta = None
+        if pending == 0:
+            eta = 0
+        elif throughput:
+            eta = pending / throughput
+        stage_avg = {
+            stage: self.stage_time[stage] / self.stage_count[stage]
+            if self.stage_count[stage] > 0
+            else None
+            for stage in STAGES.values()
+        }
+        return counts, throughput, stage_avg, eta
+
+
+def find_ledgers(results_dir):
+    """The ledger of each type of device, sorted as they are created (i.e., run)"""
+    ledger = os.path.join(results_dir, LEDGER_FILE)
+    if os.path.isfile(ledger):
+        return {os.path.basename(os.path.abspath(results_dir)): ledger}
+    ledgers = []
+    for entry in os.scandir(results_dir):
+        ledger = os.path.join(entry.path, LEDGER_FILE)
+        if entry.is_dir() and os.path.isfile(ledger):
+            ledgers.append((os.path.getctime(ledger), entry.name, ledger))
+    return {name: ledger for _, name, ledger in sorted(ledgers)}
+
+
+def print_report(tails, now):
+    header = "%-10s %6s %6s %7s %7s %8s %8s %6s %9s %8s %8s %8s %8s %9s" % (
+        "DEVICE",
+        "DONE",
+        "FAILED",
+        "TIMEOUT",
+        "RUNNING",
+        "POSTPROC",
+        "COMPRESS",
+        "QUEUED",
+        "CASES/MIN",
+        "WAIT",
+        "SIM",
+        "POSTPROC",
+        "COMPRESS",
+        "ETA",
+    )
+    print(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)))
+    print(header)
+    total_eta = 0
+    for device, tail in tails.items():
+        counts, throughput, stage_avg, eta = tail.report(now)
+        print(
+            "%-10s %6d %6d %7d %7d %8d %8d %6d %9s %8s %8s %8s %8s %9s"
+            % (
+                device,
+                counts["done"],
+                counts["failed"],
+                counts["timeout"],
+                counts["running"],
+                counts["postproc"],
+                counts["compress"],
+                counts["queued"] + counts["create"],
+                "-" if throughput is None else "%.1f" % (throughput * 60),
+                format_duration(stage_avg["wait"]),
+                format_duration(stage_avg["sim"]),
+                format_duration(stage_avg["postproc"]),
+                format_duration(stage_avg["compress"]),
+                format_duration(eta),
+            )
+        )
+        total_eta = None if eta is None or total_eta is None else total_eta + eta
+    if len(tails) > 1:
+        print("%-10s %s" % ("TOTAL ETA", format_duration(total_eta)))
+    print(flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report the progress and ETA of a running validation campaign"
+    )
+    parser.add_argument(
+        "results_dir",
+        help="results basedir of the campaign (e.g. RESULTS), or the results dir of "
+        "one type of device (e.g. RESULTS/gen)",
+    )
+    parser.add_argument(
+        "-i",
+        "--interval",
+        type=float,
+        default=5,
+        help="seconds between reports (default: 5)",
+    )
+    parser.add_argument(
+        "-1",
+        "--once",
+        action="store_true",
+        help="print a single report and exit",
+    )
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.results_dir):
+        print("Results dir %s not found" % args.results_dir)
+        return 1
+    tails = dict()
+    try:
+        while True:
+            # New types of device show up as the pipeline goes through them
+            for device, ledger in find_ledgers(args.results_dir).items():
+                if device not in tails:
+                    tails[device] = LedgerTail(ledger)
+            for tail in tails.values():
+                tail.update()
+            print_report(tails, time.time())
+            if args.once:
+                return 0
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_nway.py:
+#
+# Helpers for comparing N launchers (simulators, or builds of one) in a single
+# campaign (see run_pipeline.sh, option --launchers). The contingency cases are
+# created once, and each launcher simulates every case once, into its own results
+# store (RESULTS/launchers/LABEL/DEVICE, as side A, and without post-processing).
+# Then, for every pair of launchers, a pair results dir (RESULTS/LABEL_A_vs_LABEL_B)
+# is populated with symlinks to the stored results of both, the cases are
+# post-processed there (without simulating them again), and the usual metrics are
+# calculated. Finally, the metrics of all pairs are summarized and ranked.
+#
+# Subcommands:
+#
+#   * launchers SPEC...: prints the label and launcher of each SPEC (either
+#     LAUNCHER, labelled by its basename, or LABEL=LAUNCHER), as LABEL;LAUNCHER
+#
+#   * pairs RESULTS_BASEDIR CASE_TYPE SPEC...: the pairs to compare, written to
+#     RESULTS_BASEDIR/nway_pairs.csv and also printed, as
+#     PAIR;LABEL_A;LAUNCHER_A;LABEL_B;LAUNCHER_B. In Dynawo vs. Dynawo cases all the
+#     pairs are compared, but in Hades (Astre) vs. Dynawo cases only the pairs of
+#     one Hades (Astre) and one Dynawo launcher are, since there's only one side of
+#     each kind in the case.
+#
+#   * link CASE_TYPE STORE_A STORE_B PAIR_RESULTS_DIR: links the stored raw results
+#     of the two launchers of a pair into the pair results dir of a device. In
+#     Dynawo vs. Dynawo cases both launchers were run as side A (i.e. on the inputs
+#     of side A), so the results of the second one are linked as those of side B.
+#
+#   * summary RESULTS_BASEDIR: summarizes the metrics of every pair and device into
+#     RESULTS_BASEDIR/nway_metrics.csv, with columns:
+#
+#        PAIR; LABEL_A; LABEL_B; DEVICE; NCASES; METRIC; VALUE
+#
+#     where VALUE is the median over all cases of the absolute difference: for
+#     DynaFlow, the max diff of each PF variable (see calc_global_pf_diffmetrics.py),
+#     and for DynaWaltz, each reduced parameter of the curves (see
+#     calc_curve_diffmetrics.py). The pairs are then ranked on each device and
+#     metric (1: closest), and ranked overall by their mean rank, in
+#     RESULTS_BASEDIR/nway_ranking.csv. Each launcher gets the mean rank of the pairs
+#     it takes part in, in RESULTS_BASEDIR/nway_launchers.csv.
+#
+
+import os
+import re
+import sys
+import pandas as pd
+
+PAIRS_FILE = "nway_pairs.csv"
+METRICS_FILE = "nway_metrics.csv"
+RANKING_FILE = "nway_ranking.csv"
+LAUNCHERS_FILE = "nway_launchers.csv"
+RESULT_SUBDIRS = ["crv", "xml", "log"]
+# The simulator that is not Dynawo, for each case type (see dwo_jobinfo.py)
+OTHER_SIMULATOR = {"dwohds": "hades", "astdwo": "astre"}
+CURVE_PARAMS = ["dSS", "dPP", "TT", "period", "damp"]
+
+
+def parse_launchers(specs):
+    """List of (label, launcher), from specs LAUNCHER or LABEL=LAUNCHER"""
+    launchers = []
+    for spec in specs:
+        if "=" in spec:
+            label, launcher = spec.split("=", 1)
+        else:
+            label, launcher = os.path.basename(spec), spec
+        label = re.sub(r"[^A-Za-z0-9._-]", "_", label)
+        if label == "" or launcher == "":
+            raise ValueError("Bad launcher spec: %s" % spec)
+        if label in [x[0] for x in launchers]:
+            raise ValueError(
+                "Duplicate launcher label: %s (use LABEL=LAUNCHER)" % label
+            )
+        launchers.append((label, launcher))
+    return launchers
+
+
+def launcher_pairs(case_type, launchers):
+    """The pairs of launchers that can be compared on this case type"""
+    pairs = []
+    for i, (label_a, launcher_a) in enumerate(launchers):
+        for label_b, launcher_b in launchers[i + 1 :]:
+            if case_type in OTHER_SIMULATOR:
+                other = OTHER_SIMULATOR[case_type]
+                is_other_a = os.path.basename(launcher_a)[:5] == other
+                is_other_b = os.path.basename(launcher_b)[:5] == other
+                if is_other_a == is_other_b:
+                    continue
+            pairs.append(
+                (label_a + "_vs_" + label_b, label_a, launcher_a, label_b, launcher_b)
+            )
+    return pairs
+
+
+def write_pairs(results_basedir, case_type, specs):
+    pairs = launcher_pairs(case_type, parse_launchers(specs))
+    if len(pairs) == 0 and case_type in OTHER_SIMULATOR:
+        raise ValueError(
+            "No pairs of launchers to compare on %s cases (only pairs of one %s and "
+            "one Dynawo launcher can be compared on them)"
+            % (case_type, OTHER_SIMULATOR[case_type])
+        )
+    if len(pairs) == 0:
+        raise ValueError("No pairs of launchers to compare on %s cases" % case_type)
+    df = pd.DataFrame(
+        pairs, columns=["PAIR", "LABEL_A", "LAUNCHER_A", "LABEL_B", "LAUNCHER_B"]
+    )
+    df.to_csv(os.path.join(results_basedir, PAIRS_FILE), sep=";", index=False)
+    return pairs
+
+
+def side_b_name(file_name):
+    """Name of a side A Dynawo result (e.g. gen#X-DynawoCurvesA.csv.xz) as side B"""
+    k = file_name.rfind("-Dynawo")
+    if k == -1:
+        return file_name
+    return file_name[:k] + file_name[k:].replace("A.", "B.", 1)
+
+
+def link_results(case_type, store_a, store_b, pair_dir):
+    for subdir in RESULT_SUBDIRS:
+        dest_dir = os.path.join(pair_dir, subdir)
+        os.makedirs(dest_dir, exist_ok=True)
+        # (links from a previous run may point to other launchers)
+        for name in os.listdir(dest_dir):
+            if os.path.islink(os.path.join(dest_dir, name)):
+                os.remove(os.path.join(dest_dir, name))
+        for store, as_side_b in [(store_a, False), (store_b, case_type == "dwodwo")]:
+            src_dir = os.path.join(store, subdir)
+            if not os.path.isdir(src_dir):
+                continue
+            for name in os.listdir(src_dir):
+                if not name.endswith(".xz"):
+                    continue
+                dest = os.path.join(dest_dir, side_b_name(name) if as_side_b else name)
+                src = os.path.relpath(os.path.join(src_dir, name), dest_dir)
+                os.symlink(src, dest)
+
+
+def pair_metrics(results_dir):
+    """(ncases, {metric: value}) of a device's pair results dir; None if none"""
+    pf_metrics = os.path.join(results_dir, "pf_metrics", "metrics.csv.xz")
+    crv_metrics = os.path.join(results_dir, "metrics", "crv_reducedparams.csv")
+    metrics = {}
+    if os.path.isfile(pf_metrics):
+        df = pd.read_csv(pf_metrics, index_col=0, compression="xz")
+        df = df.loc[df.volt_level == "ALL"]
+        for col in [c for c in df.columns if c.endswith("_max")]:
+            metrics[col] = df[col].abs().median()
+        return df.contg_case.nunique(), metrics
+    if os.path.isfile(crv_metrics):
+        df = pd.read_csv(crv_metrics, sep=";")
+        for param in CURVE_PARAMS:
+            diff = pd.to_numeric(df[param + "_ast"], errors="coerce") - pd.to_numeric(
+                df[param + "_dwo"], errors="coerce"
+            )
+            metrics[param] = diff.abs().median()
+        return df.dev.nunique(), metrics
+    return None
+
+
+def summarize(results_basedir):
+    pairs = pd.read_csv(os.path.join(results_basedir, PAIRS_FILE), sep=";")
+    rows = []
+    for pair in pairs.itertuples():
+        pair_dir = os.path.join(results_basedir, pair.PAIR)
+        if not os.path.isdir(pair_dir):
+            continue
+        for device in sorted(os.listdir(pair_dir)):
+            results = pair_metrics(os.path.join(pair_dir, device))
+            if results is None:
+                continue
+            ncases, metrics = results
+            for metric, value in metrics.items():
+                rows.append(
+                    [
+                        pair.PAIR,
+                        pair.LABEL_A,
+                        pair.LABEL_B,
+                        device,
+                        ncases,
+                        metric,
+                        value,
+                    ]
+                )
+    columns = ["PAIR", "LABEL_A", "LABEL_B", "DEVICE", "NCASES", "METRIC", "VALUE"]
+    df = pd.DataFrame(rows, columns=columns)
+    if df.empty:
+        raise ValueError("No metrics found for any pair under %s" % results_basedir)
+    df.to_csv(os.path.join(results_basedir, METRICS_FILE), sep=";", index=False)
+
+    df["RANK"] = df.groupby(["DEVICE", "METRIC"])["VALUE"].rank(method="min")
+    ranking = (
+        df.groupby(["PAIR", "LABEL_A", "LABEL_B"])["RANK"]
+        .mean()
+        .rename("MEAN_RANK")
+        .reset_index()
+        .sort_values("MEAN_RANK")
+    )
+    ranking["RANK"] = ranking["MEAN_RANK"].rank(method="min").astype(int)
+    ranking.to_csv(
+        os.path.join(results_basedir, RANKING_FILE),
+        sep=";",
+        index=False,
+        float_format="%.2f",
+    )
+
+    by_launcher = pd.concat(
+        [
+            ranking[["LABEL_A", "MEAN_RANK"]].rename(columns={"LABEL_A": "LAUNCHER"}),
+            ranking[["LABEL_B", "MEAN_RANK"]].rename(columns={"LABEL_B": "LAUNCHER"}),
+        ]
+    )
+    launchers = (
+        by_launcher.groupby("LAUNCHER")["MEAN_RANK"]
+        .agg(["count", "mean"])
+        .rename(columns={"count": "NPAIRS", "mean": "MEAN_RANK"})
+        .reset_index()
+        .sort_values("MEAN_RANK")
+    )
+    launchers.to_csv(
+        os.path.join(results_basedir, LAUNCHERS_FILE),
+        sep=";",
+        index=False,
+        float_format="%.2f",
+    )
+    return ranking, launchers
+
+
+def main():
+    try:
+        if len(sys.argv) >= 2 and sys.argv[1] == "launchers":
+            for label, launcher in parse_launchers(sys.argv[2:]):
+                print("%s;%s" % (label, launcher))
+            return 0
+        if len(sys.argv) >= 5 and sys.argv[1] == "pairs":
+            for pair in write_pairs(sys.argv[2], sys.argv[3], sys.argv[4:]):
+                print(";".join(pair))
+            return 0
+        if len(sys.argv) == 6 and sys.argv[1] == "link":
+            link_results(sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5])
+            return 0
+        if len(sys.argv) == 3 and sys.argv[1] == "summary":
+            ranking, launchers = summarize(sys.argv[2])
+            print("Ranking of the pairs (1: closest results):\n")
+            print(ranking.to_string(index=False, float_format="%.2f"))
+            print("\nMean rank of the pairs of each launcher:\n")
+            print(launchers.to_string(index=False, float_format="%.2f"))
+            return 0
+    except ValueError as e:
+        print("ERROR: %s" % e)
+        return 1
+    print("\nUsage: %s launchers SPEC..." % sys.argv[0])
+    print("       %s pairs RESULTS_BASEDIR CASE_TYPE SPEC..." % sys.argv[0])
+    print("       %s link CASE_TYPE STORE_A STORE_B PAIR_RESULTS_DIR" % sys.argv[0])
+    print("       %s summary RESULTS_BASEDIR\n" % sys.argv[0])
+    print("   (where each SPEC is either LAUNCHER or LABEL=LAUNCHER)\n")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
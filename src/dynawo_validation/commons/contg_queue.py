@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_queue.py:
+#
+# A work queue of contingency cases, kept as plain files in a directory on shared
+# storage (e.g. NFS), so that the cases of a campaign can be run by any number of
+# workers, on one or many hosts (see contg_scheduler.py, option --queue, and
+# dynawo_validation_worker). Its layout is:
+#
+#    QUEUE_DIR/config.json    how to run the cases (command, post-processing...)
+#    QUEUE_DIR/pending/       one file per case still to be run, NNNNNN-CASE_NAME,
+#                             containing the absolute path of the case dir
+#    QUEUE_DIR/claimed/       the cases being run, NNNNNN-CASE_NAME@WORKER_ID
+#    QUEUE_DIR/done/          the finished cases, by final state
+#    QUEUE_DIR/failed/
+#    QUEUE_DIR/timeout/
+#    QUEUE_DIR/workers/       one heartbeat file per worker
+#
+# Every state change is a single rename(), which is atomic (also on NFS), so that a
+# case can only ever be claimed by one worker: the others just get an error and go
+# on to the next one. The pending cases are claimed in the order of their sequence
+# number (NNNNNN), i.e. in the order in which they were published.
+#
+# The workers keep touching the files of the cases they claimed. A claim that has
+# not been touched for a while (stale_timeout) is taken to belong to a dead worker,
+# and any worker puts the case back into pending. All time comparisons are done
+# against modification times set by the file server itself, so that the clocks of
+# the hosts do not need to be in sync.
+#
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+from collections import namedtuple
+
+
+QUEUE_CONFIG = "config.json"
+QUEUE_STATES = ["pending", "claimed", "done", "failed", "timeout", "workers"]
+STALE_TIMEOUT = 300  # seconds
+Claim = namedtuple("Claim", ["entry", "path", "case_dir"])
+
+
+def default_worker_id():
+    return "%s-%d" % (socket.gethostname(), os.getpid())
+
+
+class FileQueue:
+    def __init__(self, queue_dir, worker_id=None, stale_timeout=STALE_TIMEOUT):
+        self.queue_dir = queue_dir
+        self.worker_id = worker_id if worker_id is not None else default_worker_id()
+        self.stale_timeout = stale_timeout
+
+    def subdir(self, state):
+        return os.path.join(self.queue_dir, state)
+
+    def publish(self, cases, config):
+        """Replace the contents of the queue with the given cases (in this order)"""
+        os.makedirs(self.queue_dir, exist_ok=True)
+        config_file = os.path.join(self.queue_dir, QUEUE_CONFIG)
+        if os.path.isfile(config_file):
+            os.remove(config_file)
+        for state in QUEUE_STATES:
+            shutil.rmtree(self.subdir(state), ignore_errors=True)
+        for state in QUEUE_STATES[1:]:
+            os.makedirs(self.subdir(state))
+        # The config goes first, and then all the pending cases at once (the dir is
+        # prepared under a temporary name), so that workers never see half of them
+        fd, tmp_file = tempfile.mkstemp(dir=self.queue_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(config, f, indent=2)
+        os.replace(tmp_file, config_file)
+        tmp_dir = tempfile.mkdtemp(dir=self.queue_dir, suffix=".tmp")
+        for i, case_dir in enumerate(cases):
+            entry = "%06d-%s" % (i, os.path.basename(case_dir))
+            with open(os.path.join(tmp_dir, entry), "w") as f:
+                f.write(os.path.abspath(case_dir))
+        os.rename(tmp_dir, self.subdir("pending"))
+
+    def read_config(self):
+        try:
+            with open(os.path.join(self.queue_dir, QUEUE_CONFIG)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def entries(self, state):
+        try:
+            return sorted(os.listdir(self.subdir(state)))
+        except FileNotFoundError:
+            return []
+
+    def claim(self):
+        """Claim the next pending case; return None if there are none left"""
+        for entry in self.entries("pending"):
+            path = os.path.join(self.subdir("claimed"), entry + "@" + self.worker_id)
+            try:
+                os.rename(os.path.join(self.subdir("pending"), entry), path)
+            except FileNotFoundError:
+                continue  # some other worker got it first
+            os.utime(path)
+            with open(path) as f:
+                return Claim(entry, path, f.read().strip())
+        return None
+
+    def heartbeat(self, claims):
+        """Keep our claims (and ourselves) alive"""
+        for claim in claims:
+            try:
+                os.utime(claim.path)
+            except FileNotFoundError:
+                pass  # we were taken for dead: the case is back in pending
+        self.server_now()
+
+    def server_now(self):
+        """The current time, according to the file server"""
+        os.makedirs(self.subdir("workers"), exist_ok=True)
+        worker_file = os.path.join(self.subdir("workers"), self.worker_id)
+        with open(worker_file, "a"):
+            pass
+        os.utime(worker_file)
+        return os.stat(worker_file).st_mtime
+
+    def complete(self, claim, state):
+        """Move a claimed case to its final state (done, failed or timeout)"""
+        try:
+            os.rename(claim.path, os.path.join(self.subdir(state), claim.entry))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def unclaim(self, claim):
+        """Put a claimed case back into pending (e.g., when the worker is stopped)"""
+        try:
+            os.rename(claim.path, os.path.join(self.subdir("pending"), claim.entry))
+        except FileNotFoundError:
+            pass
+
+    def recover_stale(self):
+        """Put back into pending the cases claimed by workers that seem to be dead"""
+        now = self.server_now()
+        recovered = []
+        for claimed in self.entries("claimed"):
+            path = os.path.join(self.subdir("claimed"), claimed)
+            try:
+                if now - os.stat(path).st_mtime < self.stale_timeout:
+                    continue
+                entry = claimed.rsplit("@", 1)[0]
+                os.rename(path, os.path.join(self.subdir("pending"), entry))
+            except FileNotFoundError:
+                continue
+            recovered.append(entry)
+        return recovered
+
+    def npending(self):
+        return len(self.entries("pending"))
+
+    def drained(self):
+        return len(self.entries("pending")) == 0 and len(self.entries("claimed")) == 0
+
+    def cases(self, state):
+        """The names of the cases in the given state"""
+        return [entry.split("-", 1)[1].rsplit("@", 1)[0] for entry in self.entries(state)]
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_resume.py:
+#
+# Support for resuming a validation run that was interrupted. Given the results dir
+# of one type of device (e.g. RESULTS/gen), it finds out which contingency cases
+# were already completed, so that they don't need to be created nor run again.
+#
+# A case is considered completed when:
+#
+#   * (DynaFlow) its pf_sol/CASE_pfsolutionAB.csv.xz file and its automata-groups
+#     file (the last output produced by run_one_contg.sh) are there, or
+#
+#   * (DynaWaltz) its crv/CASE-DynawoCurves.csv.xz & crv/CASE-AstreCurves.csv.xz
+#     files (or crv/CASE-DynawoCurvesA.csv.xz & crv/CASE-DynawoCurvesB.csv.xz),
+#     and its automata changes file (the last output) are there;
+#
+# and the xz files are complete (i.e., they were not cut short when the run was
+# killed), and the job ledger (see contg_ledger.py), if it has any record of the
+# case, says that it's done.
+#
+# When used as a script, it prints the names of the completed cases, one per line,
+# which is the format expected by the "--exclude" option of the create_*_contg.py
+# scripts.
+#
+
+import os
+import sys
+from dynawo_validation.commons.contg_ledger import LEDGER_FILE, read_ledger
+
+XZ_FOOTER_MAGIC = b"YZ"  # every complete xz stream ends with these two bytes
+
+
+def xz_is_complete(xz_file):
+    """Cheap integrity check: a truncated xz file lacks the stream footer"""
+    try:
+        with open(xz_file, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < len(XZ_FOOTER_MAGIC):
+                return False
+            f.seek(-len(XZ_FOOTER_MAGIC), os.SEEK_END)
+            return f.read() == XZ_FOOTER_MAGIC
+    except OSError:
+        return False
+
+
+def dynaflow_completed(results_dir, case_name):
+    pf_sol = os.path.join(results_dir, "pf_sol", case_name + "_pfsolutionAB.csv.xz")
+    aut_groups = [
+        os.path.join(results_dir, "aut", case_name + "-aut-groups.csv"),
+        os.path.join(results_dir, "aut", case_name + "-autB-groups.csv"),
+    ]
+    return xz_is_complete(pf_sol) and any(os.path.isfile(f) for f in aut_groups)
+
+
+def dynawaltz_completed(results_dir, case_name):
+    crv_dir = os.path.join(results_dir, "crv", case_name)
+    aut_dir = os.path.join(results_dir, "aut", case_name)
+    astdwo_files = [
+        crv_dir + "-DynawoCurves.csv.xz",
+        crv_dir + "-AstreCurves.csv.xz",
+        aut_dir + "-DynawoAutomata.csv.xz",
+    ]
+    dwodwo_files = [
+        crv_dir + "-DynawoCurvesA.csv.xz",
+        crv_dir + "-DynawoCurvesB.csv.xz",
+        aut_dir + "-DynawoAutomataB.csv.xz",
+    ]
+    return all(xz_is_complete(f) for f in astdwo_files) or all(
+        xz_is_complete(f) for f in dwodwo_files
+    )
+
+
+def completed_cases(results_dir, case_prefix):
+    """Return the (sorted) names of all completed cases under the results dir"""
+    if os.path.isdir(os.path.join(results_dir, "pf_sol")):
+        is_completed = dynaflow_completed
+        output_dir = os.path.join(results_dir, "pf_sol")
+    elif os.path.isdir(os.path.join(results_dir, "crv")):
+        is_completed = dynawaltz_completed
+        output_dir = os.path.join(results_dir, "crv")
+    else:
+        return []
+
+    # Candidate names are taken from the output files themselves
+    candidates = set()
+    for file in os.listdir(output_dir):
+        if not file.startswith(case_prefix):
+            continue
+        if file.endswith("_pfsolutionAB.csv.xz"):
+            candidates.add(file[: -len("_pfsolutionAB.csv.xz")])
+        elif "-DynawoCurves" in file:
+            candidates.add(file[: file.rindex("-DynawoCurves")])
+
+    ledger_rows = read_ledger(os.path.join(results_dir, LEDGER_FILE))
+    completed = []
+    for case_name in candidates:
+        if case_name in ledger_rows and ledger_rows[case_name]["STATE"] != "done":
+            continue
+        if is_completed(results_dir, case_name):
+            completed.append(case_name)
+
+    return sorted(completed)
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("\nUsage: %s RESULTS_DIR CASE_PREFIX\n" % sys.argv[0])
+        print(
+            "   Prints the names of the contingency cases CASE_PREFIX* that have "
+            "already been completed in RESULTS_DIR (e.g. RESULTS/gen).\n"
+        )
+        return 2
+    for case_name in completed_cases(sys.argv[1], sys.argv[2]):
+        print(case_name)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
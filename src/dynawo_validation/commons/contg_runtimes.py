@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_runtimes.py:
+#
+# Keeps the history of the simulation runtimes of all contingency cases, across
+# runs, so that the contingency scheduler (see contg_scheduler.py) can dispatch the
+# longest-expected cases first (LPT, "longest processing time" ordering). This avoids
+# ending a campaign with a long single-core tail, caused by a few slow cases (large
+# generator trips with many automata, cases that diverge, etc.) that happened to be
+# started last.
+#
+# The history file is a CSV that is only ever appended to, with columns:
+#
+#    TIME; DEVICE_TYPE; ELEMENT; CPU_TIME
+#
+# where DEVICE_TYPE and ELEMENT are obtained from the name of the contingency case
+# (e.g. "gen#FOO" or "gen_FOO" give "gen" and "FOO"), and CPU_TIME is the total CPU
+# time (user + sys) taken by the case's command, which (unlike its wall time) does
+# not depend on how many other jobs were running, nor on whether its A and B
+# simulations were run concurrently. When an element has several records, the
+# latest one is used.
+#
+# Unseen cases are estimated from the most similar elements of the same type, i.e.,
+# those sharing the longest common prefix with it (provided it is at least
+# MIN_SIMILAR_PREFIX characters long, which is the length of substation codes in RTE
+# names), or otherwise from the median of the elements of the same type, or else
+# from the median of all elements.
+#
+# When used as a script, it prints the expected runtime of the given cases, in the
+# order in which they would be dispatched.
+#
+
+import bisect
+import csv
+import os
+import statistics
+import sys
+import time
+
+
+RUNTIMES_FILE = "runtime_history.csv"
+RUNTIMES_COLUMNS = ["TIME", "DEVICE_TYPE", "ELEMENT", "CPU_TIME"]
+MIN_SIMILAR_PREFIX = 5
+
+
+def split_case_name(case_name):
+    """Split a contingency case name into its device type and element name"""
+    for i, char in enumerate(case_name):
+        if char in "#_":
+            return case_name[:i], case_name[i + 1 :]
+    return "", case_name
+
+
+def common_prefix_len(a, b):
+    n = min(len(a), len(b))
+    for i in range(n):
+        if a[i] != b[i]:
+            return i
+    return n
+
+
+class RuntimeHistory:
+    """Known runtimes of the contingency cases, and estimates for the unseen ones"""
+
+    def __init__(self, history_file):
+        self.history_file = history_file
+        self.runtimes = dict()  # (device_type, element) --> cpu_time
+        if os.path.isfile(history_file):
+            with open(history_file, newline="") as f:
+                for row in csv.DictReader(f, delimiter=";"):
+                    key = (row["DEVICE_TYPE"], row["ELEMENT"])
+                    self.runtimes[key] = float(row["CPU_TIME"])
+        self.build_index()
+
+    def build_index(self):
+        # Per device type, the sorted element names (for prefix searches) and medians
+        self.elements = dict()
+        self.type_medians = dict()
+        for device_type, element in self.runtimes:
+            self.elements.setdefault(device_type, []).append(element)
+        for device_type, elements in self.elements.items():
+            elements.sort()
+            self.type_medians[device_type] = statistics.median(
+                self.runtimes[(device_type, e)] for e in elements
+            )
+        self.median = None
+        if len(self.runtimes) != 0:
+            self.median = statistics.median(self.runtimes.values())
+
+    def record(self, case_name, cpu_time):
+        device_type, element = split_case_name(case_name)
+        self.runtimes[(device_type, element)] = cpu_time
+        row = ["%.3f" % time.time(), device_type, element, "%.2f" % cpu_time]
+        new_file = not os.path.isfile(self.history_file)
+        with open(self.history_file, "a", newline="") as f:
+            writer = csv.writer(f, delimiter=";")
+            if new_file:
+                writer.writerow(RUNTIMES_COLUMNS)
+            writer.writerow(row)
+
+    def estimate(self, case_name):
+        """Expected runtime of a case (None if there's no history at all)"""
+        device_type, element = split_case_name(case_name)
+        if (device_type, element) in self.runtimes:
+            return self.runtimes[(device_type, element)]
+        elements = self.elements.get(device_type)
+        if elements is None:
+            return self.median
+        # The elements sharing the longest prefix are next to its insertion point
+        i = bisect.bisect_left(elements, element)
+        neighbors = elements[max(0, i - 1) : i + 1]
+        prefix_len = max(common_prefix_len(element, e) for e in neighbors)
+        if prefix_len < MIN_SIMILAR_PREFIX:
+            return self.type_medians[device_type]
+        prefix = element[:prefix_len]
+        lo = bisect.bisect_left(elements, prefix)
+        hi = bisect.bisect_left(elements, prefix + "\U0010ffff")
+        return statistics.mean(
+            self.runtimes[(device_type, e)] for e in elements[lo:hi]
+        )
+
+    def lpt_order(self, cases):
+        """Sort the case dirs by decreasing expected runtime (LPT first)"""
+        if self.median is None:
+            return list(cases)
+        return sorted(
+            cases, key=lambda case: self.estimate(os.path.basename(case)), reverse=True
+        )
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("\nUsage: %s HISTORY_FILE CASE [CASE ...]\n" % sys.argv[0])
+        print(
+            "   Prints the expected runtime of the given contingency cases, in LPT "
+            "order (i.e., the order in which they would be dispatched).\n"
+        )
+        return 2
+    history = RuntimeHistory(sys.argv[1])
+    for case in history.lpt_order(sys.argv[2:]):
+        case_name = os.path.basename(case)
+        print("%s;%s" % (case_name, history.estimate(case_name)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
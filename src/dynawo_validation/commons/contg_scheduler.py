@@ -0,0 +1,1246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_scheduler.py:
+#
+# Runs all contingency cases having a given prefix under CASE_DIR, by launching the
+# given per-case command (typically run_one_contg.sh plus its options) once per case,
+# with the case directory appended as its last argument. It is a replacement for the
+# GNU parallel invocation that run_all_contg.sh used to do, with a few advantages:
+#
+#   * configurable concurrency (-j), accepting either a number of jobs or a
+#     percentage of the CPU cores, just like GNU parallel (e.g. "100%", "50%")
+#
+#   * a persistent job ledger, kept in the results dir, which records every state
+#     change of every case (queued, running, done, failed), together with its exit
+#     code and wall time
+#
+#   * failed cases are automatically retried (-r)
+#
+#   * when resuming an interrupted run (-R), the cases that were already completed
+#     are skipped (see contg_resume.py)
+#
+#   * optionally (-P), the post-processing of each case is done in-process by a pool
+#     of persistent worker processes, instead of spawning a bunch of python3
+#     processes per case. The given python module must provide a function
+#     postprocess(argv), which is called with the post-processing options (-O) plus
+#     the case dir. A post-processing worker counts as one more running job.
+#
+#   * optionally (-a), the A and B simulations of a case can be run concurrently,
+#     by passing the given option to the command. The scheduler does this only when
+#     there are enough free job slots for the cases left (i.e., towards the end of
+#     the campaign, or when running just a few cases), so that such a case then
+#     counts as two running jobs. Otherwise, inter-case parallelism is preferred.
+#
+#   * optionally (-H), the cases are dispatched longest-expected first, according to
+#     the runtimes recorded in previous runs (see contg_runtimes.py), and the
+#     runtimes of this run are recorded in turn (only those of the cases actually
+#     simulated, and successfully: not the failed ones, nor the cache hits)
+#
+#   * optional per-case limits on wall-clock time, CPU time, and time without any
+#     progress (see contg_watchdog.py); the cases exceeding them are killed and
+#     recorded as timed out
+#
+#   * optionally (--mem-budget), memory-aware admission control: a case is started
+#     only when the expected peak RSS of everything running fits in the memory
+#     budget, and the cases killed by the OOM killer are retried at a lower
+#     concurrency (see contg_memory.py)
+#
+#   * optionally (--scratch), the cases are run and post-processed in a scratch
+#     area (e.g. a RAM-backed tmpfs), so that only their final compressed artifacts
+#     are written to the results filesystem (see contg_scratch.py). The command and
+#     the post-processing then get the path of the scratch copy of the case.
+#
+#   * when the command leaves a list of results to compress in the case dir (see
+#     contg_compress.py), they are compressed in the background, by a bounded
+#     stage of at most --compress-jobs processes that don't take up job slots, so
+#     that the next case can start right away. A case is only done once compressed,
+#     and its post-processing (-P) only starts then, since it reads the compressed
+#     results.
+#
+#   * thread control (--threads): every job (and every post-processing task) is
+#     limited to the given number of threads, through the environment variables of
+#     OpenMP, BLAS and xz, so that running one job per core does not oversubscribe
+#     the machine. Optionally (--pin), each of them is also pinned to its own set
+#     of CPUs (see contg_cpus.py). With --threads, a percentage in -j refers to the
+#     CPU cores divided by the threads per job.
+#
+#   * optionally (-Q), the cases are published into a work queue on shared storage
+#     (see contg_queue.py), so that they can be run by several hosts at once. The
+#     scheduler then runs cases from the queue like any other worker, and waits
+#     until all cases are finished (by whichever worker). The workers on other
+#     hosts (or more workers on the same one) are started with worker_main() (see
+#     dynawo_validation_worker), and they keep serving whatever is published in the
+#     queue until they are stopped. For this, all paths (cases, results, command)
+#     must be absolute and visible from all hosts.
+#
+#   * optionally (--slot-pool), the job slots are taken from a pool shared with
+#     other schedulers running on the same host (see contg_slots.py), so that the
+#     campaigns of several basecases can share the machine fairly (see
+#     contg_campaign.py). Each scheduler still runs at most -j jobs at a time.
+#
+#   * optionally (--materialize), the cases are created just in time, by the given
+#     create script in serve mode (see contg_materialize.py), instead of all of them
+#     up front: a case is only created when it is about to be run, and it is deleted
+#     once done (i.e., --cleanup is implied). A case being created takes up its job
+#     slot, and at most MAX_MATERIALIZED case dirs per job slot exist at any time
+#     (those of the cases being created, run, post-processed or compressed), so that
+#     the disk used by the case dirs is bounded by the concurrency.
+#
+# See contg_ledger.py for the format of the job ledger.
+#
+# Usage example (this is how run_all_contg.sh invokes it):
+#
+#    contg_scheduler.py -j 100% -l RESULTS/gen/jobs_ledger.csv \
+#        -P dynawo_validation.dynaflow.pipeline.contg_postproc \
+#        -O "-c -o RESULTS/gen BASECASE" CASE_DIR gen# -- \
+#        run_one_contg.sh -p -o RESULTS/gen -A dynawo.sh -B hades BASECASE
+#
+# and on any other host, for running the cases of a shared queue:
+#
+#    dynawo_validation_worker -j 100% /shared/QUEUE_DIR
+#
+
+import argparse
+import contextlib
+import importlib
+import io
+import multiprocessing
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from collections import deque
+from dynawo_validation.commons.contg_compress import COMPRESS_LIST
+from dynawo_validation.commons.contg_cpus import (
+    CpuAllocator,
+    pinned_command,
+    thread_env,
+)
+from dynawo_validation.commons.contg_ledger import (
+    LEDGER_FILE,
+    JobLedger,
+    worker_ledger_file,
+)
+from dynawo_validation.commons.contg_materialize import Materializer
+from dynawo_validation.commons.contg_memory import (
+    MAX_OOM_RETRIES,
+    MEMORY_FILE,
+    OOM_MARGIN,
+    MemoryAdmission,
+    oom_kill_count,
+    parse_budget,
+    peak_rss,
+    reset_peak_rss,
+)
+from dynawo_validation.commons.contg_queue import STALE_TIMEOUT, FileQueue
+from dynawo_validation.commons.contg_resume import completed_cases
+from dynawo_validation.commons.contg_runtimes import RuntimeHistory
+from dynawo_validation.commons.contg_scratch import SCRATCH_SIZE, ScratchArea
+from dynawo_validation.commons.contg_slots import SlotPool
+from dynawo_validation.commons.contg_watchdog import Watchdog
+
+
+POLL_INTERVAL = 0.1  # seconds between checks of the running jobs
+WATCHDOG_INTERVAL = 5  # seconds between checks of the limits of the running jobs
+KILL_GRACE = 10  # seconds between SIGTERM and SIGKILL, when killing a job
+QUEUE_POLL_INTERVAL = 5  # seconds between checks of the work queue, when idle
+# What run_one_contg.sh prints when a side of the case is restored from the cache
+CACHE_HIT_MSG = "(simulation results found in the cache: "
+HEARTBEAT_INTERVAL = 30  # seconds between touches of our claims in the work queue
+SLOT_POLL_INTERVAL = 1  # seconds between requests to the slot pool, when refused
+MAX_REPORTED_FAILS = 101  # same convention as GNU parallel's exit status
+MAX_MATERIALIZED = 2  # with --materialize, max. case dirs on disk per job slot
+COMPRESS_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "contg_compress.py"
+)
+
+verbose = False
+
+
+class Job:
+    def __init__(self, case_dir):
+        self.case_dir = case_dir
+        self.run_dir = case_dir  # where it's actually run (see --scratch)
+        self.name = os.path.basename(case_dir)
+        self.attempt = 0
+        self.proc = None
+        self.output = None
+        self.t_start = None
+        self.postproc = None
+        self.slots = 1
+        self.cpu_time = None
+        self.progress = None
+        self.t_progress = None
+        self.kill_reason = None
+        self.t_kill = None
+        self.claim = None
+        self.max_rss = None
+        self.oom_count = None
+        self.oom_retries = 0
+        self.cpus = None
+        self.compress = None
+        self.compress_output = None
+        self.ab = False  # whether to run it with ab_opt, once created
+
+
+def find_cases(case_dir, case_prefix):
+    """Same as `find CASE_DIR -maxdepth 1 -type d -name PREFIX*`, but sorted"""
+    cases = [
+        entry.path
+        for entry in os.scandir(case_dir)
+        if entry.is_dir() and entry.name.startswith(case_prefix)
+    ]
+    return sorted(cases)
+
+
+def parse_njobs(njobs, threads=1):
+    """Accept either a number of jobs, or a percentage of the CPU cores (divided by
+    the threads per job)"""
+    if njobs.endswith("%"):
+        ncores = len(os.sched_getaffinity(0))
+        return max(1, int(ncores * float(njobs[:-1]) / 100 / threads))
+    return max(1, int(njobs))
+
+
+# The post-processing module, imported by the scheduler *before* forking the pool of
+# workers, so that they all inherit it (and its heavy imports) already loaded
+postproc_module = None
+
+
+def run_postproc(argv, cpus=None):
+    """Worker side: post-process one case, capturing all its output (and the peak
+    RSS of the worker while doing so)"""
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    output = io.StringIO()
+    reset_peak_rss()
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            retcode = postproc_module.postprocess(argv)
+    except SystemExit as e:  # argparse errors, or sys.exit() in the called scripts
+        retcode = e.code
+    except Exception:
+        output.write(traceback.format_exc())
+        retcode = 1
+    if retcode is None:
+        retcode = 0
+    elif not isinstance(retcode, int):
+        output.write("%s\n" % retcode)
+        retcode = 1
+    return retcode, output.getvalue(), peak_rss()
+
+
+class ContgScheduler:
+    def __init__(
+        self,
+        command,
+        ledger,
+        njobs,
+        retries=1,
+        postproc_opts=None,
+        ab_opt=None,
+        history=None,
+        watchdog=None,
+        work_queue=None,
+        wait=False,
+        memory=None,
+        scratch=None,
+        cleanup=False,
+        threads=1,
+        cpus=None,
+        compress_jobs=None,
+        slot_pool=None,
+        materializer=None,
+    ):
+        self.command = command
+        self.ledger = ledger
+        self.njobs = njobs
+        self.retries = retries
+        self.postproc_opts = postproc_opts
+        self.ab_opt = ab_opt
+        self.history = history
+        self.watchdog = watchdog
+        self.t_watchdog = 0
+        self.work_queue = work_queue
+        self.wait = wait
+        self.t_claim = 0
+        self.t_heartbeat = 0
+        self.memory = memory
+        self.max_jobs = njobs  # lowered when cases get killed for memory
+        self.scratch = scratch
+        self.cleanup = cleanup
+        self.threads = threads
+        self.cpus = cpus  # a CpuAllocator, when pinning the jobs
+        self.compress_jobs = compress_jobs if compress_jobs else max(1, njobs // 4)
+        self.slot_pool = slot_pool
+        self.t_slots = 0
+        self.materializer = materializer
+        self.pool = None
+        self.queue = deque()
+        self.running = []
+        self.creating = []
+        self.postprocessing = []
+        self.compress_queue = deque()
+        self.compressing = []
+        self.failed = []
+        self.timedout = []
+
+    def run(self, cases):
+        if self.history is not None:
+            cases = self.history.lpt_order(cases)
+        for case in cases:
+            job = Job(case)
+            self.queue.append(job)
+            self.ledger.record(job.name, "queued")
+        if self.postproc_opts is not None:
+            self.pool = multiprocessing.get_context("fork").Pool(self.njobs)
+        try:
+            while True:
+                while self.nbusy() < self.max_jobs and self.may_materialize():
+                    job = self.next_job()
+                    if job is None:
+                        break
+                    ab = self.use_ab()
+                    if ab and not self.admits(job, 2):
+                        ab = False
+                    if not self.admits(job, 1):
+                        self.queue.appendleft(job)
+                        break
+                    slots = self.pool_slots(2 if ab else 1)
+                    if slots == 0:
+                        self.queue.appendleft(job)
+                        break
+                    self.start(job, slots == 2)
+                if not (
+                    self.queue or self.running or self.creating or self.in_background()
+                ):
+                    if not self.more_work():
+                        break
+                    time.sleep(QUEUE_POLL_INTERVAL)
+                elif not self.reap():
+                    time.sleep(POLL_INTERVAL)
+                if self.watchdog is not None:
+                    self.check_limits()
+                if self.work_queue is not None:
+                    self.keep_claims()
+        except KeyboardInterrupt:
+            self.kill_all()
+            raise
+        finally:
+            if self.pool is not None:
+                self.pool.terminate()
+                self.pool.join()
+            if self.scratch is not None:
+                self.scratch.close()
+            if self.slot_pool is not None:
+                self.slot_pool.close()
+            if self.materializer is not None:
+                # (after the pool, whose workers inherited its pipes)
+                retcode = self.materializer.close()
+                if retcode != 0:
+                    print(
+                        "WARNING: the create script exited with code %d" % retcode,
+                        flush=True,
+                    )
+        return self.failed
+
+    def in_background(self):
+        """Whether any job is still being post-processed or compressed"""
+        return bool(self.postprocessing or self.compress_queue or self.compressing)
+
+    def nbusy(self):
+        nbusy = sum(job.slots for job in self.running + self.creating)
+        return nbusy + len(self.postprocessing)
+
+    def may_materialize(self):
+        """Whether there is room on disk for one more case dir (see --materialize)"""
+        if self.materializer is None:
+            return True
+        jobs = self.creating + self.running + self.postprocessing
+        jobs += [job for job in self.pending_compression() if job not in jobs]
+        return len(jobs) < MAX_MATERIALIZED * self.njobs
+
+    def admits(self, job, slots):
+        """Whether the expected memory of the job fits, with everything else running"""
+        if self.memory is None or not (self.running or self.postprocessing):
+            return True
+        # A scratch area in RAM takes up part of the memory budget too
+        reserved = self.scratch.ram_usage() if self.scratch is not None else 0
+        return self.memory.admits(
+            job, slots, self.running, self.postprocessing, reserved
+        )
+
+    def pool_slots(self, slots):
+        """How many of the given slots (two, for running the A and B sides of the
+        next job concurrently) the shared slot pool lets us take, if any"""
+        if self.slot_pool is None:
+            return slots
+        now = time.monotonic()
+        if now - self.t_slots < SLOT_POLL_INTERVAL:
+            return 0
+        nbusy = self.nbusy()
+        self.slot_pool.set_demand(nbusy + slots + len(self.queue))
+        for n in range(slots, 0, -1):
+            if self.slot_pool.hold(nbusy + n):
+                return n
+        self.t_slots = now
+        return 0
+
+    def give_back_slots(self):
+        """Give back to the shared slot pool the slots of the jobs just finished"""
+        self.slot_pool.hold(self.nbusy())
+        self.slot_pool.set_demand(self.nbusy() + len(self.queue))
+        self.t_slots = 0
+
+    def next_job(self):
+        """Our own queue goes first (i.e., retries), then the shared work queue"""
+        if self.queue:
+            return self.queue.popleft()
+        if self.work_queue is None:
+            return None
+        # Don't keep listing the shared queue while it's empty
+        now = time.monotonic()
+        if now - self.t_claim < QUEUE_POLL_INTERVAL:
+            return None
+        claim = self.work_queue.claim()
+        if claim is None:
+            self.t_claim = now
+            return None
+        job = Job(claim.case_dir)
+        job.claim = claim
+        return job
+
+    def more_work(self):
+        """Whether to keep waiting for cases from the shared work queue"""
+        if self.work_queue is None:
+            return False
+        if self.wait:
+            self.work_queue.recover_stale()
+            return not self.work_queue.drained()
+        return self.work_queue.npending() > 0
+
+    def keep_claims(self):
+        now = time.monotonic()
+        if now - self.t_heartbeat < HEARTBEAT_INTERVAL:
+            return
+        self.t_heartbeat = now
+        jobs = list(self.queue) + self.running + self.postprocessing
+        jobs += [job for job in self.pending_compression() if job not in jobs]
+        self.work_queue.heartbeat([job.claim for job in jobs if job.claim is not None])
+        self.work_queue.recover_stale()
+
+    def release(self, job, state):
+        if job.claim is not None:
+            self.work_queue.complete(job.claim, state)
+
+    def use_ab(self):
+        """Whether the next job can run its A and B sides concurrently (using two
+        slots) while still leaving at least one free slot for each queued case"""
+        if self.ab_opt is None:
+            return False
+        nfree = self.max_jobs - self.nbusy()
+        nqueued = len(self.queue)
+        if self.work_queue is not None:
+            nqueued += self.work_queue.npending()
+        return nfree - 2 >= nqueued
+
+    def start(self, job, ab=False):
+        job.attempt += 1
+        job.t_start = time.monotonic()
+        if self.materializer is not None and not os.path.isdir(job.case_dir):
+            # It will be started once created (see reap); retries find it created
+            job.ab = ab
+            job.slots = 2 if ab else 1
+            self.materializer.request(job.case_dir)
+            self.creating.append(job)
+            self.ledger.record(job.name, "create", job.attempt)
+            return
+        self.launch(job, ab)
+
+    def launch(self, job, ab=False):
+        job.output = tempfile.TemporaryFile()
+        job.t_start = time.monotonic()
+        job.progress = None
+        job.t_progress = job.t_start
+        job.kill_reason = None
+        if self.scratch is not None:
+            job.run_dir = self.scratch.acquire(job.case_dir)
+        cmd = self.command + [job.run_dir]
+        job.slots = 1
+        if ab:
+            cmd.insert(1, self.ab_opt)
+            job.slots = 2
+        if self.cpus is not None:
+            job.cpus = self.cpus.take(self.threads * job.slots)
+            cmd = pinned_command(cmd, job.cpus)
+        if self.memory is not None:
+            job.oom_count = oom_kill_count()
+        if verbose:
+            print(" ".join(cmd), flush=True)
+        # Each job gets its own process group, so that it can be killed as a whole
+        job.proc = subprocess.Popen(
+            cmd, stdout=job.output, stderr=subprocess.STDOUT, start_new_session=True
+        )
+        if job.cpus is not None and cmd[0] == self.command[0]:
+            # No taskset: pin it right away (its children will inherit it)
+            with contextlib.suppress(OSError):
+                os.sched_setaffinity(job.proc.pid, job.cpus)
+        self.running.append(job)
+        self.ledger.record(job.name, "running", job.attempt)
+
+    def reap(self):
+        """Collect all finished jobs; return True if any job finished"""
+        failed_creations = self.reap_created()
+        finished = [job for job in self.running if self.poll(job)]
+        for job in finished:
+            self.running.remove(job)
+            self.give_back_cpus(job)
+            job.output.seek(0)
+            output = job.output.read().decode(errors="replace")
+            job.output.close()
+            # Only the runtimes of actual simulations that went well are of use for
+            # the LPT order (cache hits take no time, and failures any time at all)
+            if (
+                self.history is not None
+                and job.proc.returncode == 0
+                and job.kill_reason is None
+                and CACHE_HIT_MSG not in output
+            ):
+                self.history.record(job.name, job.cpu_time)
+            if self.memory is not None and job.proc.returncode == 0:
+                self.memory.sim.record(job.name, job.max_rss)
+            if self.scratch is not None:
+                self.scratch.measure(job.run_dir)
+            # Print the whole output of the job at once, as GNU parallel does
+            sys.stdout.write(output)
+            sys.stdout.flush()
+            if job.kill_reason is not None:
+                self.finish_timedout(job)
+            elif self.killed_for_memory(job):
+                self.finish_oom(job)
+            elif job.proc.returncode == 0:
+                self.start_stages(job)
+            else:
+                self.finish(job, job.proc.returncode)
+        postprocessed = [job for job in self.postprocessing if job.postproc.ready()]
+        for job in postprocessed:
+            self.postprocessing.remove(job)
+            self.give_back_cpus(job)
+            exit_code, output, max_rss = job.postproc.get()
+            if self.memory is not None and max_rss is not None:
+                self.memory.postproc.record(job.name, max_rss)
+            sys.stdout.write(output)
+            sys.stdout.flush()
+            self.finish(job, exit_code)
+        compressed = [x for x in self.compressing if x.compress.poll() is not None]
+        for job in compressed:
+            self.compressing.remove(job)
+            job.compress_output.seek(0)
+            sys.stdout.write(job.compress_output.read().decode(errors="replace"))
+            sys.stdout.flush()
+            job.compress_output.close()
+            self.compression_done(job, job.compress.returncode)
+        self.start_compressions()
+        if self.slot_pool is not None and (
+            finished or postprocessed or failed_creations
+        ):
+            self.give_back_slots()
+        return (
+            len(finished) > 0
+            or len(postprocessed) > 0
+            or len(compressed) > 0
+            or failed_creations > 0
+        )
+
+    def reap_created(self):
+        """Launch the jobs whose case has just been created; return how many of them
+        could not be created"""
+        if self.materializer is None or not self.creating:
+            return 0
+        nfailed = 0
+        for case_dir, ok in self.materializer.poll():
+            job = next(x for x in self.creating if x.case_dir == case_dir)
+            self.creating.remove(job)
+            if ok:
+                self.launch(job, job.ab)
+            else:
+                print(
+                    "WARNING: contingency case %s could not be created" % job.name,
+                    flush=True,
+                )
+                # (or else its retry would run whatever got created)
+                shutil.rmtree(job.case_dir, ignore_errors=True)
+                nfailed += 1
+                self.finish(job, 1)
+        return nfailed
+
+    def poll(self, job):
+        """Like Popen.poll(), but also getting the CPU time used by the job (which
+        includes that of all its children, since the launcher scripts wait for them)"""
+        pid, status, rusage = os.wait4(job.proc.pid, os.WNOHANG)
+        if pid == 0:
+            return False
+        # (as Popen does: the exit code, or minus the signal that killed it)
+        if os.WIFSIGNALED(status):
+            job.proc.returncode = -os.WTERMSIG(status)
+        else:
+            job.proc.returncode = os.WEXITSTATUS(status)
+        job.cpu_time = rusage.ru_utime + rusage.ru_stime
+        job.max_rss = rusage.ru_maxrss / 1024  # KB on Linux
+        return True
+
+    def killed_for_memory(self, job):
+        """A failed job is taken as killed for memory if the OOM killer acted while
+        it was running (it may have killed any of its processes, e.g. the simulator,
+        and then the job fails in some other way)"""
+        if self.memory is None or job.proc.returncode == 0:
+            return False
+        return oom_kill_count() > job.oom_count
+
+    def finish_oom(self, job):
+        wall_time = time.monotonic() - job.t_start
+        self.release_scratch(job)
+        self.max_jobs = max(1, min(self.max_jobs, self.nbusy() + job.slots) // 2)
+        self.memory.sim.record(job.name, job.max_rss * OOM_MARGIN)
+        self.ledger.record(
+            job.name, "oom", job.attempt, job.proc.returncode, wall_time
+        )
+        if job.oom_retries < MAX_OOM_RETRIES:
+            job.oom_retries += 1
+            print(
+                "WARNING: contingency job %s was killed for memory; retrying (max. "
+                "concurrency now: %d)" % (job.name, self.max_jobs),
+                flush=True,
+            )
+            self.queue.appendleft(job)
+            self.ledger.record(job.name, "queued", job.attempt)
+        else:
+            print(
+                "WARNING: contingency job %s was killed for memory; giving up"
+                % job.name,
+                flush=True,
+            )
+            self.ledger.record(job.name, "failed", job.attempt, job.proc.returncode)
+            self.failed.append(job)
+            self.release(job, "failed")
+
+    def start_stages(self, job):
+        """Start the compression and then the post-processing of the results of a
+        job whose command succeeded (both in the background). The post-processing
+        reads the compressed results, so it can only start once they are written
+        (otherwise it would fail, or read those of a previous run of the case)."""
+        if os.path.isfile(os.path.join(job.run_dir, COMPRESS_LIST)):
+            self.compress_queue.append(job)
+            self.ledger.record(job.name, "compress", job.attempt)
+        else:
+            self.compression_done(job, 0)
+
+    def compression_done(self, job, exit_code):
+        if exit_code != 0 or self.pool is None:
+            self.finish(job, exit_code)
+        else:
+            self.start_postproc(job)
+
+    def start_compressions(self):
+        while self.compress_queue and len(self.compressing) < self.compress_jobs:
+            job = self.compress_queue.popleft()
+            job.compress_output = tempfile.TemporaryFile()
+            list_file = os.path.join(job.run_dir, COMPRESS_LIST)
+            cmd = [sys.executable, COMPRESS_SCRIPT, list_file]
+            job.compress = subprocess.Popen(
+                cmd,
+                stdout=job.compress_output,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+            self.compressing.append(job)
+
+    def pending_compression(self):
+        return list(self.compress_queue) + self.compressing
+
+    def start_postproc(self, job):
+        argv = self.postproc_opts + [job.run_dir]
+        cpus = None
+        if self.cpus is not None:
+            job.cpus = self.cpus.take(self.threads)
+            # Otherwise, the worker would keep the affinity of its previous task
+            cpus = job.cpus if job.cpus is not None else self.cpus.all_cpus
+        job.postproc = self.pool.apply_async(run_postproc, (argv, cpus))
+        self.postprocessing.append(job)
+        self.ledger.record(job.name, "postproc", job.attempt)
+
+    def give_back_cpus(self, job):
+        if self.cpus is not None:
+            self.cpus.give_back(job.cpus)
+        job.cpus = None
+
+    def release_scratch(self, job):
+        if self.scratch is not None:
+            self.scratch.release(job.run_dir)
+            job.run_dir = job.case_dir
+
+    def finish(self, job, exit_code):
+        wall_time = time.monotonic() - job.t_start
+        self.release_scratch(job)
+        if exit_code == 0:
+            # The case dir can only be deleted once its results are compressed
+            # (and, when run in a scratch area, the command can only clean up the
+            # scratch copy of the case anyway)
+            if self.cleanup:
+                shutil.rmtree(job.case_dir, ignore_errors=True)
+            self.ledger.record(job.name, "done", job.attempt, exit_code, wall_time)
+            self.release(job, "done")
+        elif job.attempt <= self.retries:
+            print(
+                "WARNING: contingency job %s failed (exit code: %d); retrying"
+                % (job.name, exit_code),
+                flush=True,
+            )
+            self.ledger.record(job.name, "failed", job.attempt, exit_code, wall_time)
+            self.queue.append(job)
+            self.ledger.record(job.name, "queued", job.attempt)
+        else:
+            self.ledger.record(job.name, "failed", job.attempt, exit_code, wall_time)
+            self.failed.append(job)
+            self.release(job, "failed")
+
+    def finish_timedout(self, job):
+        wall_time = time.monotonic() - job.t_start
+        self.release_scratch(job)
+        print(
+            "WARNING: contingency job %s timed out (%s); killed"
+            % (job.name, job.kill_reason),
+            flush=True,
+        )
+        self.ledger.record(
+            job.name, "timeout", job.attempt, job.proc.returncode, wall_time
+        )
+        self.timedout.append(job)
+        self.release(job, "timeout")
+
+    def check_limits(self):
+        now = time.monotonic()
+        if now - self.t_watchdog < WATCHDOG_INTERVAL:
+            return
+        self.t_watchdog = now
+        for job in self.running:
+            if job.kill_reason is None:
+                job.kill_reason = self.watchdog.check(job, now)
+                if job.kill_reason is not None:
+                    job.t_kill = now
+                    self.signal_job(job, signal.SIGTERM)
+            elif now - job.t_kill > KILL_GRACE:
+                self.signal_job(job, signal.SIGKILL)
+
+    def signal_job(self, job, sig):
+        try:
+            os.killpg(job.proc.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def kill_all(self):
+        for job in self.creating:
+            self.ledger.record(job.name, "failed", job.attempt)
+        for job in self.running:
+            try:
+                os.killpg(job.proc.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            job.proc.wait()
+            self.ledger.record(job.name, "failed", job.attempt, job.proc.returncode)
+        for job in self.compressing:
+            try:
+                os.killpg(job.compress.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            job.compress.wait()
+        background = self.postprocessing + [
+            job for job in self.pending_compression() if job not in self.postprocessing
+        ]
+        for job in background:
+            self.ledger.record(job.name, "failed", job.attempt)
+        # Leave our cases for the other workers
+        for job in list(self.queue) + self.running + background:
+            if job.claim is not None:
+                self.work_queue.unclaim(job.claim)
+
+
+def main():
+    global verbose, postproc_module
+    parser = argparse.ArgumentParser(
+        description="Run all contingency cases CASE_DIR/CASE_PREFIX* in parallel, "
+        "by appending each case dir to the given command"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default="100%",
+        help="number of jobs to run concurrently, or a percentage of the CPU "
+        "cores (default: 100%%)",
+    )
+    parser.add_argument(
+        "-r",
+        "--retries",
+        type=int,
+        default=1,
+        help="number of times a failed case is retried (default: 1)",
+    )
+    parser.add_argument(
+        "-l",
+        "--ledger",
+        default=None,
+        help="job ledger file (default: %s in the current dir)" % LEDGER_FILE,
+    )
+    parser.add_argument(
+        "-R",
+        "--resume",
+        action="store_true",
+        help="skip the cases already completed in the results dir (i.e., the dir "
+        "where the job ledger is)",
+    )
+    parser.add_argument(
+        "-P",
+        "--postproc",
+        default=None,
+        help="python module providing postprocess(argv), to be run on each case "
+        "(after its command succeeds) by a pool of persistent worker processes",
+    )
+    parser.add_argument(
+        "-O",
+        "--postproc-opts",
+        default="",
+        help="options for the post-processing (the case dir is appended to them)",
+    )
+    parser.add_argument(
+        "-a",
+        "--ab-opt",
+        default=None,
+        help="option of the command for running the A and B simulations of a case "
+        "concurrently, used when there are more free job slots than cases left "
+        "(e.g. --ab-opt=-C)",
+    )
+    parser.add_argument(
+        "-H",
+        "--history",
+        default=None,
+        help="runtime history file, for dispatching the longest-expected cases "
+        "first (it gets updated with the runtimes of this run)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="wall-clock limit per case, in seconds",
+    )
+    parser.add_argument(
+        "--cpu-limit",
+        type=float,
+        default=None,
+        help="CPU-time limit per case, in seconds",
+    )
+    parser.add_argument(
+        "--stall",
+        type=float,
+        default=None,
+        help="kill a case when none of the files in its dir change for this many "
+        "seconds (no-progress watchdog)",
+    )
+    parser.add_argument(
+        "-m",
+        "--mem-budget",
+        default=None,
+        help="memory budget for all the running jobs, in MB or as a percentage of "
+        "the RAM (e.g. 80%%); enables memory-aware admission control",
+    )
+    parser.add_argument(
+        "-M",
+        "--memory-history",
+        default=None,
+        help="peak memory history file, for the memory-aware admission control "
+        "(default: %s next to the job ledger)" % MEMORY_FILE,
+    )
+    parser.add_argument(
+        "--scratch",
+        default=None,
+        help="run and post-process the cases in this scratch dir (e.g. /dev/shm), "
+        "so that only their final results are written to the results dir",
+    )
+    parser.add_argument(
+        "--scratch-size",
+        default=SCRATCH_SIZE,
+        help="size cap of the scratch area, in MB or as a percentage of the size "
+        "of its filesystem (default: %s); cases that don't fit are run in place"
+        % SCRATCH_SIZE.replace("%", "%%"),
+    )
+    parser.add_argument(
+        "-c",
+        "--cleanup",
+        action="store_true",
+        help="delete each case dir once it is done",
+    )
+    parser.add_argument(
+        "--compress-jobs",
+        type=int,
+        default=None,
+        help="maximum number of cases whose results are compressed at the same "
+        "time, in the background (default: a quarter of the jobs)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="threads per job (OpenMP, BLAS, xz...); by default, 1, unless already "
+        "set in the environment",
+    )
+    parser.add_argument(
+        "--pin",
+        action="store_true",
+        help="pin each job (and each post-processing task) to its own set of CPUs",
+    )
+    parser.add_argument(
+        "--slot-pool",
+        default=None,
+        help="take the job slots from this pool dir, shared with other schedulers "
+        "on this host (see contg_slots.py)",
+    )
+    parser.add_argument(
+        "-Q",
+        "--queue",
+        default=None,
+        help="publish the cases into this work queue dir (on shared storage), so "
+        "that they can also be run by workers on other hosts",
+    )
+    parser.add_argument(
+        "--stale-timeout",
+        type=float,
+        default=STALE_TIMEOUT,
+        help="seconds after which the cases claimed by an unresponsive queue "
+        "worker are given to others (default: %d)" % STALE_TIMEOUT,
+    )
+    parser.add_argument(
+        "--materialize",
+        default=None,
+        help="create each case just before running it, with this command (a create "
+        "script in serve mode, see contg_materialize.py), instead of expecting all "
+        "of them to exist; implies --cleanup",
+    )
+    parser.add_argument(
+        "-v", "--verbose", help="increase output verbosity", action="store_true"
+    )
+    parser.add_argument("case_dir", help="directory containing the contingency cases")
+    parser.add_argument("case_prefix", help="prefix of the contingency cases to run")
+    parser.add_argument(
+        "command",
+        nargs=argparse.REMAINDER,
+        help="command to run for each case (the case dir is appended to it)",
+    )
+    args = parser.parse_args()
+    verbose = args.verbose
+    command = args.command
+    if len(command) != 0 and command[0] == "--":
+        command = command[1:]
+    if len(command) == 0:
+        parser.error("no command given for running the cases")
+
+    if args.materialize is not None and args.queue is not None:
+        parser.error("--materialize is not supported together with --queue")
+
+    # The cases to be created just in time, plus those already created (if any)
+    materializer = None
+    if args.materialize is not None:
+        try:
+            materializer = Materializer(shlex.split(args.materialize))
+        except (OSError, RuntimeError) as e:
+            print("ERROR: cannot create the cases just in time: %s" % e)
+            return 1
+        args.cleanup = True
+    cases = find_cases(args.case_dir, args.case_prefix)
+    if materializer is not None:
+        existing = set(os.path.basename(case) for case in cases)
+        cases += [
+            case
+            for case in materializer.cases
+            if os.path.basename(case) not in existing
+        ]
+    if len(cases) == 0 and not args.resume:
+        print(f"No cases with pattern {args.case_prefix}* found under {args.case_dir}")
+        if materializer is not None:
+            materializer.close()
+        return 1
+
+    ledger_file = args.ledger if args.ledger is not None else LEDGER_FILE
+    if args.resume:
+        results_dir = os.path.dirname(os.path.abspath(ledger_file))
+        done = set(completed_cases(results_dir, args.case_prefix))
+        cases = [case for case in cases if os.path.basename(case) not in done]
+        print("*** Resuming: skipping %d cases already completed" % len(done))
+        if len(cases) == 0:
+            if materializer is not None:
+                materializer.close()
+            return 0
+
+    # Before importing the post-processing (BLAS reads its settings when loaded),
+    # and so that all the jobs inherit it
+    threads = args.threads if args.threads is not None else 1
+    os.environ.update(thread_env(threads, force=args.threads is not None))
+    postproc_opts = None
+    if args.postproc is not None:
+        postproc_module = importlib.import_module(args.postproc)
+        postproc_opts = shlex.split(args.postproc_opts)
+
+    njobs = parse_njobs(args.jobs, threads)
+    slot_pool = None
+    if args.slot_pool is not None:
+        slot_pool = SlotPool(args.slot_pool)
+        # The other schedulers would pin their jobs to the same CPUs
+        if args.pin:
+            print("WARNING: not pinning the jobs: using a shared slot pool", flush=True)
+            args.pin = False
+    cpus = cpu_allocator(args.pin, njobs, threads)
+    # A zero (or negative) limit means no limit
+    limits = [args.timeout, args.cpu_limit, args.stall]
+    watchdog = Watchdog(*[x if x is not None and x > 0 else None for x in limits])
+    memory = None
+    if args.mem_budget is not None and parse_budget(args.mem_budget) > 0:
+        memory_history = args.memory_history
+        if memory_history is None:
+            memory_history = os.path.join(
+                os.path.dirname(os.path.abspath(ledger_file)), MEMORY_FILE
+            )
+        memory = MemoryAdmission(parse_budget(args.mem_budget), memory_history)
+
+    if args.queue is not None:
+        return run_queue(args, command, cases, njobs, watchdog, memory, cpus, slot_pool)
+
+    scratch = None
+    if args.scratch is not None:
+        scratch = ScratchArea(args.scratch, args.scratch_size)
+
+    print(
+        "*** Running %d cases, %d jobs at a time (job ledger: %s)"
+        % (len(cases), njobs, ledger_file),
+        flush=True,
+    )
+    scheduler = ContgScheduler(
+        command,
+        JobLedger(ledger_file),
+        njobs,
+        args.retries,
+        postproc_opts,
+        args.ab_opt,
+        RuntimeHistory(args.history) if args.history is not None else None,
+        watchdog if watchdog.enabled() else None,
+        memory=memory,
+        scratch=scratch,
+        cleanup=args.cleanup,
+        threads=threads,
+        cpus=cpus,
+        compress_jobs=args.compress_jobs,
+        slot_pool=slot_pool,
+        materializer=materializer,
+    )
+    failed = scheduler.run(cases)
+    if len(failed) != 0:
+        print("Failed cases: %s" % " ".join(job.name for job in failed))
+    if len(scheduler.timedout) != 0:
+        print("Timed-out cases: %s" % " ".join(job.name for job in scheduler.timedout))
+    return min(len(failed) + len(scheduler.timedout), MAX_REPORTED_FAILS)
+
+
+def cpu_allocator(pin, njobs, threads):
+    """A CpuAllocator for pinning the jobs, if asked to and there are enough CPUs"""
+    if not pin:
+        return None
+    cpus = CpuAllocator()
+    if njobs * threads > cpus.ncpus():
+        print(
+            "WARNING: not pinning the jobs: %d jobs x %d threads need more than the "
+            "%d CPUs available" % (njobs, threads, cpus.ncpus()),
+            flush=True,
+        )
+        return None
+    return cpus
+
+
+def run_queue(args, command, cases, njobs, watchdog, memory, cpus, slot_pool=None):
+    """Coordinator side: publish the cases, run them, and wait for the workers"""
+    ledger_file = os.path.abspath(
+        args.ledger if args.ledger is not None else LEDGER_FILE
+    )
+    history = RuntimeHistory(args.history) if args.history is not None else None
+    if history is not None:
+        cases = history.lpt_order(cases)
+    ledger = JobLedger(ledger_file)
+    for case in cases:
+        ledger.record(os.path.basename(case), "queued")
+    # The workers pick everything they need from the queue's config, including our
+    # environment variables (e.g. DWO_VALIDATION_CACHE)
+    config = {
+        "command": command,
+        "ledger": ledger_file,
+        "retries": args.retries,
+        "postproc": args.postproc,
+        "postproc_opts": args.postproc_opts,
+        "ab_opt": args.ab_opt,
+        "limits": [args.timeout, args.cpu_limit, args.stall],
+        "mem_budget": args.mem_budget if memory is not None else None,
+        "memory_history": memory.sim.history_file if memory is not None else None,
+        "scratch": args.scratch,
+        "scratch_size": args.scratch_size,
+        "cleanup": args.cleanup,
+        "threads": args.threads,
+        "pin": args.pin,
+        "compress_jobs": args.compress_jobs,
+        "env": {k: v for k, v in os.environ.items() if k.startswith("DWO_VALIDATION")},
+    }
+    work_queue = FileQueue(args.queue, stale_timeout=args.stale_timeout)
+    work_queue.publish(cases, config)
+    print(
+        "*** Published %d cases in the work queue %s; running them, %d jobs at a "
+        "time (job ledger: %s)" % (len(cases), args.queue, njobs, ledger_file),
+        flush=True,
+    )
+    # The runtimes and memory peaks of the cases run by other hosts are not recorded
+    # in the history files (appending to a file from several hosts is not safe)
+    scheduler = ContgScheduler(
+        command,
+        ledger,
+        njobs,
+        args.retries,
+        shlex.split(args.postproc_opts) if args.postproc is not None else None,
+        args.ab_opt,
+        history,
+        watchdog if watchdog.enabled() else None,
+        work_queue,
+        wait=True,
+        memory=memory,
+        scratch=ScratchArea(args.scratch, args.scratch_size)
+        if args.scratch is not None
+        else None,
+        cleanup=args.cleanup,
+        threads=args.threads if args.threads is not None else 1,
+        cpus=cpus,
+        compress_jobs=args.compress_jobs,
+        slot_pool=slot_pool,
+    )
+    scheduler.run([])
+    failed = work_queue.cases("failed")
+    timedout = work_queue.cases("timeout")
+    if len(failed) != 0:
+        print("Failed cases: %s" % " ".join(failed))
+    if len(timedout) != 0:
+        print("Timed-out cases: %s" % " ".join(timedout))
+    return min(len(failed) + len(timedout), MAX_REPORTED_FAILS)
+
+
+def worker_main():
+    """Worker side: keep running the cases published in a work queue"""
+    global verbose, postproc_module
+    parser = argparse.ArgumentParser(
+        description="Run the contingency cases published in a shared work queue "
+        "(see contg_scheduler.py, option --queue)"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default="100%",
+        help="number of jobs to run concurrently, or a percentage of the CPU "
+        "cores (default: 100%%)",
+    )
+    parser.add_argument(
+        "-1",
+        "--once",
+        action="store_true",
+        help="exit once the queue is empty (right away if it is already empty), "
+        "instead of waiting for more cases",
+    )
+    parser.add_argument(
+        "--stale-timeout",
+        type=float,
+        default=STALE_TIMEOUT,
+        help="seconds after which the cases claimed by an unresponsive queue "
+        "worker are given to others (default: %d)" % STALE_TIMEOUT,
+    )
+    parser.add_argument(
+        "-v", "--verbose", help="increase output verbosity", action="store_true"
+    )
+    parser.add_argument("queue_dir", help="work queue dir (on shared storage)")
+    args = parser.parse_args()
+    verbose = args.verbose
+    njobs = parse_njobs(args.jobs)
+    work_queue = FileQueue(args.queue_dir, stale_timeout=args.stale_timeout)
+    print(
+        "*** Worker %s: running the cases of %s, %d jobs at a time"
+        % (work_queue.worker_id, args.queue_dir, njobs),
+        flush=True,
+    )
+    try:
+        while True:
+            config = work_queue.read_config()
+            if config is not None and work_queue.npending() > 0:
+                os.environ.update(config["env"])
+                threads = config["threads"] if config["threads"] is not None else 1
+                os.environ.update(
+                    thread_env(threads, force=config["threads"] is not None)
+                )
+                njobs = parse_njobs(args.jobs, threads)
+                postproc_opts = None
+                if config["postproc"] is not None:
+                    postproc_module = importlib.import_module(config["postproc"])
+                    postproc_opts = shlex.split(config["postproc_opts"])
+                limits = config["limits"]
+                watchdog = Watchdog(
+                    *[x if x is not None and x > 0 else None for x in limits]
+                )
+                ledger = worker_ledger_file(config["ledger"], work_queue.worker_id)
+                # The budget may be a percentage of the RAM of this host
+                memory = None
+                if config["mem_budget"] is not None:
+                    memory = MemoryAdmission(
+                        parse_budget(config["mem_budget"]),
+                        config["memory_history"],
+                        readonly=True,
+                    )
+                # The scratch dir is local to each host (and so is its size)
+                scratch = None
+                if config["scratch"] is not None:
+                    scratch = ScratchArea(config["scratch"], config["scratch_size"])
+                scheduler = ContgScheduler(
+                    config["command"],
+                    JobLedger(ledger),
+                    njobs,
+                    config["retries"],
+                    postproc_opts,
+                    config["ab_opt"],
+                    None,
+                    watchdog if watchdog.enabled() else None,
+                    work_queue,
+                    memory=memory,
+                    scratch=scratch,
+                    cleanup=config["cleanup"],
+                    threads=threads,
+                    cpus=cpu_allocator(config["pin"], njobs, threads),
+                    compress_jobs=config["compress_jobs"],
+                )
+                scheduler.run([])
+            elif args.once:
+                return 0
+            else:
+                time.sleep(QUEUE_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_scratch.py:
+#
+# A scratch area (typically a RAM-backed tmpfs, such as /dev/shm) where the
+# contingency scheduler runs and post-processes the cases (see contg_scheduler.py,
+# option --scratch), instead of doing it in the case dirs themselves. Each case
+# reads and writes its whole working tree (inputs, output IIDM, curves, timeline,
+# logs...) several times, and on network or spinning storage this I/O dominates the
+# short DynaFlow cases. With a scratch area:
+#
+#   * each case is first materialized in the scratch area: its regular files are
+#     copied, and its symlinks (to the BASECASE files) are re-created as absolute
+#     symlinks, so that the large shared inputs are not copied
+#
+#   * the case is run and post-processed there. The only things written to the
+#     results dir are the final compressed artifacts (which run_one_contg.sh and the
+#     post-processing always write directly into it anyway)
+#
+#   * the scratch copy is deleted as soon as the case is finished, whether it
+#     succeeded or not (failed cases get a fresh copy when retried), and the whole
+#     scratch dir of the run is deleted when the scheduler exits. The scratch dirs
+#     left behind by runs that were killed (on this host) are deleted when the next
+#     run starts.
+#
+# The scratch area has a size cap. A case is only materialized in it if its
+# expected footprint fits in what is left of the cap (and of the free space of the
+# filesystem); otherwise, it is run in place, as usual. The footprint of a case is
+# expected to be the largest one seen so far in the run or, before any case has
+# finished, twice the size of its inputs (including those behind the symlinks).
+#
+
+import os
+import shutil
+import socket
+import tempfile
+
+
+SCRATCH_DIR_PREFIX = "dwo_validation_scratch"
+SCRATCH_SIZE = "50%"
+RAM_FILESYSTEMS = ["tmpfs", "ramfs"]
+
+
+def parse_size(size, path):
+    """Accept either a number of MB, or a percentage of the size of the filesystem"""
+    if size.endswith("%"):
+        st = os.statvfs(path)
+        return st.f_blocks * st.f_frsize / 2**20 * float(size[:-1]) / 100
+    return float(size)
+
+
+def tree_size(path, follow_symlinks=False):
+    """Total size of the files under path, in MB"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.stat(
+                    os.path.join(dirpath, filename), follow_symlinks=follow_symlinks
+                ).st_size
+            except OSError:
+                continue
+    return total / 2**20
+
+
+def is_in_ram(path):
+    """Whether path is on a RAM-backed filesystem (looking it up in /proc/mounts)"""
+    path = os.path.realpath(path)
+    fs_type, mount_len = None, -1
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                fields = line.split()
+                mount_point = fields[1].replace("\\040", " ")
+                if (
+                    path == mount_point
+                    or path.startswith(mount_point.rstrip("/") + "/")
+                ) and len(mount_point) > mount_len:
+                    fs_type, mount_len = fields[2], len(mount_point)
+    except OSError:
+        return False
+    return fs_type in RAM_FILESYSTEMS
+
+
+def materialize(case_dir, dest_dir):
+    """Copy the case, re-creating its symlinks as absolute ones (not copying them)"""
+    case_dir = os.path.abspath(case_dir)
+    for dirpath, dirnames, filenames in os.walk(case_dir):
+        dest_path = os.path.join(dest_dir, os.path.relpath(dirpath, case_dir))
+        os.makedirs(dest_path, exist_ok=True)
+        for name in dirnames + filenames:
+            src = os.path.join(dirpath, name)
+            if os.path.islink(src):
+                os.symlink(os.path.realpath(src), os.path.join(dest_path, name))
+            elif not os.path.isdir(src):
+                shutil.copy2(src, os.path.join(dest_path, name))
+
+
+def pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ScratchArea:
+    def __init__(self, base_dir, size=SCRATCH_SIZE):
+        self.base_dir = base_dir
+        self.max_size = parse_size(size, base_dir)  # MB
+        self.in_ram = is_in_ram(base_dir)
+        self.hostname = socket.gethostname()
+        self.run_dir = None
+        self.cases = dict()  # scratch case dir --> its expected footprint
+        self.max_footprint = None
+        self.nfallback = 0
+        self.remove_stale()
+
+    def remove_stale(self):
+        """Delete the scratch dirs of the runs on this host that no longer exist"""
+        prefix = "%s.%s." % (SCRATCH_DIR_PREFIX, self.hostname)
+        for entry in os.scandir(self.base_dir):
+            if not entry.name.startswith(prefix):
+                continue
+            try:
+                pid = int(entry.name[len(prefix) :].split(".")[0])
+            except ValueError:
+                continue
+            if not pid_exists(pid):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def usage(self):
+        """Expected footprint of the cases currently in the scratch area, in MB"""
+        return sum(self.cases.values())
+
+    def ram_usage(self):
+        """Same as usage(), but only when the scratch area takes up RAM"""
+        return self.usage() if self.in_ram else 0
+
+    def acquire(self, case_dir):
+        """Materialize the case in the scratch area and return the path of the copy,
+        or return the original case dir if it doesn't fit"""
+        footprint = self.max_footprint
+        if footprint is None:
+            footprint = 2 * tree_size(case_dir, follow_symlinks=True)
+        st = os.statvfs(self.base_dir)
+        free = st.f_bavail * st.f_frsize / 2**20
+        if self.usage() + footprint > self.max_size or footprint > free:
+            self.nfallback += 1
+            return case_dir
+        if self.run_dir is None:
+            self.run_dir = tempfile.mkdtemp(
+                prefix="%s.%s.%d." % (SCRATCH_DIR_PREFIX, self.hostname, os.getpid()),
+                dir=self.base_dir,
+            )
+        scratch_case = os.path.join(self.run_dir, os.path.basename(case_dir))
+        try:
+            materialize(case_dir, scratch_case)
+        except OSError as e:  # e.g., the filesystem got full
+            print("WARNING: could not copy %s to the scratch area (%s)" % (case_dir, e))
+            shutil.rmtree(scratch_case, ignore_errors=True)
+            self.nfallback += 1
+            return case_dir
+        self.cases[scratch_case] = footprint
+        return scratch_case
+
+    def measure(self, scratch_case):
+        """Take the current footprint of a case into account for the next ones"""
+        if scratch_case not in self.cases:
+            return
+        footprint = tree_size(scratch_case)
+        if self.max_footprint is None or footprint > self.max_footprint:
+            self.max_footprint = footprint
+
+    def release(self, scratch_case):
+        """Delete the scratch copy of a case (a no-op for cases run in place)"""
+        if scratch_case not in self.cases:
+            return
+        self.measure(scratch_case)
+        shutil.rmtree(scratch_case, ignore_errors=True)
+        del self.cases[scratch_case]
+
+    def close(self):
+        """Delete the whole scratch dir of this run"""
+        if self.run_dir is not None:
+            shutil.rmtree(self.run_dir, ignore_errors=True)
+        self.run_dir = None
+        self.cases.clear()
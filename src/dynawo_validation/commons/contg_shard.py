@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_shard.py:
+#
+# Helpers for splitting a very large campaign into independent shards (see
+# run_pipeline.sh, options --shard and --merge), each of which is run into a results
+# dir of its own, possibly on a different host, and for merging the results of all
+# the shards afterwards, just as if the campaign had been run in one go. A shard is
+# given by a SPEC:
+#
+#   * device:DEV[,DEV...]: the contingencies of these types of device only
+#
+#   * hash:K/N: the K-th of N shards (1 <= K <= N), by a stable hash of the name of
+#     each contingency case
+#
+#   * region:K/N: same, but hashing only the substation code of each element (its
+#     first MIN_SIMILAR_PREFIX characters, see contg_runtimes.py), so that all the
+#     contingencies around a substation go to the same shard
+#
+# Every shard creates the same set of contingencies as the whole campaign would
+# (including its random sample, unless it is a different random one each time),
+# and then skips those belonging to other shards, so the shards never overlap and,
+# all together, cover the whole campaign. The no-contingency case of each type of
+# device (e.g. gen#NOCONTINGENCY, which the DynaFlow create scripts always create)
+# belongs to the first of the hash: and region: shards.
+#
+# Subcommands:
+#
+#   * devices SPEC DEVICE...: prints the given types of device that belong to the
+#     shard
+#
+#   * exclude SPEC [NOCONTINGENCY_CASE]: reads the output of a dry run of a
+#     create_*_contg.py script from stdin, and prints the names of the cases that do
+#     NOT belong to the shard (to be skipped with its option --exclude), including
+#     the given no-contingency case, if any (it isn't listed in the dry run)
+#
+#   * merge RESULTS_BASEDIR SHARD_RESULTS_BASEDIR...: merges the results of the
+#     shards into RESULTS_BASEDIR. For each type of device, the job ledgers are
+#     merged, the results of each case (pf_sol, crv, aut, etc.) are linked, and the
+#     aggregated tables (metrics, automata changes) are concatenated, since all of
+#     them have one row (or a few) per contingency. The weights and thresholds for
+#     the scores, the launchers used, and the runtime history are merged too. The
+#     rest (top 10 diffs and notebooks) is then done by run_pipeline.sh.
+#
+
+import csv
+import filecmp
+import os
+import shutil
+import sys
+import zlib
+import numpy as np
+import pandas as pd
+from dynawo_validation.commons.contg_ledger import (
+    LEDGER_COLUMNS,
+    LEDGER_FILE,
+    ledger_files,
+)
+from dynawo_validation.commons.contg_runtimes import (
+    MIN_SIMILAR_PREFIX,
+    RUNTIMES_FILE,
+    split_case_name,
+)
+
+
+SHARD_FILE = "shard.txt"
+NOCONTINGENCY = "NOCONTINGENCY"
+WEIGHTS_FILE = "score_weights.csv"
+LAUNCHER_MARKER = ".LAUNCHER_"
+# The dirs of aggregated results of a device, which are not linked but merged
+AGGREGATE_SUBDIRS = ["pf_metrics", "metrics", "notebooks"]
+# Aggregated tables, merged by concatenating their rows:
+#    path in the device dir --> (options of read_csv, options of to_csv)
+TABLES = {
+    "pf_metrics/metrics.csv.xz": ({"index_col": 0}, {"compression": "xz"}),
+    "aut/SIMULATOR_A_AUT_CHANGES.csv": ({"sep": ";", "index_col": 0}, {"sep": ";"}),
+    "aut/SIMULATOR_B_AUT_CHANGES.csv": ({"sep": ";", "index_col": 0}, {"sep": ";"}),
+    "aut/TAP_CHANGES.csv": ({"sep": ";", "index_col": 0}, {"sep": ";"}),
+    "aut/PSTAP_CHANGES.csv": ({"sep": ";", "index_col": 0}, {"sep": ";"}),
+    "metrics/crv_reducedparams.csv": (
+        {"sep": ";", "dtype": str},
+        {"sep": ";", "index": False},
+    ),
+    "metrics/aut_diffmetrics.csv": (
+        {"sep": ";", "dtype": str},
+        {"sep": ";", "index": False},
+    ),
+    "metrics/aut_tw_diffmetrics.csv": (
+        {"sep": ";", "dtype": str},
+        {"sep": ";", "index": False},
+    ),
+}
+# (written by np.savetxt, with a header)
+BAD_CASES_FILE = "metrics/bad_cases.csv"
+BAD_CASES_HEADER = (
+    "Cases where the simulation time span doesn't match "
+    "(probably because of integration error)"
+)
+
+
+def parse_shard(spec):
+    """(kind, value) of a shard SPEC, where value is (K, N) or a list of devices"""
+    kind, _, value = spec.partition(":")
+    if kind == "device" and value != "":
+        return kind, value.split(",")
+    if kind in ("hash", "region"):
+        try:
+            k, n = [int(x) for x in value.split("/")]
+        except ValueError:
+            k, n = 0, 0
+        if 1 <= k <= n:
+            return kind, (k, n)
+    raise ValueError(
+        "Bad shard spec: %s (use device:DEV[,DEV...], hash:K/N or region:K/N)" % spec
+    )
+
+
+def in_shard(shard, case_name):
+    kind, value = shard
+    device, element = split_case_name(case_name)
+    if kind == "device":
+        return device in value
+    k, n = value
+    if element == NOCONTINGENCY:
+        return k == 1
+    if kind == "hash":
+        key = case_name
+    else:
+        key = element[:MIN_SIMILAR_PREFIX]
+    return zlib.crc32(key.encode()) % n == k - 1
+
+
+def check_shards(specs):
+    """Warn about the shards that are missing or repeated, as far as we can tell"""
+    shards = [parse_shard(spec) for spec in specs]
+    kinds = set(x[0] for x in shards)
+    if len(kinds) > 1:
+        print("WARNING: merging shards of different kinds: %s" % ", ".join(specs))
+        return
+    if kinds == {"device"}:
+        devices = [dev for shard in shards for dev in shard[1]]
+        repeated = set(dev for dev in devices if devices.count(dev) > 1)
+        if repeated:
+            raise ValueError("Device shards overlap on: %s" % ", ".join(repeated))
+        return
+    n = set(x[1][1] for x in shards)
+    if len(n) > 1:
+        raise ValueError("Merging shards of different splits: %s" % ", ".join(specs))
+    n = n.pop()
+    ks = [x[1][0] for x in shards]
+    if len(set(ks)) != len(ks):
+        raise ValueError("The same shard is given twice: %s" % ", ".join(specs))
+    missing = sorted(set(range(1, n + 1)) - set(ks))
+    if missing:
+        print(
+            "WARNING: %d of the %d shards are missing (%s): the results will be "
+            "incomplete" % (len(missing), n, ", ".join(str(k) for k in missing))
+        )
+
+
+def merge_ledgers(device_dirs, merged_dir):
+    """Merge the job ledgers, checking that no case was run by two shards"""
+    rows = []
+    case_shard = dict()
+    for device_dir in device_dirs:
+        for file in ledger_files(os.path.join(device_dir, LEDGER_FILE)):
+            if not os.path.isfile(file):
+                continue
+            with open(file, newline="") as f:
+                for row in csv.DictReader(f, delimiter=";"):
+                    shard = case_shard.setdefault(row["CONTG_CASE"], device_dir)
+                    if shard != device_dir:
+                        raise ValueError(
+                            "Case %s was run by two shards: %s and %s"
+                            % (row["CONTG_CASE"], shard, device_dir)
+                        )
+                    rows.append(row)
+    rows.sort(key=lambda x: float(x["TIME"]))
+    with open(os.path.join(merged_dir, LEDGER_FILE), "w", newline="") as f:
+        writer = csv.DictWriter(f, LEDGER_COLUMNS, delimiter=";")
+        writer.writeheader()
+        writer.writerows(rows)
+    return len(case_shard)
+
+
+def link_results(device_dirs, merged_dir):
+    """Link the results of each case (in all the non-aggregate subdirs)"""
+    nlinks = 0
+    for device_dir in device_dirs:
+        for subdir in sorted(os.listdir(device_dir)):
+            path = os.path.join(device_dir, subdir)
+            if not os.path.isdir(path) or subdir in AGGREGATE_SUBDIRS:
+                continue
+            os.makedirs(os.path.join(merged_dir, subdir), exist_ok=True)
+            for name in os.listdir(path):
+                if subdir + "/" + name in TABLES:
+                    continue
+                link = os.path.join(merged_dir, subdir, name)
+                if os.path.lexists(link):
+                    raise ValueError("%s is in more than one shard" % name)
+                os.symlink(os.path.abspath(os.path.join(path, name)), link)
+                nlinks += 1
+    return nlinks
+
+
+def merge_tables(device_dirs, merged_dir):
+    for table, (read_opts, write_opts) in TABLES.items():
+        files = [os.path.join(x, table) for x in device_dirs]
+        dfs = [pd.read_csv(x, **read_opts) for x in files if os.path.isfile(x)]
+        if len(dfs) == 0:
+            continue
+        # (the PF metrics are indexed by row number, the automata changes by name)
+        renumber = table == "pf_metrics/metrics.csv.xz"
+        df = pd.concat(dfs, axis=0, join="outer", ignore_index=renumber)
+        os.makedirs(os.path.dirname(os.path.join(merged_dir, table)), exist_ok=True)
+        df.to_csv(os.path.join(merged_dir, table), **write_opts)
+    bad_cases = []
+    for device_dir in device_dirs:
+        file = os.path.join(device_dir, BAD_CASES_FILE)
+        if os.path.isfile(file):
+            with open(file) as f:
+                bad_cases += [x.strip() for x in f if x.strip() and x[0] != "#"]
+    if os.path.isdir(os.path.join(merged_dir, os.path.dirname(BAD_CASES_FILE))):
+        np.savetxt(
+            os.path.join(merged_dir, BAD_CASES_FILE),
+            np.array(bad_cases, dtype=str),
+            fmt="%s",
+            header=BAD_CASES_HEADER,
+        )
+
+
+def merge_runtimes(shard_dirs, results_basedir):
+    rows = []
+    columns = None
+    for shard_dir in shard_dirs:
+        file = os.path.join(shard_dir, RUNTIMES_FILE)
+        if os.path.isfile(file):
+            with open(file, newline="") as f:
+                reader = csv.DictReader(f, delimiter=";")
+                columns = reader.fieldnames
+                rows += list(reader)
+    if columns is None:
+        return
+    rows.sort(key=lambda x: float(x["TIME"]))
+    with open(os.path.join(results_basedir, RUNTIMES_FILE), "w", newline="") as f:
+        writer = csv.DictWriter(f, columns, delimiter=";")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def merge_basedir_files(shard_dirs, results_basedir):
+    """The weights of the scores, and the launcher markers, must be the same"""
+    weights = [os.path.join(x, WEIGHTS_FILE) for x in shard_dirs]
+    weights = [x for x in weights if os.path.isfile(x)]
+    for file in weights[1:]:
+        if not filecmp.cmp(weights[0], file, shallow=False):
+            raise ValueError(
+                "The shards used different weights for the scores: %s vs. %s"
+                % (weights[0], file)
+            )
+    if weights:
+        shutil.copyfile(weights[0], os.path.join(results_basedir, WEIGHTS_FILE))
+    markers = None
+    for shard_dir in shard_dirs:
+        found = sorted(
+            x for x in os.listdir(shard_dir) if x.startswith(LAUNCHER_MARKER)
+        )
+        if markers is not None and found != markers:
+            raise ValueError("The shards were run with different launchers")
+        markers = found
+        for marker in found:
+            shutil.copyfile(
+                os.path.join(shard_dir, marker), os.path.join(results_basedir, marker)
+            )
+
+
+def merge(results_basedir, shard_dirs):
+    specs = []
+    for shard_dir in shard_dirs:
+        if not os.path.isdir(shard_dir):
+            raise ValueError("Shard results dir %s not found" % shard_dir)
+        spec_file = os.path.join(shard_dir, SHARD_FILE)
+        if not os.path.isfile(spec_file):
+            raise ValueError("%s is not the results dir of a shard" % shard_dir)
+        with open(spec_file) as f:
+            specs.append(f.read().strip())
+    check_shards(specs)
+    os.makedirs(results_basedir, exist_ok=True)
+    merge_basedir_files(shard_dirs, results_basedir)
+    merge_runtimes(shard_dirs, results_basedir)
+    devices = sorted(
+        set(
+            device
+            for shard_dir in shard_dirs
+            for device in os.listdir(shard_dir)
+            if os.path.isfile(os.path.join(shard_dir, device, LEDGER_FILE))
+        )
+    )
+    for device in devices:
+        device_dirs = [
+            os.path.join(x, device)
+            for x in shard_dirs
+            if os.path.isfile(os.path.join(x, device, LEDGER_FILE))
+        ]
+        merged_dir = os.path.join(results_basedir, device)
+        if os.path.exists(merged_dir):
+            raise ValueError("Merged results dir %s already exists" % merged_dir)
+        os.makedirs(merged_dir)
+        ncases = merge_ledgers(device_dirs, merged_dir)
+        nlinks = link_results(device_dirs, merged_dir)
+        merge_tables(device_dirs, merged_dir)
+        print(
+            "Merged %s: %d cases from %d shards (%d result files linked)"
+            % (device, ncases, len(device_dirs), nlinks)
+        )
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(
+            "Usage: %s devices SPEC DEVICE... | exclude SPEC [NOCONTINGENCY_CASE] | "
+            "merge RESULTS_BASEDIR SHARD_RESULTS_BASEDIR..." % sys.argv[0]
+        )
+        return 2
+    cmd = sys.argv[1]
+    try:
+        if cmd == "devices":
+            shard = parse_shard(sys.argv[2])
+            for device in sys.argv[3:]:
+                if shard[0] != "device" or device in shard[1]:
+                    print(device)
+        elif cmd == "exclude":
+            shard = parse_shard(sys.argv[2])
+            for line in sys.stdin:
+                if line.startswith("DRY_RUN_CASE="):
+                    case_name = line.rstrip("\n").split("=", 1)[1]
+                    if not in_shard(shard, case_name):
+                        print(case_name)
+            for case_name in sys.argv[3:4]:
+                if not in_shard(shard, case_name):
+                    print(case_name)
+        elif cmd == "merge" and len(sys.argv) > 3:
+            merge(sys.argv[2], sys.argv[3:])
+        else:
+            print("ERROR: unknown subcommand or missing arguments: %s" % cmd)
+            return 2
+    except ValueError as e:
+        print("ERROR: %s" % e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
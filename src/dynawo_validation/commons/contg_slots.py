@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_slots.py:
+#
+# A pool of job slots shared by several contingency schedulers running on the same
+# host (see contg_scheduler.py, option --slot-pool), so that the campaigns of many
+# basecases can be run at once without oversubscribing the machine (see
+# contg_campaign.py). Every scheduler takes a slot from the pool before starting a
+# job (two for a job running its A and B sides concurrently, one per
+# post-processing task), and gives it back once the job is done. Its layout is:
+#
+#    POOL_DIR/nslots      the total number of slots
+#    POOL_DIR/slots/NNN   one lock file per slot
+#    POOL_DIR/members/ID  one file per scheduler using the pool, containing its
+#                         demand (running plus queued jobs) and the slots it holds
+#
+# A slot is held by keeping an exclusive flock() on its file, and a member keeps a
+# shared flock() on its own file, so that nothing is left behind when a scheduler
+# dies: the kernel releases its locks, and its member file is removed by the others
+# (any member file that can be locked exclusively belongs to a dead scheduler).
+# Since flock() is not reliable on network filesystems, the pool dir must be local.
+#
+# Slots are shared fairly: the slots are split among the members by max-min
+# fairness on their demands (i.e., equal shares, except for members needing less
+# than that, whose leftovers go to the others), and a member can only take a slot
+# while it holds less than its share. Slots left over by the rounding of the shares
+# can be taken by anyone, once every member holds at least its share (or all it
+# asks for). Slots are never taken away from a running job: a member holding more
+# than its share (e.g. because another one just joined) simply does not get them
+# back once its jobs finish, until the shares are even again.
+#
+
+import fcntl
+import os
+import socket
+
+
+NSLOTS_FILE = "nslots"
+SLOT_NAME = "%03d"
+TMP_SUFFIX = ".tmp"
+
+
+def fair_shares(nslots, demands):
+    """Max-min fair split of nslots among the given demands (a dict by member)"""
+    shares = {member: 0 for member in demands}
+    pending = {member: demand for member, demand in demands.items() if demand > 0}
+    left = nslots
+    while pending and left >= len(pending):
+        share = left // len(pending)
+        for member, demand in list(pending.items()):
+            given = min(share, demand - shares[member])
+            shares[member] += given
+            left -= given
+            if shares[member] >= demand:
+                del pending[member]
+    return shares
+
+
+class SlotPool:
+    def __init__(self, pool_dir, member_id=None):
+        self.pool_dir = pool_dir
+        if member_id is None:
+            member_id = "%s-%d" % (socket.gethostname(), os.getpid())
+        self.member_id = member_id
+        with open(os.path.join(pool_dir, NSLOTS_FILE)) as f:
+            self.nslots = int(f.read())
+        self.held = []  # the open (and locked) slot files
+        self.demand = 0
+        # Locked before it appears, so that nobody takes us for dead
+        members_dir = os.path.join(pool_dir, "members")
+        os.makedirs(members_dir, exist_ok=True)
+        member_file = os.path.join(members_dir, self.member_id)
+        self.member_file = open(member_file + TMP_SUFFIX, "w")
+        fcntl.flock(self.member_file, fcntl.LOCK_SH)
+        self.publish()
+        os.replace(member_file + TMP_SUFFIX, member_file)
+
+    @staticmethod
+    def create(pool_dir, nslots):
+        """Create (or resize) a pool with the given number of slots"""
+        os.makedirs(os.path.join(pool_dir, "slots"), exist_ok=True)
+        os.makedirs(os.path.join(pool_dir, "members"), exist_ok=True)
+        for i in range(nslots):
+            open(os.path.join(pool_dir, "slots", SLOT_NAME % i), "a").close()
+        tmp_file = os.path.join(pool_dir, NSLOTS_FILE + TMP_SUFFIX)
+        with open(tmp_file, "w") as f:
+            f.write("%d\n" % nslots)
+        os.replace(tmp_file, os.path.join(pool_dir, NSLOTS_FILE))
+
+    def publish(self):
+        self.member_file.seek(0)
+        self.member_file.write("%d %d\n" % (self.demand, len(self.held)))
+        self.member_file.truncate()
+        self.member_file.flush()
+
+    def set_demand(self, demand):
+        if demand != self.demand:
+            self.demand = demand
+            self.publish()
+
+    def members(self):
+        """{member: (demand, held)} of all live members, removing the dead ones"""
+        members_dir = os.path.join(self.pool_dir, "members")
+        members = {}
+        for member in os.listdir(members_dir):
+            if member.endswith(TMP_SUFFIX):
+                continue
+            if member == self.member_id:
+                members[member] = (self.demand, len(self.held))
+                continue
+            path = os.path.join(members_dir, member)
+            try:
+                with open(path) as f:
+                    if self.is_dead(f):
+                        os.remove(path)
+                        continue
+                    demand, held = [int(x) for x in f.read().split()]
+            except (OSError, ValueError):
+                # Gone, or caught in the middle of an update
+                continue
+            members[member] = (demand, held)
+        return members
+
+    @staticmethod
+    def is_dead(f):
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return True
+
+    def may_take(self):
+        """Whether we may take one more slot, according to the fair shares"""
+        members = self.members()
+        shares = fair_shares(
+            self.nslots, {member: x[0] for member, x in members.items()}
+        )
+        held = len(self.held)
+        if held < shares[self.member_id]:
+            return True
+        # Leftovers: only once nobody is still below its share
+        return all(
+            x[1] >= shares[member]
+            for member, x in members.items()
+            if member != self.member_id
+        )
+
+    def take(self):
+        """Try to take one more slot; return True if we got it"""
+        if not self.may_take():
+            return False
+        for i in range(self.nslots):
+            f = open(os.path.join(self.pool_dir, "slots", SLOT_NAME % i))
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            self.held.append(f)
+            self.publish()
+            return True
+        return False
+
+    def hold(self, n):
+        """Try to hold exactly n slots, taking or giving back as needed; return
+        False (and keep the slots we had) if we can't get that many"""
+        nheld = len(self.held)
+        while len(self.held) < n:
+            if not self.take():
+                self.hold(nheld)
+                return False
+        while len(self.held) > n:
+            self.held.pop().close()
+            self.publish()
+        return True
+
+    def close(self):
+        self.hold(0)
+        os.remove(os.path.join(self.pool_dir, "members", self.member_id))
+        self.member_file.close()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_watchdog.py:
+#
+# Per-case limits enforced by the contingency scheduler (see contg_scheduler.py), so
+# that a simulator run that stalls (e.g. the solver gets stuck with tiny time steps,
+# or the process just hangs) cannot hold a job slot forever:
+#
+#   * a wall-clock limit
+#
+#   * a CPU-time limit, on the total CPU time used by the whole job (i.e., all the
+#     processes in its session, including the ones that have already finished)
+#
+#   * a no-progress limit: the job is considered hung when none of the files under
+#     its case dir (simulator logs, timeline, curves, etc.) have grown or been
+#     modified for that long
+#
+# Jobs exceeding any of these are killed, and recorded as "timeout" in the job
+# ledger (they are not retried).
+#
+
+import os
+
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+def session_cpu_time(sid):
+    """Total CPU time (in seconds) used by all processes of the given session"""
+    ticks = 0
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(os.path.join(entry.path, "stat")) as f:
+                stat = f.read()
+        except OSError:
+            continue  # the process has already finished
+        # The command name (2nd field) may contain spaces, so split after it
+        fields = stat[stat.rindex(")") + 2 :].split()
+        if int(fields[3]) != sid:
+            continue
+        # utime, stime, cutime, cstime (the latter two, of its waited-for children)
+        ticks += sum(int(x) for x in fields[11:15])
+    return ticks / CLK_TCK
+
+
+def progress_signature(case_dir):
+    """Something that changes whenever any file under the case dir grows or changes"""
+    total_size = 0
+    last_mtime = 0
+    for dirpath, _, filenames in os.walk(case_dir):
+        for filename in filenames:
+            try:
+                st = os.stat(os.path.join(dirpath, filename))
+            except OSError:
+                continue
+            total_size += st.st_size
+            last_mtime = max(last_mtime, st.st_mtime)
+    return total_size, last_mtime
+
+
+class Watchdog:
+    def __init__(self, timeout=None, cpu_limit=None, stall=None):
+        self.timeout = timeout
+        self.cpu_limit = cpu_limit
+        self.stall = stall
+
+    def enabled(self):
+        return any(x is not None for x in [self.timeout, self.cpu_limit, self.stall])
+
+    def check(self, job, now):
+        """Return the reason why the job should be killed, or None"""
+        if self.timeout is not None and now - job.t_start > self.timeout:
+            return "wall-clock limit of %ds exceeded" % self.timeout
+        if self.cpu_limit is not None:
+            cpu_time = session_cpu_time(job.proc.pid)
+            if cpu_time > self.cpu_limit:
+                return "CPU-time limit of %ds exceeded" % self.cpu_limit
+        if self.stall is not None:
+            progress = progress_signature(job.run_dir)
+            if progress != job.progress:
+                job.progress = progress
+                job.t_progress = now
+            elif now - job.t_progress > self.stall:
+                return "no progress in the last %ds" % self.stall
+        return None
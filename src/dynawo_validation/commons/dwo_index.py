@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# dwo_index.py:
+#
+# Indexes of the parsed Dynawo DYD and PAR trees of a BASECASE, for the
+# config_dynawo_*_contingency functions of the create_*_contg.py scripts. Instead of
+# scanning all the blackBoxModels, connects and parameter sets of the trees once per
+# contingency (which makes creating all the contingencies quadratic in the size of
+# the network), the elements that they look up or replace are indexed once, when
+# the BASECASE is parsed (see parse_basecase() in the common_funcs.py modules):
+#
+#   * the dynamic model of each generator, by its static ID
+#
+#   * the Event models currently in the DYD tree, and the connects to or from them,
+#     which each contingency replaces with those of its own Event
+#
+#   * the parameter sets, by their ID
+#
+# The indexes are kept up to date with the changes that each contingency makes to
+# the trees, which come out exactly as when scanning them.
+#
+
+from lxml import etree
+
+
+class DydIndex:
+    """Index of the models of a DYD tree that the contingencies look up or replace"""
+
+    def __init__(self, dyd_tree):
+        root = dyd_tree.getroot()
+        ns = etree.QName(root).namespace
+        self.generators = dict()  # staticId --> its (first) Generator model
+        self.events = []  # all the Event models in the tree
+        self.event_connects = []  # all the connects to or from them
+        for bbm in root.iterfind("./" + etree.QName(ns, "blackBoxModel").text):
+            if bbm.get("lib")[0:9] == "Generator":
+                self.generators.setdefault(bbm.get("staticId"), bbm)
+            elif bbm.get("lib")[0:5] == "Event":
+                self.events.append(bbm)
+        event_ids = {event.get("id") for event in self.events}
+        for cnx in root.iterfind("./" + etree.QName(ns, "connect").text):
+            if cnx.get("id1") in event_ids or cnx.get("id2") in event_ids:
+                self.event_connects.append(cnx)
+
+    def generator(self, static_id):
+        """The dynamic model of the generator (None if it has no dynamic model)"""
+        return self.generators.get(static_id)
+
+    def remove_events(self):
+        """Remove all the Event models, and all their connections; return the parIds
+        of the Events removed"""
+        old_parIds = [event.get("parId") for event in self.events]
+        for x in self.events + self.event_connects:
+            x.getparent().remove(x)
+        self.events = []
+        self.event_connects = []
+        return old_parIds
+
+    def add_event(self, event, connects):
+        """Keep track of a new Event model, and its connections"""
+        self.events.append(event)
+        self.event_connects += connects
+
+
+class ParIndex:
+    """Index of the parameter sets of a PAR tree"""
+
+    def __init__(self, par_tree):
+        root = par_tree.getroot()
+        ns = etree.QName(root).namespace
+        self.parsets = dict()  # id --> the sets with that id
+        for parset in root.iterfind("./" + etree.QName(ns, "set").text):
+            self.parsets.setdefault(parset.get("id"), []).append(parset)
+
+    def remove_sets(self, ids):
+        """Remove all the sets with the given ids"""
+        for parset_id in ids:
+            for parset in self.parsets.pop(parset_id, []):
+                parset.getparent().remove(parset)
+
+    def add_set(self, parset):
+        """Keep track of a new set"""
+        self.parsets.setdefault(parset.get("id"), []).append(parset)
@@ -0,0 +1,91 @@
+#!/bin/bash
+#
+# run_shared_prefix.sh:
+#
+# Given a BASECASE, it creates a copy of it (the "prefix case") and simulates it
+# from startTime until just before the contingency event time, dumping its final
+# state, so that all contingency cases can then start from there instead of
+# simulating the same undisturbed interval over and over again (see
+# shared_prefix.py and run_one_contg.sh's option --prefix). The prefix is run for
+# each of the given Dynawo JOB files (e.g. JOB_A and JOB_B, in Dynawo-vs-Dynawo
+# cases), each one with its own launcher, since the dumped state is specific to
+# the Dynawo version that produced it.
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+
+# We source ~/.bashrc in order to make the user's aliases visible here
+if [ -f "$HOME/.bashrc" ]; then
+  # shellcheck source=/dev/null
+  source "$HOME/.bashrc"
+fi
+
+# For saner programming:
+set -o nounset
+set -o errexit -o pipefail
+
+
+usage()
+{
+    cat <<EOF
+
+Usage: $0 BASECASE PREFIX_CASE CASE_PREFIX T_EVENT JOB_FILE LAUNCHER [JOB_FILE LAUNCHER]
+  Creates PREFIX_CASE as a copy of BASECASE, and runs each JOB_FILE in it (with the
+  given launcher) up to just before T_EVENT, with the curves of all contingency cases
+  CASE_PREFIX* (found next to PREFIX_CASE).
+
+EOF
+}
+
+
+set_launcher() {
+    COMMAND_TYPE=$(type -t "$1" || true)  # OR trick to avoid non-zero exit status (because of errexit)
+    case "$COMMAND_TYPE" in
+        "file")
+            # standard executable file
+            LAUNCHER=$1
+            ;;
+        "alias")
+            # aliases cannot be directly invoked from a variable
+            LAUNCHER=${BASH_ALIASES[$1]}
+            ;;
+        "function")
+            # functions can be invoked just as regular executable files
+            LAUNCHER=$1
+            ;;
+        *)
+            echo "*** ERROR: launcher $1 not found"
+            exit 2
+            ;;
+    esac
+}
+
+
+if [[ $# -lt 6 ]] || [[ $(( $# % 2 )) -ne 0 ]]; then
+    usage
+    exit 4
+fi
+BASECASE=$1
+PREFIX_CASE=$2
+CASE_PREFIX=$3
+T_EVENT=$4
+shift 4
+
+SHARED_PREFIX_SCRIPT=$(cd "$(dirname "$0")" && pwd)/shared_prefix.py
+rm -rf "$PREFIX_CASE"
+cp -a "$BASECASE" "$PREFIX_CASE"
+while [[ $# -gt 0 ]]; do
+    JOB_FILE=$1
+    set_launcher "$2"
+    shift 2
+    python3 "$SHARED_PREFIX_SCRIPT" prepare "$PREFIX_CASE" "$JOB_FILE" "$T_EVENT" "$CASE_PREFIX"
+    RUNLOG=${JOB_FILE%.*}.runStdout
+    echo "Running the shared prefix: $PREFIX_CASE/$JOB_FILE"
+    (cd "$PREFIX_CASE" && $LAUNCHER jobs "$JOB_FILE" > "$RUNLOG" 2>&1) || true  # allow it to fail while using errexit flag
+    if ! python3 "$SHARED_PREFIX_SCRIPT" dump "$PREFIX_CASE" "$JOB_FILE" > /dev/null 2>&1; then
+        echo "Shared prefix run failed. Check Dynawo's log and the run-log: $PREFIX_CASE/$RUNLOG"
+        exit 1
+    fi
+done
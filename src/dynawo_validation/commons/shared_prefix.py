@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# shared_prefix.py:
+#
+# All the contingency cases derived from a BASECASE simulate exactly the same
+# undisturbed interval, from the simulation's startTime up to the time of the event
+# (event_tEvent, which the create_*_contg.py scripts take from the BASECASE). With
+# thousands of contingencies, that shared prefix is a large share of the total CPU.
+# This module supports simulating it just once (per Dynawo side), and starting every
+# contingency from the resulting dumped state:
+#
+#   * prepare: edits the JOB file of a copy of the BASECASE (the "prefix case") so
+#     that it stops at PREFIX_MARGIN seconds before the event, dumping its final
+#     state. Its CRV file becomes the union of the CRV files of all contingency
+#     cases, so that the prefix has all the curves that any of them may need.
+#
+#   * apply: writes a copy of the JOB file of a contingency case that starts at the
+#     end of the prefix, from its dumped state (Dynawo's initialState), and prints
+#     its name. The original JOB file is left untouched, so that the case (and its
+#     diffs w.r.t. the BASECASE) remain the same.
+#
+#   * stitch: once the contingency case has run, prepends the prefix part of the
+#     curves, the timeline and the constraints to its outputs, so that they look
+#     exactly as if the case had been simulated from startTime (all the metrics use
+#     the pre-event steady state too).
+#
+#   * dump: prints the path of the dumped state of a prefix case.
+#
+#   * covers: exits with 0 if the prefix case has been run, and it has all the curves
+#     of the contingency cases found next to it, so that it can be reused for them
+#     (e.g. for all the types of devices, see run_all_contg.sh's option -K).
+#
+# The prefix case itself is run by run_shared_prefix.sh, while the contingency cases
+# are applied and stitched by run_one_contg.sh (option --prefix).
+#
+# Usage:
+#
+#    shared_prefix.py prepare PREFIX_CASE JOB_FILE T_EVENT CASE_PREFIX
+#    shared_prefix.py dump PREFIX_CASE JOB_FILE
+#    shared_prefix.py covers PREFIX_CASE JOB_FILE CASE_PREFIX
+#    shared_prefix.py apply CONTG_CASE JOB_FILE PREFIX_CASE
+#    shared_prefix.py stitch CONTG_CASE JOB_FILE PREFIX_CASE
+#
+
+import glob
+import os
+import sys
+from lxml import etree
+
+
+PREFIX_MARGIN = 1.0  # the prefix stops this many seconds before the event
+OUTPUTS_AFTER_FINALSTATE = ["curves", "finalStateValues", "lostEquipments", "logs"]
+
+
+def last_job(job_tree):
+    root = job_tree.getroot()
+    ns = etree.QName(root).namespace
+    return root.findall("{%s}job" % ns)[-1], ns
+
+
+def write_xml(tree, xml_file):
+    tree.write(
+        xml_file,
+        pretty_print=True,
+        xml_declaration='<?xml version="1.0" encoding="UTF-8"?>',
+        encoding="UTF-8",
+    )
+
+
+def prefix_time(prefix_case, job_file):
+    """The time at which the prefix case stops (i.e., where the contingencies start)"""
+    job, ns = last_job(etree.parse(os.path.join(prefix_case, job_file)))
+    return float(job.find("{%s}simulation" % ns).get("stopTime"))
+
+
+def prefix_outputs_dir(prefix_case, job_file):
+    job, ns = last_job(etree.parse(os.path.join(prefix_case, job_file)))
+    return os.path.join(prefix_case, job.find("{%s}outputs" % ns).get("directory"))
+
+
+def prefix_dump_file(prefix_case, job_file):
+    dump_files = glob.glob(
+        os.path.join(prefix_outputs_dir(prefix_case, job_file), "finalState", "*.dmp")
+    )
+    if len(dump_files) != 1:
+        raise ValueError("No (single) dump file found for prefix case %s" % prefix_case)
+    return dump_files[0]
+
+
+def contg_crv_files(prefix_case, crv_file, case_prefix):
+    """The CRV files of the contingency cases, which are next to the prefix case"""
+    case_dir = os.path.dirname(os.path.abspath(prefix_case))
+    return [
+        os.path.join(case_dir, case, crv_file)
+        for case in sorted(os.listdir(case_dir))
+        if case.startswith(case_prefix)
+        and os.path.isfile(os.path.join(case_dir, case, crv_file))
+    ]
+
+
+def curve_keys(crv_file):
+    root = etree.parse(crv_file).getroot()
+    ns = etree.QName(root).namespace
+    return {(c.get("model"), c.get("variable")) for c in root.iter("{%s}curve" % ns)}
+
+
+def union_curves(crv_file, case_crv_files):
+    """Add to the CRV file all the curves found in any of the other CRV files"""
+    parser = etree.XMLParser(remove_blank_text=True)
+    crv_tree = etree.parse(crv_file, parser)
+    root = crv_tree.getroot()
+    ns = etree.QName(root).namespace
+    curves = {(c.get("model"), c.get("variable")) for c in root.iter("{%s}curve" % ns)}
+    for case_crv_file in case_crv_files:
+        case_root = etree.parse(case_crv_file, parser).getroot()
+        for curve in case_root.iter("{%s}curve" % ns):
+            key = (curve.get("model"), curve.get("variable"))
+            if key not in curves:
+                curves.add(key)
+                root.append(etree.Element("{%s}curve" % ns, model=key[0], variable=key[1]))
+    write_xml(crv_tree, crv_file)
+
+
+def prepare(prefix_case, job_file, t_event, case_prefix):
+    job_path = os.path.join(prefix_case, job_file)
+    job_tree = etree.parse(job_path, etree.XMLParser(remove_blank_text=True))
+    job, ns = last_job(job_tree)
+    simulation = job.find("{%s}simulation" % ns)
+    t_prefix = t_event - PREFIX_MARGIN
+    if t_prefix <= float(simulation.get("startTime")):
+        raise ValueError("The event is too close to the startTime for a shared prefix")
+    simulation.set("stopTime", str(t_prefix))
+
+    # Dump the final state
+    outputs = job.find("{%s}outputs" % ns)
+    final_state = outputs.find("{%s}finalState" % ns)
+    if final_state is None:
+        final_state = etree.Element("{%s}finalState" % ns, exportIIDMFile="false")
+        following = [outputs.find("{%s}%s" % (ns, x)) for x in OUTPUTS_AFTER_FINALSTATE]
+        following = [x for x in following if x is not None]
+        if following:
+            following[0].addprevious(final_state)
+        else:
+            outputs.append(final_state)
+    final_state.set("exportDumpFile", "true")
+    write_xml(job_tree, job_path)
+
+    # The curves needed by any of the contingency cases
+    curves = outputs.find("{%s}curves" % ns)
+    if curves is not None:
+        crv_file = curves.get("inputFile")
+        union_curves(
+            os.path.join(prefix_case, crv_file),
+            contg_crv_files(prefix_case, crv_file, case_prefix),
+        )
+
+
+def covers(prefix_case, job_file, case_prefix):
+    """Whether the prefix case has been run, with all the curves of the cases"""
+    try:
+        prefix_dump_file(prefix_case, job_file)
+    except (OSError, ValueError):
+        return False
+    job, ns = last_job(etree.parse(os.path.join(prefix_case, job_file)))
+    curves = job.find("{%s}outputs/{%s}curves" % (ns, ns))
+    if curves is None:
+        return True
+    crv_file = curves.get("inputFile")
+    prefix_curves = curve_keys(os.path.join(prefix_case, crv_file))
+    return all(
+        curve_keys(case_crv_file) <= prefix_curves
+        for case_crv_file in contg_crv_files(prefix_case, crv_file, case_prefix)
+    )
+
+
+def prefix_job_file(job_file):
+    stem, ext = os.path.splitext(job_file)
+    return stem + "-prefix" + ext
+
+
+def apply(contg_case, job_file, prefix_case):
+    job_tree = etree.parse(
+        os.path.join(contg_case, job_file), etree.XMLParser(remove_blank_text=True)
+    )
+    job, ns = last_job(job_tree)
+    job.find("{%s}simulation" % ns).set(
+        "startTime", str(prefix_time(prefix_case, job_file))
+    )
+    dump_file = os.path.relpath(prefix_dump_file(prefix_case, job_file), contg_case)
+    modeler = job.find("{%s}modeler" % ns)
+    initial_state = modeler.find("{%s}initialState" % ns)
+    if initial_state is None:
+        initial_state = etree.Element("{%s}initialState" % ns)
+        modeler.findall("{%s}dynModels" % ns)[-1].addnext(initial_state)
+    initial_state.set("file", dump_file)
+    write_xml(job_tree, os.path.join(contg_case, prefix_job_file(job_file)))
+    return prefix_job_file(job_file)
+
+
+def stitch_curves(crv_file, prefix_crv_file, t_prefix):
+    with open(prefix_crv_file) as f:
+        prefix_header = f.readline().rstrip("\n").split(";")
+        prefix_rows = []
+        for line in f:
+            row = line.rstrip("\n").split(";")
+            if float(row[0]) >= t_prefix:
+                break
+            prefix_rows.append(row)
+    with open(crv_file) as f:
+        header = f.readline().rstrip("\n").split(";")
+        rows = f.read()
+    # Curves not in the prefix (there shouldn't be any) take their first value
+    first_row = rows.split("\n", 1)[0].split(";")
+    prefix_cols = {var: i for i, var in enumerate(prefix_header)}
+    with open(crv_file, "w") as f:
+        f.write(";".join(header) + "\n")
+        for row in prefix_rows:
+            f.write(
+                ";".join(
+                    row[prefix_cols[var]] if var in prefix_cols else first_row[i]
+                    for i, var in enumerate(header)
+                )
+                + "\n"
+            )
+        f.write(rows)
+
+
+def stitch_xml(xml_file, prefix_xml_file, t_prefix):
+    """Prepend the elements (events, constraints) of the prefix to the XML file"""
+    parser = etree.XMLParser(remove_blank_text=True)
+    tree = etree.parse(xml_file, parser)
+    root = tree.getroot()
+    prefix_root = etree.parse(prefix_xml_file, parser).getroot()
+    prefix_elements = [
+        x
+        for x in prefix_root
+        if x.get("time") is not None and float(x.get("time")) < t_prefix
+    ]
+    for i, element in enumerate(prefix_elements):
+        root.insert(i, element)
+    write_xml(tree, xml_file)
+
+
+def stitch(contg_case, job_file, prefix_case):
+    job, ns = last_job(etree.parse(os.path.join(contg_case, job_file)))
+    outputs_dir = os.path.join(contg_case, job.find("{%s}outputs" % ns).get("directory"))
+    prefix_dir = prefix_outputs_dir(prefix_case, job_file)
+    t_prefix = prefix_time(prefix_case, job_file)
+    stitch_curves(
+        os.path.join(outputs_dir, "curves", "curves.csv"),
+        os.path.join(prefix_dir, "curves", "curves.csv"),
+        t_prefix,
+    )
+    for xml_file in ["timeLine/timeline.xml", "constraints/constraints.xml"]:
+        if os.path.isfile(os.path.join(outputs_dir, xml_file)) and os.path.isfile(
+            os.path.join(prefix_dir, xml_file)
+        ):
+            stitch_xml(
+                os.path.join(outputs_dir, xml_file),
+                os.path.join(prefix_dir, xml_file),
+                t_prefix,
+            )
+
+
+def main():
+    if len(sys.argv) == 6 and sys.argv[1] == "prepare":
+        prepare(sys.argv[2], sys.argv[3], float(sys.argv[4]), sys.argv[5])
+        return 0
+    if len(sys.argv) == 4 and sys.argv[1] == "dump":
+        print(prefix_dump_file(sys.argv[2], sys.argv[3]))
+        return 0
+    if len(sys.argv) == 5 and sys.argv[1] == "covers":
+        return 0 if covers(sys.argv[2], sys.argv[3], sys.argv[4]) else 1
+    if len(sys.argv) == 5 and sys.argv[1] == "apply":
+        print(apply(sys.argv[2], sys.argv[3], sys.argv[4]))
+        return 0
+    if len(sys.argv) == 5 and sys.argv[1] == "stitch":
+        stitch(sys.argv[2], sys.argv[3], sys.argv[4])
+        return 0
+    print("\nUsage: %s prepare PREFIX_CASE JOB_FILE T_EVENT CASE_PREFIX" % sys.argv[0])
+    print("       %s dump PREFIX_CASE JOB_FILE" % sys.argv[0])
+    print("       %s covers PREFIX_CASE JOB_FILE CASE_PREFIX" % sys.argv[0])
+    print("       %s apply CONTG_CASE JOB_FILE PREFIX_CASE" % sys.argv[0])
+    print("       %s stitch CONTG_CASE JOB_FILE PREFIX_CASE\n" % sys.argv[0])
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
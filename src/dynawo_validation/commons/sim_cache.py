@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# sim_cache.py:
+#
+# A local, content-addressed cache of simulation results, used by run_one_contg.sh
+# (when the environment variable DWO_VALIDATION_CACHE points to a cache dir) so that
+# identical simulations are not run again, e.g. when re-running a campaign after
+# changing only the scoring weights, or after fixing a bug in the aggregation steps.
+#
+# Each simulator *side* of a case (A or B) is cached separately, keyed by a hash of:
+#
+#   * the contents of all its input files: for Dynawo, the JOB file plus every file
+#     it references (IIDM, DYD, PAR, CRV, initial state...), plus the PAR files
+#     referenced from the DYD files; for Hades and Astre, all the files in their
+#     input dir (Hades/ or Astre/) before running
+#
+#   * the launcher: its version string (as output by "LAUNCHER version", for
+#     Dynawo), and its resolved path, size and modification time
+#
+# so that, for instance, a nightly run where only simulator B changed re-simulates
+# only side B. Each cache entry is a tar file with the raw outputs of the simulator
+# (relative to the case dir), so that the rest of the pipeline is unaffected.
+#
+# The input files that a case shares with the basecase (symlinks, such as the IIDM
+# file, which can take several hundred MB) would otherwise be hashed again for every
+# case and every side. Their digests are kept under CACHE_DIR/digests, keyed by their
+# real path, and reused as long as the file is not modified (same inode, size, and
+# modification and change times).
+#
+# Usage (from run_one_contg.sh):
+#
+#    sim_cache.py key CACHE_DIR CASE_DIR SIDE LAUNCHER [VERSION_STRING]
+#    sim_cache.py restore CACHE_DIR KEY CASE_DIR
+#    sim_cache.py store CACHE_DIR KEY CASE_DIR PATH [PATH ...]
+#
+# where SIDE is either "hades", "astre", or "dynawo:JOB_FILE".
+#
+
+import hashlib
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+from lxml import etree
+
+
+HASH_CHUNK = 1 << 20
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def shared_file_digest(cache_dir, path):
+    """Digest of a file shared by all cases, memoized in the cache dir"""
+    real_path = os.path.realpath(path)
+    st = os.stat(real_path)
+    stamp = "%d %d %d %d %d" % (
+        st.st_dev,
+        st.st_ino,
+        st.st_size,
+        st.st_mtime_ns,
+        st.st_ctime_ns,
+    )
+    name = hashlib.sha256(real_path.encode()).hexdigest()
+    memo_file = os.path.join(cache_dir, "digests", name[:2], name)
+    try:
+        with open(memo_file) as f:
+            memo_stamp, digest = f.read().rsplit(" ", 1)
+        if memo_stamp == stamp:
+            return digest
+    except (OSError, ValueError):
+        pass
+    digest = file_digest(real_path)
+    # (atomically, since concurrent jobs may be doing the same)
+    os.makedirs(os.path.dirname(memo_file), exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(memo_file), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write("%s %s" % (stamp, digest))
+    os.replace(tmp_file, memo_file)
+    return digest
+
+
+def referenced_files(case_dir, xml_file, attribs=None):
+    """Files (relative to the case dir) referenced by any attribute of the XML file"""
+    root = etree.parse(os.path.join(case_dir, xml_file)).getroot()
+    files = set()
+    for element in root.iter(etree.Element):
+        for attrib, value in element.attrib.items():
+            if attribs is not None and attrib not in attribs:
+                continue
+            if os.path.isfile(os.path.join(case_dir, value)):
+                files.add(os.path.normpath(value))
+    return files
+
+
+def dynawo_input_files(case_dir, job_file):
+    files = {os.path.normpath(job_file)}
+    files |= referenced_files(case_dir, job_file)
+    for dyd_file in [f for f in files if f.lower().endswith(".dyd")]:
+        files |= referenced_files(case_dir, dyd_file, attribs=["parFile"])
+    return files
+
+
+def dir_input_files(case_dir, input_dir):
+    files = set()
+    for dirpath, _, filenames in os.walk(os.path.join(case_dir, input_dir)):
+        for filename in filenames:
+            files.add(os.path.relpath(os.path.join(dirpath, filename), case_dir))
+    return files
+
+
+def launcher_signature(launcher, version_string=""):
+    signature = [version_string.strip()]
+    launcher_path = shutil.which(launcher)
+    if launcher_path is not None:
+        st = os.stat(launcher_path)
+        signature += [os.path.realpath(launcher_path), str(st.st_size), str(st.st_mtime)]
+    else:
+        signature.append(launcher)  # e.g. a shell function
+    return "\n".join(signature)
+
+
+def cache_key(cache_dir, case_dir, side, launcher, version_string=""):
+    if side == "hades":
+        files = dir_input_files(case_dir, "Hades")
+    elif side == "astre":
+        files = dir_input_files(case_dir, "Astre")
+    elif side.startswith("dynawo:"):
+        files = dynawo_input_files(case_dir, side[len("dynawo:") :])
+    else:
+        raise ValueError("Unknown simulator side: %s" % side)
+    h = hashlib.sha256()
+    h.update(side.split(":")[0].encode())
+    h.update(launcher_signature(launcher, version_string).encode())
+    for file in sorted(files):
+        path = os.path.join(case_dir, file)
+        if os.path.islink(path):
+            digest = shared_file_digest(cache_dir, path)
+        else:
+            digest = file_digest(path)
+        h.update(("\n%s:%s" % (file, digest)).encode())
+    return h.hexdigest()
+
+
+def entry_path(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], key + ".tar")
+
+
+def restore(cache_dir, key, case_dir):
+    """Extract the cached outputs into the case dir; return False if not cached"""
+    entry = entry_path(cache_dir, key)
+    if not os.path.isfile(entry):
+        return False
+    with tarfile.open(entry) as tar:
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(case_dir, filter="data")
+        else:
+            tar.extractall(case_dir, members=checked_members(tar, case_dir))
+    return True
+
+
+def checked_members(tar, case_dir):
+    """The members of the tar file, refusing any that would be extracted outside the
+    case dir (for the Python versions without extraction filters)"""
+    base = os.path.realpath(case_dir)
+
+    def inside(path):
+        return os.path.commonpath([base, os.path.realpath(path)]) == base
+
+    for member in tar.getmembers():
+        path = os.path.join(base, member.name)
+        if not (member.isfile() or member.isdir() or member.issym() or member.islnk()):
+            raise ValueError("unexpected member in cache entry: %s" % member.name)
+        if os.path.isabs(member.name) or not inside(path):
+            raise ValueError("member outside the case dir: %s" % member.name)
+        if member.issym() and not inside(
+            os.path.join(os.path.dirname(path), member.linkname)
+        ):
+            raise ValueError("link outside the case dir: %s" % member.name)
+        if member.islnk() and not inside(os.path.join(base, member.linkname)):
+            raise ValueError("link outside the case dir: %s" % member.name)
+        yield member
+
+
+def store(cache_dir, key, case_dir, paths):
+    entry = entry_path(cache_dir, key)
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    # Write to a temp file first, and then rename it (atomic), so that concurrent
+    # jobs never see a partially written entry
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(entry), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f, tarfile.open(fileobj=f, mode="w") as tar:
+            for path in paths:
+                tar.add(os.path.join(case_dir, path), arcname=os.path.normpath(path))
+        os.replace(tmp_file, entry)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def main():
+    if len(sys.argv) >= 6 and sys.argv[1] == "key":
+        version_string = sys.argv[6] if len(sys.argv) > 6 else ""
+        print(
+            cache_key(sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], version_string)
+        )
+        return 0
+    if len(sys.argv) == 5 and sys.argv[1] == "restore":
+        return 0 if restore(sys.argv[2], sys.argv[3], sys.argv[4]) else 1
+    if len(sys.argv) >= 6 and sys.argv[1] == "store":
+        store(sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5:])
+        return 0
+    print(
+        "\nUsage: %s key CACHE_DIR CASE_DIR SIDE LAUNCHER [VERSION_STRING]"
+        % sys.argv[0]
+    )
+    print("       %s restore CACHE_DIR KEY CASE_DIR" % sys.argv[0])
+    print("       %s store CACHE_DIR KEY CASE_DIR PATH [PATH ...]\n" % sys.argv[0])
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,7 @@ import pandas as pd
 import plotly.graph_objects as go
 from dynawo_validation.dynaflow.notebooks import create_graph
 from dynawo_validation.dynaflow.pipeline.common_funcs import calc_global_score
+from dynawo_validation.commons.contg_ledger import LEDGER_FILE, read_ledger
 from IPython.display import display, HTML, Markdown
 import ipydatagrid
 from ipywidgets import widgets, AppLayout
@@ -15,6 +16,13 @@ import os
 import copy
 
 
+# Read the cases that timed out (killed by the scheduler because they hung or took
+# too long, so they have no results)
+def read_timedout_cases(pf_dir):
+    ledger = read_ledger(pf_dir + "/" + LEDGER_FILE)
+    return sorted(case for case, row in ledger.items() if row["STATE"] == "timeout")
+
+
 # Read the metric file
 def read_csv_metrics(pf_dir):
     data = pd.read_csv(pf_dir + "/pf_metrics/metrics.csv.xz", index_col=0)
@@ -1658,6 +1666,7 @@ def show_displays(
     compscore_mean_n_pass,
     compscore_total_n_pass,
     DATA_LIMIT,
+    timedout_cases,
 ):
     display(
         HTML(
@@ -1680,6 +1689,9 @@ def show_displays(
             f"{compscore_p95_n_pass/compscore_total_n_pass:.1%} ({compscore_p95_n_pass} of {compscore_total_n_pass})\n"
             f"  * Number of cases that exceed the MEAN threshold: "
             f"{compscore_mean_n_pass/compscore_total_n_pass:.1%} ({compscore_mean_n_pass} of {compscore_total_n_pass})\n"
+            "  * Number of cases that timed out (hung or too slow; they have no results): "
+            f"{len(timedout_cases)}\n"
+            + "".join(f"    * {case}\n" for case in timedout_cases)
         )
     )
 
@@ -2806,6 +2818,7 @@ def run_all(
         compscore_mean_n_pass,
         compscore_total_n_pass,
         DATA_LIMIT,
+        read_timedout_cases(PF_SOL_DIR),
     )
 
     # Observe selection events to update graphics
@@ -33,6 +33,12 @@ parser.add_argument(
     "basecase",
     help="basecase directory",
 )
+parser.add_argument(
+    "--merge-previous",
+    action="store_true",
+    help="when resuming a run, add the diffs to the tables written by the previous "
+    "run, instead of overwriting them",
+)
 
 
 args = parser.parse_args()
@@ -181,56 +187,27 @@ def main():
             ):
                 data_files_list_sim_B_PSTAP_changes.append(i)
 
-    df_temp = read_aut_changes(aut_dir + data_files_list_sim_A[0])
-    temp_ind = list(df_temp.index)
-    temp_bus = list(df_temp.index)
-    for x in range(len(temp_ind)):
-        temp_ind[x] = data_files_list_sim_A[0][:rest_A] + "-" + temp_ind[x]
-        temp_bus[x] = data_files_list_sim_A[0][:rest_A]
-
-    df_temp["ID"] = temp_ind
-    df_temp["CONTG"] = temp_bus
-    df_temp.set_index("ID", inplace=True)
-    dataframeA = df_temp
-    os.remove(aut_dir + data_files_list_sim_A[0])
-
-    for j in data_files_list_sim_A[1:]:
-        df_temp = read_aut_changes(aut_dir + j)
-        temp_ind = list(df_temp.index)
-        temp_bus = list(df_temp.index)
-        for x in range(len(temp_ind)):
-            temp_ind[x] = j[:rest_A] + "-" + temp_ind[x]
-            temp_bus[x] = j[:rest_A]
-        df_temp["ID"] = temp_ind
-        df_temp["CONTG"] = temp_bus
-        df_temp.set_index("ID", inplace=True)
-        dataframeA = pd.concat([dataframeA, df_temp], axis=0, join="outer")
-        os.remove(aut_dir + j)
-
-    df_temp = read_aut_changes(aut_dir + data_files_list_sim_B[0])
-    temp_ind = list(df_temp.index)
-    temp_bus = list(df_temp.index)
-    for x in range(len(temp_ind)):
-        temp_ind[x] = data_files_list_sim_B[0][:rest_B] + "-" + temp_ind[x]
-        temp_bus[x] = data_files_list_sim_B[0][:rest_B]
-    df_temp["ID"] = temp_ind
-    df_temp["CONTG"] = temp_bus
-    df_temp.set_index("ID", inplace=True)
-    dataframeB = df_temp
-    os.remove(aut_dir + data_files_list_sim_B[0])
-
-    for j in data_files_list_sim_B[1:]:
-        df_temp = read_aut_changes(aut_dir + j)
-        temp_ind = list(df_temp.index)
-        temp_bus = list(df_temp.index)
-        for x in range(len(temp_ind)):
-            temp_ind[x] = j[:rest_B] + "-" + temp_ind[x]
-            temp_bus[x] = j[:rest_B]
-        df_temp["ID"] = temp_ind
-        df_temp["CONTG"] = temp_bus
-        df_temp.set_index("ID", inplace=True)
-        dataframeB = pd.concat([dataframeB, df_temp], axis=0, join="outer")
-        os.remove(aut_dir + j)
+    # The cases run now (when resuming, the tables written by the previous run
+    # already contain the rest, and their per-case diffs have been deleted). The
+    # per-case diffs are only deleted once all the tables are written, so that this
+    # can be run again if interrupted.
+    contgs = set([i[:rest_A] for i in data_files_list_sim_A])
+    contgs |= set([i[:rest_B] for i in data_files_list_sim_B])
+    contgs |= set([i[:-whatis] for i in data_files_list_sim_A_TAP_changes])
+    contgs |= set([i[:-whatis2] for i in data_files_list_sim_A_PSTAP_changes])
+
+    dataframeA = merge_table(
+        aut_dir + "SIMULATOR_A_AUT_CHANGES.csv",
+        collect_diffs(aut_dir, data_files_list_sim_A, rest_A),
+        lambda df: df["CONTG"].isin(contgs),
+        args.merge_previous,
+    )
+    dataframeB = merge_table(
+        aut_dir + "SIMULATOR_B_AUT_CHANGES.csv",
+        collect_diffs(aut_dir, data_files_list_sim_B, rest_B),
+        lambda df: df["CONTG"].isin(contgs),
+        args.merge_previous,
+    )
 
     dataframeA.to_csv(aut_dir + "SIMULATOR_A_AUT_CHANGES.csv", sep=";")
 
@@ -271,8 +248,6 @@ def main():
                 x_valuesTAP.append(df_B.iloc[i, 0])
                 y_valuesTAP.append(df_B.iloc[i, 1])
                 namesTAP.append(contgname + "#" + names_B[i])
-        os.remove(aut_dir + data_files_list_sim_A_TAP_changes[k])
-        os.remove(aut_dir + data_files_list_sim_B_TAP_changes[k])
 
     x_valuesPSTAP = []
     y_valuesPSTAP = []
@@ -300,17 +275,68 @@ def main():
             x_valuesPSTAP.append(df_B.iloc[i, 0])
             y_valuesPSTAP.append(df_B.iloc[i, 1])
             namesPSTAP.append(contgname + "#" + names_B[i])
-        os.remove(aut_dir + data_files_list_sim_A_PSTAP_changes[k])
-        os.remove(aut_dir + data_files_list_sim_B_PSTAP_changes[k])
 
     dataTAP = {"sim_A": x_valuesTAP, "sim_B": y_valuesTAP}
     dataPSTAP = {"sim_A": x_valuesPSTAP, "sim_B": y_valuesPSTAP}
-    df_TAP = pd.DataFrame(data=dataTAP, index=namesTAP)
-    df_PSTAP = pd.DataFrame(data=dataPSTAP, index=namesPSTAP)
+    prefixes = tuple([contg + "#" for contg in contgs])
+    df_TAP = merge_table(
+        aut_dir + "TAP_CHANGES.csv",
+        [pd.DataFrame(data=dataTAP, index=namesTAP)],
+        lambda df: [str(i).startswith(prefixes) for i in df.index],
+        args.merge_previous,
+    )
+    df_PSTAP = merge_table(
+        aut_dir + "PSTAP_CHANGES.csv",
+        [pd.DataFrame(data=dataPSTAP, index=namesPSTAP)],
+        lambda df: [str(i).startswith(prefixes) for i in df.index],
+        args.merge_previous,
+    )
 
     df_TAP.to_csv(aut_dir + "TAP_CHANGES.csv", sep=";")
     df_PSTAP.to_csv(aut_dir + "PSTAP_CHANGES.csv", sep=";")
 
+    for data_file in (
+        data_files_list_sim_A
+        + data_files_list_sim_B
+        + data_files_list_sim_A_TAP_changes
+        + data_files_list_sim_B_TAP_changes
+        + data_files_list_sim_A_PSTAP_changes
+        + data_files_list_sim_B_PSTAP_changes
+    ):
+        os.remove(aut_dir + data_file)
+
+
+def collect_diffs(aut_dir, data_files, rest):
+    """Read the per-case diffs, indexed by contingency and element"""
+    dataframes = []
+    for j in data_files:
+        df_temp = read_aut_changes(aut_dir + j)
+        temp_ind = list(df_temp.index)
+        temp_bus = list(df_temp.index)
+        for x in range(len(temp_ind)):
+            temp_ind[x] = j[:rest] + "-" + temp_ind[x]
+            temp_bus[x] = j[:rest]
+        df_temp["ID"] = temp_ind
+        df_temp["CONTG"] = temp_bus
+        df_temp.set_index("ID", inplace=True)
+        dataframes.append(df_temp)
+    return dataframes
+
+
+def merge_table(table_file, dataframes, is_rerun, merge_previous):
+    """With merge_previous (i.e., when resuming), add the new rows to the table
+    written by the previous run, if any, replacing the rows of the cases that have
+    been run again"""
+    if merge_previous and os.path.isfile(table_file):
+        df_old = pd.read_csv(table_file, sep=";", index_col=0)
+        if len(df_old) > 0:
+            dataframes = [df_old[[not r for r in is_rerun(df_old)]]] + [
+                df for df in dataframes if len(df) > 0
+            ]
+    if len(dataframes) == 0:
+        return pd.DataFrame()
+    return pd.concat(dataframes, axis=0, join="outer")
+
 
 def read_aut_changes(aut_dir):
     data = pd.read_csv(aut_dir, sep=";", index_col=0, compression="infer")
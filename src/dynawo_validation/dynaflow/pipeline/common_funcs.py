@@ -5,6 +5,16 @@ import glob
 import subprocess
 import pandas as pd
 from lxml import etree
+from dynawo_validation.commons.dwo_index import DydIndex, ParIndex
+from dynawo_validation.dynaflow.pipeline.dwo_jobinfo import (
+    is_dwohds,
+    is_dwodwo,
+    get_dwo_jobpaths,
+    get_dwo_tparams,
+    get_dwodwo_jobpaths,
+    get_dwodwo_tparams,
+)
+from dynawo_validation.dynaflow.pipeline.hades_patch import HadesPatcher
 from collections import namedtuple
 
 
@@ -236,7 +246,8 @@ def remove_case(dest_case):
 def parse_basecase(base_case, dwo_paths, asthds_path, dwo_pathsA, dwo_pathsB):
     Parsed_case = namedtuple(
         "Parsed_case",
-        "asthdsTree iidmTree parTree dydTree crvTree parTree_contg dydTree_contg",
+        "asthdsTree iidmTree parTree dydTree crvTree parTree_contg dydTree_contg"
+        " dydIndex parIndex_contg dydIndex_contg",
     )
     Parsed_dwodwo_case = namedtuple("Parsed_dwodwo_case", "A B")
 
@@ -274,6 +285,9 @@ def parse_basecase(base_case, dwo_paths, asthds_path, dwo_pathsA, dwo_pathsB):
             crvTree=crvTree,
             parTree_contg=parTree_contg,
             dydTree_contg=dydTree_contg,
+            dydIndex=DydIndex(dydTree),
+            parIndex_contg=ParIndex(parTree_contg),
+            dydIndex_contg=DydIndex(dydTree_contg),
         )
     else:
         iidmTreeA = etree.parse(
@@ -308,6 +322,9 @@ def parse_basecase(base_case, dwo_paths, asthds_path, dwo_pathsA, dwo_pathsB):
             crvTree=crvTreeA,
             parTree_contg=parTreeA_contg,
             dydTree_contg=dydTreeA_contg,
+            dydIndex=DydIndex(dydTreeA),
+            parIndex_contg=ParIndex(parTreeA_contg),
+            dydIndex_contg=DydIndex(dydTreeA_contg),
         )
 
         iidmTreeB = etree.parse(
@@ -342,11 +359,64 @@ def parse_basecase(base_case, dwo_paths, asthds_path, dwo_pathsA, dwo_pathsB):
             crvTree=crvTreeB,
             parTree_contg=parTreeB_contg,
             dydTree_contg=dydTreeB_contg,
+            dydIndex=DydIndex(dydTreeB),
+            parIndex_contg=ParIndex(parTreeB_contg),
+            dydIndex_contg=DydIndex(dydTreeB_contg),
         )
 
         return Parsed_dwodwo_case(A=parsed_caseA, B=parsed_caseB)
 
 
+def load_basecase(base_case, hades_path):
+    """Check whether it's a Dynawo-vs-Hades or a Dynawo-vs-Dynawo case, get the
+    Dynawo paths from the JOB file (and the simulation time params), and parse all
+    XML files in the basecase. Parsing is what dominates the startup of the
+    contingency-generating scripts, so the result is meant to be shared by all of
+    them when creating the cases of several device types (see create_all_contg.py)
+
+    """
+    Basecase = namedtuple(
+        "Basecase",
+        "dwohds dwo_paths dwo_tparams dwo_pathsA dwo_pathsB dwo_tparamsA dwo_tparamsB"
+        " parsed_case hades_patcher",
+    )
+    dwo_paths, dwo_tparams = (None, None)
+    dwo_pathsA, dwo_pathsB = (None, None)
+    dwo_tparamsA, dwo_tparamsB = (None, None)
+    if is_dwohds(base_case):
+        print(f"Creating contingencies from DYNAWO-vs-HADES case: {base_case}")
+        dwo_paths = get_dwo_jobpaths(base_case)
+        dwo_tparams = get_dwo_tparams(base_case)
+        dwohds = True
+    elif is_dwodwo(base_case):
+        print(f"Creating contingencies from DYNAWO-vs-DYNAWO case: {base_case}")
+        dwo_pathsA, dwo_pathsB = get_dwodwo_jobpaths(base_case)
+        dwo_tparamsA, dwo_tparamsB = get_dwodwo_tparams(base_case)
+        dwohds = False
+    else:
+        raise ValueError(f"Case {base_case} is neither an dwo-hds nor a dwo-dwo case")
+
+    parsed_case = parse_basecase(
+        base_case, dwo_paths, hades_path, dwo_pathsA, dwo_pathsB
+    )
+    # Index the Hades file, to write each case's as a patch of it (see hades_patch.py)
+    hades_patcher = None
+    if dwohds:
+        hades_patcher = HadesPatcher(base_case + hades_path, parsed_case.asthdsTree)
+
+    return Basecase(
+        dwohds=dwohds,
+        dwo_paths=dwo_paths,
+        dwo_tparams=dwo_tparams,
+        dwo_pathsA=dwo_pathsA,
+        dwo_pathsB=dwo_pathsB,
+        dwo_tparamsA=dwo_tparamsA,
+        dwo_tparamsB=dwo_tparamsB,
+        parsed_case=parsed_case,
+        hades_patcher=hades_patcher,
+    )
+
+
 def calc_global_score(df, W_V, W_P, W_Q, W_T, MAX_THRESH, MEAN_THRESH, P95_THRESH):
     df_all = df.loc[(df.volt_level == "ALL")]
     name_score = list(df_all["contg_case"])
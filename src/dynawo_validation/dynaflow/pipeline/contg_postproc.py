@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# contg_postproc.py:
+#
+# Given a contingency case that has already been run (and whose raw results have
+# already been collected by run_one_contg.sh), this performs all the per-case
+# post-processing steps: the automata diffs w.r.t. the BASECASE, the extraction of
+# the powerflow solution values, the extraction and grouping of the automata events,
+# and the compression of these results into the output directory.
+#
+# These steps used to be run by run_one_contg.sh as about ten separate python3
+# processes per case, each one paying the interpreter startup plus the pandas, lxml
+# and networkx imports, and re-parsing the same BASECASE files. Here all of them run
+# in-process. When used from the contingency scheduler (option --postproc of
+# contg_scheduler.py), postprocess() is called by a pool of persistent worker
+# processes, so that the import cost is paid once per worker, and the BASECASE
+# files are parsed just once per worker too (see the caches in
+# group_dwo_events.py and extract_hades_automata_changes_contgcase.py).
+#
+# It can also be used as a standalone script, with the same arguments as
+# run_one_contg.sh (this is what run_one_contg.sh does when run on its own):
+#
+#    contg_postproc.py [-c] [-o RESULTS] BASECASE CONTG_CASE
+#
+
+import argparse
+import lzma
+import os
+import shutil
+import sys
+from dynawo_validation.dynaflow.pipeline import (
+    extract_dynawo_automata_changes_contgcase,
+    extract_hades_automata_changes_contgcase,
+    extract_powerflow_values,
+    group_dwo_events,
+)
+from dynawo_validation.dynaflow.pipeline.dwo_jobinfo import is_dwohds
+from dynawo_validation.commons import extract_automata_changes
+
+
+parser = argparse.ArgumentParser(
+    description="Post-process the results of an already run contingency case"
+)
+parser.add_argument(
+    "-c",
+    "--cleanup",
+    action="store_true",
+    help="delete the contingency case after getting the results",
+)
+parser.add_argument(
+    "-o",
+    "--output",
+    default="RESULTS",
+    help="directory for collecting results (default: RESULTS)",
+)
+parser.add_argument("basecase", help="the BASECASE the contingency was derived from")
+parser.add_argument("contg_case", help="the contingency case")
+
+
+def run_script(module, *argv):
+    """Run the main() of one of the pipeline scripts, as if called from the shell"""
+    saved_argv = sys.argv
+    sys.argv = [module.__file__] + list(argv)
+    try:
+        retcode = module.main()
+    finally:
+        sys.argv = saved_argv
+    if retcode not in (None, 0):
+        raise ValueError(
+            "%s failed (exit code: %s)" % (os.path.basename(module.__file__), retcode)
+        )
+
+
+def compress(src_file, dst_file):
+    """Same as `xz -c9 SRC_FILE > DST_FILE`"""
+    with open(src_file, "rb") as f_in, lzma.open(dst_file, "wb", preset=9) as f_out:
+        shutil.copyfileobj(f_in, f_out)
+
+
+def postprocess(argv):
+    args = parser.parse_args(argv)
+    out_dir = args.output
+    contg_case = args.contg_case
+    prefix = os.path.basename(contg_case)
+    basecase_dir = os.path.join(out_dir, "..", os.path.basename(args.basecase)) + "/"
+    aut_dir = os.path.join(out_dir, "aut")
+    xml_dir = os.path.join(out_dir, "xml")
+    pf_sol_dir = os.path.join(out_dir, "pf_sol")
+    dwohds = is_dwohds(contg_case)
+
+    # Automata changes w.r.t. the BASECASE
+    if dwohds:
+        run_script(
+            extract_dynawo_automata_changes_contgcase,
+            "-s",
+            os.path.join(aut_dir, prefix + "-Dynawo-aut-diff.csv"),
+            os.path.join(xml_dir, prefix + "-Dynawo.IIDM.xml.xz"),
+            basecase_dir,
+        )
+        run_script(
+            extract_hades_automata_changes_contgcase,
+            "-s",
+            os.path.join(aut_dir, prefix + "-Hades-aut-diff.csv"),
+            os.path.join(xml_dir, prefix + "-Hades.Out.xml.xz"),
+            basecase_dir,
+            basecase_dir + "Hades/donneesEntreeHADES2.xml",
+        )
+    else:
+        for side in ["A", "B"]:
+            run_script(
+                extract_dynawo_automata_changes_contgcase,
+                "-s",
+                os.path.join(aut_dir, prefix + "-Dynawo%s-aut-diff.csv" % side),
+                os.path.join(xml_dir, prefix + "-Dynawo.IIDM%s.xml.xz" % side),
+                basecase_dir + side + "/",
+            )
+
+    # Extract the PF solution
+    print("Extracting the powerflow solutions for case: %s" % contg_case)
+    run_script(extract_powerflow_values, contg_case, os.path.join(out_dir, ".."))
+    compress(
+        os.path.join(contg_case, "pfsolution_AB.csv"),
+        os.path.join(pf_sol_dir, prefix + "_pfsolutionAB.csv.xz"),
+    )
+    for error_file in ["elements_not_in_caseA.csv", "elements_not_in_caseB.csv"]:
+        if os.path.isfile(os.path.join(contg_case, error_file)):
+            compress(
+                os.path.join(contg_case, error_file),
+                os.path.join(pf_sol_dir, prefix + "-" + error_file + ".xz"),
+            )
+
+    # Extract automata changes
+    run_script(extract_automata_changes, contg_case, os.path.join(out_dir, "..") + "/")
+    if dwohds:
+        aut_file = os.path.join(aut_dir, prefix + "-DynawoAutomata.csv.xz")
+        compress(os.path.join(contg_case, "Dynawo_automata_changes.csv"), aut_file)
+        run_script(
+            group_dwo_events,
+            aut_file,
+            basecase_dir,
+            os.path.join(aut_dir, prefix + "-aut-groups.csv"),
+            "0",
+        )
+    else:
+        for basecase_type, side in [("1", "A"), ("2", "B")]:
+            aut_file = os.path.join(aut_dir, prefix + "-DynawoAutomata%s.csv.xz" % side)
+            compress(
+                os.path.join(contg_case, "Dynawo%s_automata_changes.csv" % side),
+                aut_file,
+            )
+            run_script(
+                group_dwo_events,
+                aut_file,
+                basecase_dir,
+                os.path.join(aut_dir, prefix + "-aut%s-groups.csv" % side),
+                basecase_type,
+            )
+
+    # Delete input dir if cleanup was requested
+    if args.cleanup:
+        shutil.rmtree(contg_case)
+
+    return 0
+
+
+def main():
+    return postprocess(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
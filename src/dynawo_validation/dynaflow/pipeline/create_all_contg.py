@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# create_all_contg.py:
+#
+# Creates the contingency cases of several device types (by default, all of them:
+# shunt, load, gen and branchB) in one go, parsing the basecase only once. Otherwise,
+# each of the create_*_contg.py scripts parses the same files again (seven XML files
+# in a DynaFlow-vs-Hades case, twelve in a DynaFlow-vs-DynaFlow case), which is what
+# dominates their startup on large networks.
+#
+# The basecase is parsed here, and then a child process is forked for each device
+# type, one after the other, which runs the main() of its create script on the parsed
+# basecase (inherited as copy-on-write memory). Since the scripts modify the parsed
+# trees while creating their cases, each device type gets a pristine copy this way,
+# and its cases, its output and its total_*.csv file come out exactly as if its
+# script had been run on its own, with the same options.
+#
+# The options are those of the create scripts, passed on to each of them, except for
+# --max-ncases, which can also be given per device type (as DEVICE=N). With --outdir,
+# the output of each device type goes to the file OUTDIR/DEVICE.txt (e.g. for the dry
+# runs of run_pipeline.sh).
+#
+
+import os
+import sys
+import multiprocessing
+import argparse
+
+# Relative imports only work for proper Python packages, but we do not want (yet) to
+# structure all these as a package; we'd like to keep them as a collection of loose
+# Python scripts, at least for now (after all, this is not really a Python library). So
+# the following hack is ugly, but needed:
+sys.path.insert(
+    1, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+# Alternatively, you could set PYTHONPATH to PYTHONPATH="/<dir>/dynawo-validation-AIA"
+from dynawo_validation.dynaflow.pipeline import (
+    create_shunt_contg,
+    create_load_contg,
+    create_gen_contg,
+    create_branchB_contg,
+)  # noqa: E402
+from dynawo_validation.dynaflow.pipeline.common_funcs import load_basecase  # noqa: E402
+
+
+HADES_PATH = "/Hades/donneesEntreeHADES2.xml"
+
+CREATE_SCRIPTS = {
+    "shunt": create_shunt_contg,
+    "load": create_load_contg,
+    "gen": create_gen_contg,
+    "branchB": create_branchB_contg,
+}
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "-d",
+    "--devices",
+    default=",".join(CREATE_SCRIPTS),
+    help="comma-separated list of the device types to create (default: %(default)s)",
+)
+parser.add_argument(
+    "-t",
+    "--txt",
+    help="enter regular expressions or contingencies in text form, by default, "
+    "all possible contingencies will be generated (if below MAX_NCASES; "
+    "otherwise a random sample is generated)",
+)
+parser.add_argument(
+    "-v", "--verbose", help="increase output verbosity", action="store_true"
+)
+parser.add_argument(
+    "-l",
+    "--list",
+    help="enter regular expressions or contingencies in "
+    "string form separated with pipe(|)",
+)
+parser.add_argument(
+    "-a", "--allcontg", help="generate all the contingencies", action="store_true"
+)
+parser.add_argument(
+    "-r",
+    "--randomc",
+    help="generate a different random sample of contingencies",
+    action="store_true",
+)
+parser.add_argument(
+    "-p",
+    "--prandom",
+    help="generate a different random sample of contingencies with defined seed",
+)
+parser.add_argument(
+    "-x",
+    "--exclude",
+    help="file listing the contingency cases to skip (e.g. those already completed "
+    "by a run that is being resumed), one case name per line",
+)
+parser.add_argument(
+    "-m",
+    "--max-ncases",
+    action="append",
+    default=[],
+    help="limit the no. of contingency cases to about this many, via random "
+    "sampling, either as N (all device types) or as DEVICE=N; can be given several "
+    "times",
+)
+parser.add_argument(
+    "-n",
+    "--dry-run",
+    help="do not create the contingency cases, just list their names",
+    action="store_true",
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    default="1",
+    help="create this many contingency cases in parallel, either a number or a "
+    "percentage of the CPU cores (default: 1)",
+)
+parser.add_argument(
+    "-o",
+    "--outdir",
+    help="write the output of each device type to the file OUTDIR/DEVICE.txt",
+)
+parser.add_argument("base_case", help="enter base case directory")
+
+
+def parse_max_ncases(max_ncases, devices):
+    """Return the max. no. of cases of each device type, from the values of the
+    option --max-ncases (N, or DEVICE=N)"""
+    max_ncases_by_device = dict()
+    for value in max_ncases:
+        device, sep, ncases = value.rpartition("=")
+        if sep == "":
+            selected = devices
+        elif device in devices:
+            selected = [device]
+        else:
+            raise ValueError(f"unknown device type in --max-ncases: {value}")
+        try:
+            ncases = int(ncases)
+        except ValueError:
+            raise ValueError(f"not an integer in --max-ncases: {value}")
+        for x in selected:
+            max_ncases_by_device[x] = ncases
+    return max_ncases_by_device
+
+
+def device_argv(args, base_case, max_ncases):
+    """Command line of the create script of a device type, for these options"""
+    argv = []
+    if args.txt:
+        argv += ["-t", args.txt]
+    if args.verbose:
+        argv += ["-v"]
+    if args.list:
+        argv += ["-l", args.list]
+    if args.allcontg:
+        argv += ["-a"]
+    if args.randomc:
+        argv += ["-r"]
+    if args.prandom:
+        argv += ["-p", args.prandom]
+    if args.exclude:
+        argv += ["-x", args.exclude]
+    if max_ncases is not None:
+        argv += ["-m", str(max_ncases)]
+    if args.dry_run:
+        argv += ["-n"]
+    argv += ["-j", args.jobs, base_case]
+    return argv
+
+
+def create_device_cases(create_script, device_args, basecase, output_file):
+    """Child side: run the create script of a device type on the parsed basecase"""
+    if output_file is not None:
+        with open(output_file, "w") as f:
+            os.dup2(f.fileno(), sys.stdout.fileno())
+    sys.exit(create_script.main(device_args, basecase))
+
+
+def main():
+    args = parser.parse_args()
+    base_case = args.base_case
+    # remove a possible trailing slash
+    if base_case[-1] == "/":
+        base_case = base_case[:-1]
+
+    devices = [x for x in args.devices.split(",") if x != ""]
+    for device in devices:
+        if device not in CREATE_SCRIPTS:
+            raise ValueError(f"unknown device type: {device}")
+    max_ncases_by_device = parse_max_ncases(args.max_ncases, devices)
+
+    # Parse all XML files in the basecase, once for all device types
+    basecase = load_basecase(base_case, HADES_PATH)
+
+    failed = []
+    for device in devices:
+        create_script = CREATE_SCRIPTS[device]
+        device_args = create_script.parser.parse_args(
+            device_argv(args, base_case, max_ncases_by_device.get(device))
+        )
+        output_file = None
+        if args.outdir is not None:
+            output_file = os.path.join(args.outdir, device + ".txt")
+        else:
+            print(f"\n*** Creating the contingency cases of type: {device}\n")
+        # Or else the child would print again whatever is still in the buffer
+        sys.stdout.flush()
+        child = multiprocessing.get_context("fork").Process(
+            target=create_device_cases,
+            args=(create_script, device_args, basecase, output_file),
+        )
+        child.start()
+        child.join()
+        if child.exitcode != 0:
+            print(f"ERROR: the creation of the {device} cases failed", file=sys.stderr)
+            failed.append(device)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -46,11 +46,8 @@ import random
 import re
 import sys
 from collections import namedtuple
-from dynawo_validation.dynaflow.pipeline.common_funcs import (
-    copy_dwohds_basecase,
-    copy_dwodwo_basecase,
-    parse_basecase,
-)
+from dynawo_validation.commons.contg_create import create_cases
+from dynawo_validation.commons.contg_scheduler import parse_njobs
 from lxml import etree
 import pandas as pd
 from frozendict import frozendict
@@ -64,13 +61,10 @@ sys.path.insert(
     1, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 )
 # Alternatively, you could set PYTHONPATH to PYTHONPATH="/<dir>/dynawo-validation-AIA"
-from dynawo_validation.dynaflow.pipeline.dwo_jobinfo import (
-    is_dwohds,
-    is_dwodwo,
-    get_dwo_jobpaths,
-    get_dwo_tparams,
-    get_dwodwo_jobpaths,
-    get_dwodwo_tparams,
+from dynawo_validation.dynaflow.pipeline.common_funcs import (
+    copy_dwohds_basecase,
+    copy_dwodwo_basecase,
+    load_basecase,
 )  # noqa: E402
 
 
@@ -123,11 +117,45 @@ parser.add_argument(
     "--prandom",
     help="generate a different random sample of contingencies with defined seed",
 )
+parser.add_argument(
+    "-x",
+    "--exclude",
+    help="file listing the contingency cases to skip (e.g. those already completed "
+    "by a run that is being resumed), one case name per line",
+)
+parser.add_argument(
+    "-m",
+    "--max-ncases",
+    type=int,
+    help="limit the no. of contingency cases to about this many, via random "
+    "sampling (default: %d)" % MAX_NCASES,
+)
+parser.add_argument(
+    "-n",
+    "--dry-run",
+    help="do not create the contingency cases, just list their names",
+    action="store_true",
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    default="1",
+    help="create this many contingency cases in parallel, either a number or a "
+    "percentage of the CPU cores (default: 1)",
+)
+parser.add_argument(
+    "-s",
+    "--serve",
+    help="do not create the contingency cases up front, but just in time, as they "
+    "are requested on stdin (see commons/contg_create.py)",
+    action="store_true",
+)
 parser.add_argument("base_case", help="enter base case directory")
-args = parser.parse_args()
 
 
-def main():
+def main(args=None, basecase=None):
+    if args is None:
+        args = parser.parse_args()
     RNG_SEED = 42
     filter_list = []
     verbose = False
@@ -148,6 +176,10 @@ def main():
         RNG_SEED = random.randint(1, 1000)
     if args.prandom:
         RNG_SEED = int(args.prandom)
+    skip_cases = set()
+    if args.exclude:
+        with open(args.exclude) as f:
+            skip_cases = set(f.read().splitlines())
     # remove a possible trailing slash
     if base_case[-1] == "/":
         base_case = base_case[:-1]
@@ -157,27 +189,16 @@ def main():
 
     print("RNG_SEED used to create contingencies = " + str(RNG_SEED))
 
-    # Check whether it's a Dynawo-vs-Hades or a Dynawo-vs-Dynawo case
-    # And get the Dynawo paths from the JOB file, and the simulation time params
-    dwo_paths, dwohds = (None, None)
-    dwo_pathsA, dwo_pathsB = (None, None)
-    if is_dwohds(base_case):
-        print(f"Creating contingencies from DYNAWO-vs-HADES case: {base_case}")
-        dwo_paths = get_dwo_jobpaths(base_case)
-        dwo_tparams = get_dwo_tparams(base_case)
-        dwohds = True
-    elif is_dwodwo(base_case):
-        print(f"Creating contingencies from DYNAWO-vs-DYNAWO case: {base_case}")
-        dwo_pathsA, dwo_pathsB = get_dwodwo_jobpaths(base_case)
-        dwo_tparamsA, dwo_tparamsB = get_dwodwo_tparams(base_case)
-        dwohds = False
-    else:
-        raise ValueError(f"Case {base_case} is neither an dwo-hds nor a dwo-dwo case")
-
-    # Parse all XML files in the basecase
-    parsed_case = parse_basecase(
-        base_case, dwo_paths, HADES_PATH, dwo_pathsA, dwo_pathsB
-    )
+    # Parse all XML files in the basecase, unless the caller already did it for us
+    # (see create_all_contg.py, which creates the cases of all device types)
+    if basecase is None:
+        basecase = load_basecase(base_case, HADES_PATH)
+    dwohds = basecase.dwohds
+    dwo_paths, dwo_tparams = basecase.dwo_paths, basecase.dwo_tparams
+    dwo_pathsA, dwo_pathsB = basecase.dwo_pathsA, basecase.dwo_pathsB
+    dwo_tparamsA, dwo_tparamsB = basecase.dwo_tparamsA, basecase.dwo_tparamsB
+    parsed_case = basecase.parsed_case
+    hades_patcher = basecase.hades_patcher
 
     # Extract the list of all (active) LOADS in the Dynawo case
     if dwohds:
@@ -197,13 +218,14 @@ def main():
         dynawo_loads = matching_in_dwoB(dynawo_loads, dynawo_loadsB)
 
     # Prepare for random sampling if there's too many
+    max_ncases = MAX_NCASES if args.max_ncases is None else args.max_ncases
     if not args.allcontg:
-        sampling_ratio = MAX_NCASES / len(dynawo_loads)
+        sampling_ratio = max_ncases / len(dynawo_loads)
         random.seed(RNG_SEED)
         if len(filter_list) == 0 and sampling_ratio < 1:
             print(
                 "LIMITING to a sample of about %d cases (%.2f%% of all cases)"
-                % (MAX_NCASES, 100 * sampling_ratio)
+                % (max_ncases, 100 * sampling_ratio)
             )
     else:
         sampling_ratio = 1
@@ -213,7 +235,13 @@ def main():
     # We fix any device names with slashes in them (illegal filenames)
     contg_casedir = dirname + "/load#NOCONTINGENCY"
 
-    if dwohds:
+    if args.dry_run:
+        # Nothing gets written in a dry run
+        pass
+    elif os.path.basename(contg_casedir) in skip_cases:
+        # e.g. already completed, or run by another shard (see contg_shard.py)
+        pass
+    elif dwohds:
         # Copy the basecase (unchanged files and dir structure)
         copy_dwohds_basecase(base_case, dwo_paths, contg_casedir)
         dyd_file = contg_casedir + "/" + dwo_paths.dydFile_contg
@@ -303,11 +331,9 @@ def main():
             encoding="UTF-8",
         )
 
-    # This dict will keep track of which contingencies are actually processed
-    # It will also keep Hades's (P,Q) of each load
-    processed_loadsPQ = dict()
-
-    # Main loop: generate the contingency cases
+    # Select the contingency cases (serially, so that the random sample does not
+    # depend on the number of jobs)
+    contg_loads = []
     for load_name in dynawo_loads:
 
         # If the script was passed a list of load, filter for them here
@@ -319,6 +345,22 @@ def main():
         if len(filter_list) == 0 and random.random() > sampling_ratio:
             continue
 
+        # Skip the cases already completed (when resuming a previous run)
+        if "load#" + load_name.replace("/", "+") in skip_cases:
+            continue
+
+        # In a dry run, just list the case
+        if args.dry_run:
+            print("DRY_RUN_CASE=load#" + load_name.replace("/", "+"))
+            continue
+
+        contg_loads.append(load_name)
+
+    if args.dry_run:
+        print("DRY_RUN_ALL=%d" % len(dynawo_loads))
+        return 0
+
+    def create_load_case(load_name):
         print(
             "Generating contingency case for load %s (at bus: %s)"
             % (load_name, dynawo_loads[load_name].bus)
@@ -339,8 +381,8 @@ def main():
                 dynawo_loads[load_name],
             )
             # Modify the Hades case, and obtain the disconnected generation (P,Q)
-            processed_loadsPQ[load_name] = config_hades_load_contingency(
-                contg_casedir, parsed_case.asthdsTree, load_name
+            return config_hades_load_contingency(
+                contg_casedir, hades_patcher, load_name
             )
         else:
             # Copy the basecase (unchanged files and dir structure)
@@ -361,10 +403,19 @@ def main():
                 dynawo_loads[load_name],
             )
             # Get the disconnected generation (P,Q) for case B
-            processed_loadsPQ[load_name] = (
-                dynawo_loadsB[load_name].P,
-                dynawo_loadsB[load_name].Q,
-            )
+            return dynawo_loadsB[load_name].P, dynawo_loadsB[load_name].Q
+
+    case_dirs = None
+    if args.serve:
+        # Just in time: only as requested by the scheduler (see contg_create.py)
+        case_dirs = [dirname + "/load#" + x.replace("/", "+") for x in contg_loads]
+
+    # Main loop: generate the contingency cases (in parallel, see contg_create.py)
+    # This dict will keep track of which contingencies are actually processed
+    # It will also keep Hades's (P,Q) of each load
+    processed_loadsPQ = create_cases(
+        create_load_case, contg_loads, parse_njobs(args.jobs), case_dirs
+    )
 
     # Finally, save the (P,Q) values of disconnected loads in all *processed* cases
     save_total_loadpq(dirname, dwohds, dynawo_loads, processed_loadsPQ)
@@ -493,15 +544,9 @@ def config_dynawo_load_contingency(
     cnx_var2 = LOAD_MODELS[load_info.modelLib]
     param_eventname = "event_stateEvent1"
 
-    # Erase all existing Event models (keep the IDs to remove their
-    # connections later below)
-    old_eventIds = []
-    old_parIds = []
-    for event in root.iterfind(f"./{{{ns}}}blackBoxModel"):
-        if event.get("lib")[0:5] == "Event":
-            old_eventIds.append(event.get("id"))
-            old_parIds.append(event.get("parId"))
-            event.getparent().remove(event)
+    # Erase all existing Event models, and all their connections (keep their
+    # parIds to remove their parsets later below)
+    old_parIds = case_trees.dydIndex_contg.remove_events()
 
     # Declare a new Event
     event = etree.SubElement(root, f"{{{ns}}}blackBoxModel")
@@ -511,17 +556,13 @@ def config_dynawo_load_contingency(
     event.set("parFile", dwo_paths.parFile_contg)
     event.set("parId", "99991234")
 
-    # Erase all connections of the previous Events we removed above
-    for cnx in root.iterfind(f"./{{{ns}}}connect"):
-        if cnx.get("id1") in old_eventIds or cnx.get("id2") in old_eventIds:
-            cnx.getparent().remove(cnx)
-
     # Declare a new Connect between the Event model and the load
     cnx = etree.SubElement(root, f"{{{ns}}}connect")
     cnx.set("id1", event_id)
     cnx.set("var1", "event_state1_value")
     cnx.set("id2", cnx_id2)
     cnx.set("var2", cnx_var2)
+    case_trees.dydIndex_contg.add_event(event, [cnx])
 
     # Write out the DYD file, preserving the XML format
     dyd_tree.write(
@@ -540,9 +581,7 @@ def config_dynawo_load_contingency(
     root = par_tree.getroot()
 
     # Erase all existing parsets used by the Events removed above
-    for parset in root.iterfind("./set", root.nsmap):
-        if parset.get("id") in old_parIds:
-            parset.getparent().remove(parset)
+    case_trees.parIndex_contg.remove_sets(old_parIds)
 
     # The event time was already read from the BASECASE (taken from the first event)
     event_tEvent = str(round(dwo_tparams.event_tEvent))
@@ -559,6 +598,7 @@ def config_dynawo_load_contingency(
         etree.Element("{%s}par" % ns, type="BOOL", name=param_eventname, value="true")
     )
     root.append(new_parset)
+    case_trees.parIndex_contg.add_set(new_parset)
 
     # Write out the PAR file, preserving the XML format
     par_tree.write(
@@ -608,22 +648,15 @@ def config_dynawo_load_contingency(
     return
 
 
-def config_hades_load_contingency(casedir, hades_tree, load_name):
+def config_hades_load_contingency(casedir, hades_patcher, load_name):
     hades_file = casedir + HADES_PATH
     print("   Configuring file %s" % hades_file)
-    root = hades_tree.getroot()
 
     # Since Hades is a powerflow program, there is no "event" to configure. We simply
     # disconnect the generator by setting its noeud to "-1".
     # Find the load in Hades
-    hades_load = None
-    reseau = root.find("./reseau", root.nsmap)
-    donneesConsos = reseau.find("./donneesConsos", root.nsmap)
-    for g in donneesConsos.iterfind("./conso", root.nsmap):
-        if g.get("nom") == load_name:
-            hades_load = g
-            break
-    load_vars = hades_load.find("./variables", root.nsmap)
+    hades_load = hades_patcher.find("conso", load_name)
+    load_vars = hades_load.find("./variables", hades_load.nsmap)
     if hades_load.get("fixe") == "true":
         load_P = float(load_vars.get("peFixe"))
         load_Q = float(load_vars.get("qeFixe"))
@@ -631,20 +664,8 @@ def config_hades_load_contingency(casedir, hades_tree, load_name):
         load_P = float(load_vars.get("peAff"))
         load_Q = float(load_vars.get("qeAff"))
 
-    # Now disconnect it
-    bus_id = hades_load.get("noeud")
-    hades_load.set("noeud", "-1")
-
-    # Write out the Hades file, preserving the XML format
-    hades_tree.write(
-        hades_file,
-        pretty_print=True,
-        xml_declaration='<?xml version="1.0" encoding="ISO-8859-1"?>',
-        encoding="ISO-8859-1",
-        standalone=False,
-    )
-    # IMPORTANT: undo the changes we made, as we'll be reusing this parsed tree!
-    hades_load.set("noeud", bus_id)
+    # Now disconnect it, writing out a patched copy of the BASECASE Hades file
+    hades_patcher.write(hades_file, "conso", load_name, {"noeud": "-1"})
 
     return load_P, load_Q
 
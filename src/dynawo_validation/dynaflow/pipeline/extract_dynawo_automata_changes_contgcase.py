@@ -28,10 +28,9 @@ parser.add_argument(
     "-s", "--save", help="File to save csv instead of print", default="None"
 )
 
-args = parser.parse_args()
-
 
 def main():
+    args = parser.parse_args()
     xml_CONTGCASE = args.xml_CONTGCASE
 
     dwo_contgcase_tree = etree.parse(
@@ -13,6 +13,7 @@ import pandas as pd
 import copy
 import argparse
 import lzma
+from functools import lru_cache
 from lxml import etree
 
 sys.path.insert(
@@ -28,13 +29,12 @@ parser.add_argument(
     "-s", "--save", help="File to save csv instead of print", default="None"
 )
 
-args = parser.parse_args()
 
-
-def main():
-    xml_CONTGCASE = args.xml_CONTGCASE
-
-    tree = etree.parse(args.hades_basecase_xml)
+@lru_cache(maxsize=4)
+def get_tap2xfmr(hades_basecase_xml):
+    # Cached, since the post-processing worker pool calls this for every contingency
+    # case derived from the same BASECASE (see contg_postproc.py)
+    tree = etree.parse(hades_basecase_xml)
     root = tree.getroot()
     reseau = root.find("./reseau", root.nsmap)
     donneesQuadripoles = reseau.find("./donneesQuadripoles", root.nsmap)
@@ -47,6 +47,14 @@ def main():
         pstap_ID = branch.get("ptrdepha")
         if pstap_ID != "0" and pstap_ID is not None:
             pstap2xfmr[pstap_ID] = branch.get("nom")
+    return tap2xfmr, pstap2xfmr
+
+
+def main():
+    args = parser.parse_args()
+    xml_CONTGCASE = args.xml_CONTGCASE
+
+    tap2xfmr, pstap2xfmr = get_tap2xfmr(args.hades_basecase_xml)
 
     hds_contgcase_tree = etree.parse(
         lzma.open(xml_CONTGCASE), etree.XMLParser(remove_blank_text=True)
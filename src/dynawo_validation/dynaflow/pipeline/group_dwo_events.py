@@ -12,6 +12,7 @@ import argparse
 from lxml import etree
 import networkx as nx
 import math
+from functools import lru_cache
 from dynawo_validation.dynaflow.pipeline.dwo_jobinfo import (
     get_dwo_jobpaths,
     get_dwodwo_jobpaths,
@@ -40,10 +41,9 @@ parser.add_argument(
     help="Enter 0 for dwo, 1 for dwoA or 2 for dwoB",
 )
 
-args = parser.parse_args()
-
 
 def main():
+    args = parser.parse_args()
     dynawoautomata = args.dynawoautomata
     basecase_dir = args.basecase
     basecase_type = args.basecase_type
@@ -130,8 +130,16 @@ def filter_dwo_events(df):
     return aut_df
 
 
+# The BASECASE IIDM file and its graph are cached, since the post-processing worker
+# pool calls this for every contingency case of the same BASECASE (see
+# contg_postproc.py). Note that nothing here modifies them.
+@lru_cache(maxsize=4)
+def read_iidm(iidm_file):
+    return etree.parse(iidm_file, etree.XMLParser(remove_blank_text=True))
+
+
 def define_buses(aut_df, iidm_file):
-    iidmTree = etree.parse(iidm_file, etree.XMLParser(remove_blank_text=True))
+    iidmTree = read_iidm(iidm_file)
     root = iidmTree.getroot()
     ns = etree.QName(root).namespace
 
@@ -182,8 +190,9 @@ def define_buses(aut_df, iidm_file):
     return bus_names
 
 
+@lru_cache(maxsize=4)
 def create_graph(iidm_file):
-    iidmTree = etree.parse(iidm_file, etree.XMLParser(remove_blank_text=True))
+    iidmTree = read_iidm(iidm_file)
 
     # Create the graph
     G = nx.Graph()
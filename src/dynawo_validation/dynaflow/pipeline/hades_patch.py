@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# (c) Grupo AIA
+#     marinjl@aia.es
+#     omsg@aia.es
+#
+#
+# hades_patch.py:
+#
+# Writes the Hades input file of each contingency case as a byte-level patch of the
+# BASECASE file, instead of serializing the whole parsed Hades tree again. Since a
+# contingency only changes one or two attributes of a single element (e.g. the noeud
+# of a groupe, set to "-1"), the byte offsets of the start tags of all the elements
+# that may be disconnected (groupe, conso, shunt, quadripole) are indexed once, and
+# then each case's file is just a copy of the BASECASE file in which that start tag
+# has been spliced. The XML contents are the same as when serializing the modified
+# tree; only the formatting (indentation, quotes) is kept as in the BASECASE file.
+#
+# The index is cross-checked against the parsed tree (the same elements, in the same
+# order, with the same names). For any section of the file where that fails (e.g.
+# because of some unexpected markup), the patcher falls back to modifying the parsed
+# tree and serializing it, as before.
+#
+
+import html
+import re
+from xml.sax.saxutils import escape
+
+
+# The elements that can be disconnected, and the sections of the Hades file they're in
+SECTIONS = {
+    "groupe": "donneesGroupes",
+    "conso": "donneesConsos",
+    "shunt": "donneesShunts",
+    "quadripole": "donneesQuadripoles",
+}
+QNAME = rb"(?:[\w.-]+:)?"  # an optional namespace prefix
+ATTRIBUTE = re.compile(rb"\s([\w.:-]+)\s*=\s*(\"[^\"]*\"|'[^']*')")
+
+
+def start_tag_re(tag):
+    """A regex for the start tags of the given element (quoted '>' are skipped)"""
+    return re.compile(
+        rb"<" + QNAME + tag.encode() + rb"(?=[\s/>])(?:[^>\"']|\"[^\"]*\"|'[^']*')*>"
+    )
+
+
+class HadesPatcher:
+    """Writes copies of a Hades file with the attributes of one element changed"""
+
+    def __init__(self, hades_file, hades_tree):
+        self.hades_tree = hades_tree
+        self.encoding = hades_tree.docinfo.encoding or "UTF-8"
+        with open(hades_file, "rb") as f:
+            self.data = f.read()
+        self.elements = dict()  # (tag, name) --> element in the parsed tree
+        self.spans = dict()  # (tag, name) --> (start, end) of its start tag
+        root = hades_tree.getroot()
+        reseau = root.find("./reseau", root.nsmap)
+        for tag, section in SECTIONS.items():
+            parent = reseau.find("./" + section, root.nsmap)
+            if parent is None:
+                continue
+            elements = list(parent.iterfind("./" + tag, root.nsmap))
+            for element in elements:
+                # As when searching the tree, the first element with the name wins
+                self.elements.setdefault((tag, element.get("nom")), element)
+            spans = self.index_section(tag, section)
+            if [name for name, _ in spans] != [x.get("nom") for x in elements]:
+                print(
+                    "WARNING: could not index the %s elements in the Hades file"
+                    " (they'll be written by serializing the whole tree)" % tag
+                )
+                continue
+            for name, span in spans:
+                self.spans.setdefault((tag, name), span)
+
+    def index_section(self, tag, section):
+        """The (name, span) of the start tags of the elements in the section"""
+        begin = start_tag_re(section).search(self.data)
+        if begin is None:
+            return []
+        end = re.compile(rb"</" + QNAME + section.encode() + rb"\s*>").search(
+            self.data, begin.end()
+        )
+        if end is None:
+            return []
+        spans = []
+        for m in start_tag_re(tag).finditer(self.data, begin.end(), end.start()):
+            spans.append((self.attributes(m.group()).get("nom"), m.span()))
+        return spans
+
+    def attributes(self, start_tag):
+        """The attributes of a start tag, decoded"""
+        return {
+            name.decode(): html.unescape(value[1:-1].decode(self.encoding))
+            for name, value in ATTRIBUTE.findall(start_tag)
+        }
+
+    def find(self, tag, name):
+        """The element of the parsed tree (None if there's no such element)"""
+        return self.elements.get((tag, name))
+
+    def write(self, hades_file, tag, name, new_attrs):
+        """Write a copy of the Hades file, with the given attributes of the element
+        changed (or added)"""
+        span = self.spans.get((tag, name))
+        if span is None:
+            return self.write_tree(hades_file, self.elements[(tag, name)], new_attrs)
+        start, end = span
+        view = memoryview(self.data)
+        with open(hades_file, "wb") as f:
+            f.write(view[:start])
+            f.write(self.patch_start_tag(self.data[start:end], new_attrs))
+            f.write(view[end:])
+
+    def patch_start_tag(self, start_tag, new_attrs):
+        pending = dict(new_attrs)
+
+        def replace(m):
+            name = m.group(1).decode()
+            if name not in pending:
+                return m.group()
+            value = escape(pending.pop(name), {'"': "&quot;"})
+            return m.group()[: m.start(2) - m.start()] + self.quoted(value)
+
+        patched = ATTRIBUTE.sub(replace, start_tag)
+        if not pending:
+            return patched
+        # Those not present are added at the end
+        added = b"".join(
+            b" " + name.encode() + b"=" + self.quoted(escape(value, {'"': "&quot;"}))
+            for name, value in pending.items()
+        )
+        close = len(patched) - (2 if patched.endswith(b"/>") else 1)
+        return patched[:close].rstrip() + added + patched[close:]
+
+    def quoted(self, value):
+        return b'"' + value.encode(self.encoding, "xmlcharrefreplace") + b'"'
+
+    def write_tree(self, hades_file, element, new_attrs):
+        """Fallback: modify the parsed tree, serialize it, and undo the changes"""
+        old_attrs = {name: element.get(name) for name in new_attrs}
+        for name, value in new_attrs.items():
+            element.set(name, value)
+        # Write out the Hades file, preserving the XML format
+        self.hades_tree.write(
+            hades_file,
+            pretty_print=True,
+            xml_declaration='<?xml version="1.0" encoding="ISO-8859-1"?>',
+            encoding="ISO-8859-1",
+            standalone=False,
+        )
+        # IMPORTANT: undo the changes we made, as we'll be reusing this parsed tree!
+        for name, value in old_attrs.items():
+            if value is None:
+                del element.attrib[name]
+            else:
+                element.set(name, value)
@@ -62,9 +62,22 @@ Usage: $0 [OPTIONS] BASECASE CONTINGENCY_CASE
     -d | --debug    More debug messages
     -h | --help     This help message
     -o | --output   Specify a directory for collecting results (default: RESULTS)
+    -p | --no-postproc  Only run the case and collect its raw results, leaving the
+                        post-processing (see contg_postproc.py) to the caller
     -v | --verbose  More verbose output
     -A | --launcherA  Defines the launcher of simulator A
     -B | --launcherB  Defines the launcher of simulator B
+    -C | --concurrent Run the A and B simulations of the case concurrently
+    -S | --only-side  Only simulate this side (A or B); the results of the other side
+                      are restored from the ones already collected in the output dir
+                      (with "none", both sides are restored, and just post-processed)
+    -N | --no-restore With -S, don't restore the other side, and don't post-process:
+                      just collect the raw results of the simulated side
+    -x | --prefix     Start the Dynawo simulations from the state dumped by this shared
+                      prefix case (see run_shared_prefix.sh); absolute path
+    -z | --defer-compression  Don't compress the results, but just list them in
+                      CONTINGENCY_CASE/.compress_list, for the caller to compress them
+                      (see commons/contg_compress.py)
 
 EOF
 }
@@ -93,6 +106,44 @@ set_launcher() {
 }
 
 
+# Simulation results cache (see commons/sim_cache.py): enabled by pointing the
+# environment variable DWO_VALIDATION_CACHE to a cache dir. Each side of the case is
+# looked up separately, keyed on its input files and its launcher. These are called
+# from within the simulator's run dir, with the case dir given relative to it.
+cache_restore(){
+    CACHE_KEY=""
+    if [ -z "${DWO_VALIDATION_CACHE:-}" ]; then
+        return 1
+    fi
+    local version=""
+    if [ "${2:0:7}" = "dynawo:" ]; then
+        version=$($LAUNCHER version 2>&1 || true)
+    fi
+    CACHE_KEY=$(python3 "$SIM_CACHE_SCRIPT" key "$DWO_VALIDATION_CACHE" "$1" "$2" "$LAUNCHER" "$version")
+    if python3 "$SIM_CACHE_SCRIPT" restore "$DWO_VALIDATION_CACHE" "$CACHE_KEY" "$1"; then
+        echo "   (simulation results found in the cache: $CACHE_KEY)"
+        return 0
+    fi
+    return 1
+}
+
+# Compress a result into the output dir or, with option -z, just add it to the list
+# of results to be compressed later by the contingency scheduler, in the background
+# (see commons/contg_compress.py), so that this job doesn't have to wait for xz
+compress_result(){
+    if [ $z = "y" ]; then
+        echo "$1;$2" >> "$CONTG_CASE"/.compress_list
+    else
+        xz -c9 "$1" > "$2"
+    fi
+}
+
+cache_store(){
+    if [ -n "$CACHE_KEY" ]; then
+        python3 "$SIM_CACHE_SCRIPT" store "$DWO_VALIDATION_CACHE" "$CACHE_KEY" "$@" || true
+    fi
+}
+
 run_hades(){
     HADES_DIR="$CONTG_CASE"/Hades
     if [ ! -d "$HADES_DIR" ]; then
@@ -104,16 +155,19 @@ run_hades(){
     RUNLOG=Hades.RunStdout.txt
     echo "Running Hades for case: $CONTG_CASE"
     set_launcher "$1"
-    $LAUNCHER donneesEntreeHADES2.xml out.xml log.xml > "$RUNLOG" 2>&1
-    if [ ! -f out.xml ]; then
-        echo "Hades run failed. Check the run log: $HADES_DIR/$RUNLOG"
-        exit 1
+    if ! cache_restore .. hades; then
+        $LAUNCHER donneesEntreeHADES2.xml out.xml log.xml > "$RUNLOG" 2>&1
+        if [ ! -f out.xml ]; then
+            echo "Hades run failed. Check the run log: $HADES_DIR/$RUNLOG"
+            exit 1
+        fi
+        cache_store .. Hades/out.xml Hades/log.xml Hades/"$RUNLOG"
     fi
     # Collect and compress all results
     cd "$OLD_PWD"
-    xz -c9 "$HADES_DIR"/out.xml > "$outDir"/xml/"$prefix"-Hades.Out.xml.xz
-    xz -c9 "$HADES_DIR"/log.xml > "$outDir"/log/"$prefix"-Hades.Log.xml.xz
-    xz -c9 "$HADES_DIR/$RUNLOG" > "$outDir"/log/"$prefix"-"$RUNLOG".xz
+    compress_result "$HADES_DIR"/out.xml "$outDir"/xml/"$prefix"-Hades.Out.xml.xz
+    compress_result "$HADES_DIR"/log.xml "$outDir"/log/"$prefix"-Hades.Log.xml.xz
+    compress_result "$HADES_DIR/$RUNLOG" "$outDir"/log/"$prefix"-"$RUNLOG".xz
 }
 
 
@@ -127,25 +181,106 @@ run_dynawo(){
     RUNLOG=Dynawo"$1".runStdout
     echo "Running Dynawo for case: $CONTG_CASE"
     set_launcher "$2"
-    $LAUNCHER jobs "$DWO_JOBFILE" > "$RUNLOG" 2>&1 || true  # allow it to fail while using errexit flag
-    if [ ! -f ./"$DWO_OUTPUT_DIR"/curves/curves.csv ]; then
-        if [ -f ./"$DWO_OUTPUT_DIR"/curves/curves.xml ]; then
-            echo "Dynawo$1 run: output curves file found in XML format; required format is CSV"
-        else
-            echo "Dynawo$1 run: no curves output found. Check Dynawo's log and the run-log: $CONTG_CASE/$RUNLOG"
+    # With a shared prefix (option -x), a copy of the JOB that starts from its dumped
+    # state is run instead (see shared_prefix.py), and its outputs are then stitched
+    RUN_JOBFILE=$DWO_JOBFILE
+    if [ -n "$x" ]; then
+        RUN_JOBFILE=$(python3 "$SHARED_PREFIX_SCRIPT" apply . "$DWO_JOBFILE" "$x")
+    fi
+    if ! cache_restore . dynawo:"$RUN_JOBFILE"; then
+        $LAUNCHER jobs "$RUN_JOBFILE" > "$RUNLOG" 2>&1 || true  # allow it to fail while using errexit flag
+        if [ -n "$x" ]; then
+            rm -f "$RUN_JOBFILE"
         fi
-        exit 1
+        if [ ! -f ./"$DWO_OUTPUT_DIR"/curves/curves.csv ]; then
+            if [ -f ./"$DWO_OUTPUT_DIR"/curves/curves.xml ]; then
+                echo "Dynawo$1 run: output curves file found in XML format; required format is CSV"
+            else
+                echo "Dynawo$1 run: no curves output found. Check Dynawo's log and the run-log: $CONTG_CASE/$RUNLOG"
+            fi
+            exit 1
+        fi
+        if [ -n "$x" ]; then
+            python3 "$SHARED_PREFIX_SCRIPT" stitch . "$DWO_JOBFILE" "$x"
+        fi
+        cache_store . "$DWO_OUTPUT_DIR" "$RUNLOG"
+    fi
+    if [ -n "$x" ]; then
+        rm -f "$RUN_JOBFILE"
     fi
     # Collect and compress all results
     cd "$OLD_PWD"
     if [ -f "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/finalState/outputIIDM.xml ]; then
-        xz -c9 "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/finalState/outputIIDM.xml > "$outDir"/xml/"$prefix"-Dynawo.IIDM"$1".xml.xz
+        compress_result "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/finalState/outputIIDM.xml "$outDir"/xml/"$prefix"-Dynawo.IIDM"$1".xml.xz
+    fi
+    compress_result "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/curves/curves.csv           "$outDir"/crv/"$prefix"-DynawoCurves"$1".csv.xz
+    compress_result "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/constraints/constraints.xml "$outDir"/xml/"$prefix"-DynawoConstraints"$1".xml.xz
+    compress_result "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/timeLine/timeline.xml       "$outDir"/xml/"$prefix"-DynawoTimeLine"$1".xml.xz
+    compress_result "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/logs/dynawo.log             "$outDir"/log/"$prefix"-Dynawo"$1".log.xz
+    compress_result "$CONTG_CASE"/"$RUNLOG"                                     "$outDir"/log/"$prefix"-"$RUNLOG".xz
+}
+
+# When re-simulating only one side of a case (option -S), the raw results of the
+# other side are restored from the compressed ones already collected in the output
+# dir (by a previous run), so that the post-processing finds the usual case dir
+restore_hades(){
+    HADES_DIR="$CONTG_CASE"/Hades
+    echo "Restoring the Hades results for case: $CONTG_CASE"
+    xzcat "$outDir"/xml/"$prefix"-Hades.Out.xml.xz > "$HADES_DIR"/out.xml
+    xzcat "$outDir"/log/"$prefix"-Hades.Log.xml.xz > "$HADES_DIR"/log.xml
+}
+
+
+restore_dynawo(){
+    DWO_DIR="$CONTG_CASE"/"$DWO_OUTPUT_DIR"
+    echo "Restoring the Dynawo$1 results for case: $CONTG_CASE"
+    mkdir -p "$DWO_DIR"/finalState "$DWO_DIR"/curves "$DWO_DIR"/constraints "$DWO_DIR"/timeLine "$DWO_DIR"/logs
+    if [ -f "$outDir"/xml/"$prefix"-Dynawo.IIDM"$1".xml.xz ]; then
+        xzcat "$outDir"/xml/"$prefix"-Dynawo.IIDM"$1".xml.xz > "$DWO_DIR"/finalState/outputIIDM.xml
+    fi
+    xzcat "$outDir"/crv/"$prefix"-DynawoCurves"$1".csv.xz           > "$DWO_DIR"/curves/curves.csv
+    xzcat "$outDir"/xml/"$prefix"-DynawoConstraints"$1".xml.xz      > "$DWO_DIR"/constraints/constraints.xml
+    xzcat "$outDir"/xml/"$prefix"-DynawoTimeLine"$1".xml.xz         > "$DWO_DIR"/timeLine/timeline.xml
+    xzcat "$outDir"/log/"$prefix"-Dynawo"$1".log.xz                 > "$DWO_DIR"/logs/dynawo.log
+}
+
+# When running the A and B simulations of a case concurrently (option -C), each
+# side is started in the background and then waited for; otherwise, each side just
+# runs right away
+declare -a SIDE_PIDS=()
+start_side(){
+    if [ "$C" = "y" ]; then
+        "$@" &
+        SIDE_PIDS+=($!)
+    else
+        "$@"
+    fi
+}
+
+# Runs side A or B (i.e., the given run_* command), unless only the other side is
+# being simulated (option -S), in which case its results are restored instead (or
+# just skipped, with option -N)
+start_sim(){
+    local side=$1
+    shift
+    if [ -n "$S" ] && [ "$S" != "$side" ]; then
+        if [ $N = "n" ]; then
+            "${1/run_/restore_}" "${@:2}"
+        fi
+    else
+        start_side "$@"
+    fi
+}
+
+wait_sides(){
+    local pid rc=0
+    for pid in "${SIDE_PIDS[@]}"; do
+        wait "$pid" || rc=$?
+    done
+    SIDE_PIDS=()
+    if [ $rc -ne 0 ]; then
+        exit $rc
     fi
-    xz -c9 "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/curves/curves.csv           > "$outDir"/crv/"$prefix"-DynawoCurves"$1".csv.xz
-    xz -c9 "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/constraints/constraints.xml > "$outDir"/xml/"$prefix"-DynawoConstraints"$1".xml.xz
-    xz -c9 "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/timeLine/timeline.xml       > "$outDir"/xml/"$prefix"-DynawoTimeLine"$1".xml.xz
-    xz -c9 "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/logs/dynawo.log             > "$outDir"/log/"$prefix"-Dynawo"$1".log.xz
-    xz -c9 "$CONTG_CASE"/"$RUNLOG"                                     > "$outDir"/log/"$prefix"-"$RUNLOG".xz
 }
 
 
@@ -162,8 +297,8 @@ if [[ $? -ne 4 ]]; then
 fi
 set -e
 
-OPTIONS=cdho:vA:B:
-LONGOPTS=cleanup,debug,help,output:,verbose,launcherA:,launcherB:
+OPTIONS=cdho:pvA:B:CS:Nx:z
+LONGOPTS=cleanup,debug,help,output:,no-postproc,verbose,launcherA:,launcherB:,concurrent,only-side:,no-restore,prefix:,defer-compression
 # -activate quoting/enhanced mode (e.g. by writing out “--options”)
 # -pass arguments only via   -- "$@"   to separate them correctly
 PARSED=$(getopt --options=$OPTIONS --longoptions=$LONGOPTS --name "$0" -- "$@")
@@ -171,7 +306,7 @@ PARSED=$(getopt --options=$OPTIONS --longoptions=$LONGOPTS --name "$0" -- "$@")
 eval set -- "$PARSED"
 
 # now enjoy the options in order and nicely split until we see --
-c=n d=n h=n outDir="RESULTS" v=n A="dynawo.sh" B="dynawo.sh"
+c=n d=n h=n outDir="RESULTS" p=n v=n A="dynawo.sh" B="dynawo.sh" C=n S="" N=n x="" z=n
 while true; do
     case "$1" in
         -c|--cleanup)
@@ -190,6 +325,10 @@ while true; do
             outDir="$2"   # it could contain whitespace, so remember to quote it!
             shift 2
             ;;
+        -p|--no-postproc)
+            p=y
+            shift
+            ;;
         -v|--verbose)
             v=y
             shift
@@ -202,6 +341,26 @@ while true; do
             B="$2"   # it could contain whitespace, so remember to quote it!
             shift 2
             ;;
+        -C|--concurrent)
+            C=y
+            shift
+            ;;
+        -S|--only-side)
+            S="$2"
+            shift 2
+            ;;
+        -N|--no-restore)
+            N=y
+            shift
+            ;;
+        -x|--prefix)
+            x="$2"
+            shift 2
+            ;;
+        -z|--defer-compression)
+            z=y
+            shift
+            ;;
         --)
             shift
             break
@@ -214,7 +373,7 @@ while true; do
 done
 
 if [ $v = "y" ]; then
-    echo "$0: Called with OPTIONS: cleanup: $c, debug: $d, help: $h, outDir: $outDir, verbose: $v, launcherA: $A, launcherB: $B"
+    echo "$0: Called with OPTIONS: cleanup: $c, debug: $d, help: $h, outDir: $outDir, no-postproc: $p, verbose: $v, launcherA: $A, launcherB: $B, concurrent: $C, only-side: $S, no-restore: $N, prefix: $x, defer-compression: $z"
     echo "$0: Called with PARAMS: $*"
 fi
 
@@ -227,6 +386,11 @@ if [ $d = "y" ]; then
     set -o xtrace
 fi
 
+if [ -n "$S" ] && [ "$S" != "A" ] && [ "$S" != "B" ] && [ "$S" != "none" ]; then
+    echo "$0: option --only-side must be either A, B or none"
+    exit 4
+fi
+
 # handle non-option arguments
 if [[ $# -ne 2 ]]; then
     echo
@@ -251,6 +415,8 @@ if [ ! -d "$CONTG_CASE" ]; then
    exit 1
 fi
 prefix=$(basename "$CONTG_CASE")
+SIM_CACHE_SCRIPT=$(cd "$(dirname "$0")"/../../commons && pwd)/sim_cache.py
+SHARED_PREFIX_SCRIPT=$(cd "$(dirname "$0")"/../../commons && pwd)/shared_prefix.py
 
 # Create the output dirs if they don't exist
 mkdir -p "$outDir"/pf_sol
@@ -261,6 +427,10 @@ mkdir -p "$outDir"/log
 mkdir -p "$outDir"/casediffs
 
 
+# (a list left by a previous attempt would show up in the diffs below)
+rm -f "$CONTG_CASE"/.compress_list
+
+
 #################################################
 # Save the case compactly as diffs from BASECASE
 #################################################
@@ -294,96 +464,59 @@ fi
 #####################################################################
 A_basename=$(basename "$A")
 B_basename=$(basename "$B")
-set_launcher "$A"
-"$LAUNCHER" version > "$outDir"/../.LAUNCHER_A_WAS_"$A_basename" 2>&1 || true
-set_launcher "$B"
-"$LAUNCHER" version > "$outDir"/../.LAUNCHER_B_WAS_"$B_basename" 2>&1 || true
-basecase_name=$(basename "$BASECASE")
+if [ "$S" != "B" ]; then
+    set_launcher "$A"
+    "$LAUNCHER" version > "$outDir"/../.LAUNCHER_A_WAS_"$A_basename" 2>&1 || true
+fi
+if [ "$S" != "A" ]; then
+    set_launcher "$B"
+    "$LAUNCHER" version > "$outDir"/../.LAUNCHER_B_WAS_"$B_basename" 2>&1 || true
+fi
 scripts_basedir=$(dirname "$0")
 DWO_JOBINFO_SCRIPT=$scripts_basedir/dwo_jobinfo.py
-CASE_TYPE=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "CASE_TYPE" | cut -d'=' -f2)
+# Get all the job info at once (it's then grepped from here)
+DWO_JOBINFO=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE")
+CASE_TYPE=$(echo "$DWO_JOBINFO" | grep -F "CASE_TYPE" | cut -d'=' -f2)
 
 if [ "$CASE_TYPE" = "dwohds" ]; then
-    DWO_JOBFILE=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "job_file" | cut -d'=' -f2)
+    DWO_JOBFILE=$(echo "$DWO_JOBINFO" | grep -F "job_file" | cut -d'=' -f2)
     DWO_JOBFILE=$(basename "$DWO_JOBFILE")
-    DWO_OUTPUT_DIR=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "outputs_directory" | cut -d'=' -f2)
+    DWO_OUTPUT_DIR=$(echo "$DWO_JOBINFO" | grep -F "outputs_directory" | cut -d'=' -f2)
     if [ "${A_basename:0:5}" == "hades" ]; then
-        run_hades "$A"
-        run_dynawo "" "$B"
+        start_sim A run_hades "$A"
+        start_sim B run_dynawo "" "$B"
     else
-        run_dynawo "" "$A"
-        run_hades "$B"
+        start_sim A run_dynawo "" "$A"
+        start_sim B run_hades "$B"
     fi
-    python3 "$scripts_basedir"/extract_dynawo_automata_changes_contgcase.py -s "$outDir"/aut/"$prefix"-Dynawo-aut-diff.csv \
-            "$outDir"/xml/"$prefix"-Dynawo.IIDM.xml.xz "$outDir"/../"$basecase_name"/
-
-    python3 "$scripts_basedir"/extract_hades_automata_changes_contgcase.py -s "$outDir"/aut/"$prefix"-Hades-aut-diff.csv \
-            "$outDir"/xml/"$prefix"-Hades.Out.xml.xz "$outDir"/../"$basecase_name"/ "$outDir"/../"$basecase_name"/Hades/donneesEntreeHADES2.xml
+    wait_sides
 else
-    DWO_JOBFILE=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "job_fileA" | cut -d'=' -f2)
+    DWO_JOBFILE=$(echo "$DWO_JOBINFO" | grep -F "job_fileA" | cut -d'=' -f2)
     DWO_JOBFILE=$(basename "$DWO_JOBFILE")
-    DWO_OUTPUT_DIR=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "outputs_directoryA" | cut -d'=' -f2)
-    run_dynawo "A" "$A"
-    DWO_JOBFILE=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "job_fileB" | cut -d'=' -f2)
+    DWO_OUTPUT_DIR=$(echo "$DWO_JOBINFO" | grep -F "outputs_directoryA" | cut -d'=' -f2)
+    start_sim A run_dynawo "A" "$A"
+    DWO_JOBFILE=$(echo "$DWO_JOBINFO" | grep -F "job_fileB" | cut -d'=' -f2)
     DWO_JOBFILE=$(basename "$DWO_JOBFILE")
-    DWO_OUTPUT_DIR=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "outputs_directoryB" | cut -d'=' -f2)
-    run_dynawo "B" "$B"
-    python3 "$scripts_basedir"/extract_dynawo_automata_changes_contgcase.py -s "$outDir"/aut/"$prefix"-DynawoA-aut-diff.csv \
-            "$outDir"/xml/"$prefix"-Dynawo.IIDMA.xml.xz "$outDir"/../"$basecase_name"/A/
-    python3 "$scripts_basedir"/extract_dynawo_automata_changes_contgcase.py -s "$outDir"/aut/"$prefix"-DynawoB-aut-diff.csv \
-            "$outDir"/xml/"$prefix"-Dynawo.IIDMB.xml.xz "$outDir"/../"$basecase_name"/B/
+    DWO_OUTPUT_DIR=$(echo "$DWO_JOBINFO" | grep -F "outputs_directoryB" | cut -d'=' -f2)
+    start_sim B run_dynawo "B" "$B"
+    wait_sides
 fi
 
 
 
 ########################################
-# Extract the PF solution
-########################################
-# Extracts the PF solution vaules from the xml output to CSV,
-# using a standardized format to allow comparisons
-scripts_basedir=$(dirname "$0")
-echo "Extracting the powerflow solutions for case: $CONTG_CASE"
-python3 "$scripts_basedir"/extract_powerflow_values.py "$CONTG_CASE" "$outDir"/..
-
-# Collect and compress all results
-xz -c9 "$CONTG_CASE"/pfsolution_AB.csv > "$outDir"/pf_sol/"$prefix"_pfsolutionAB.csv.xz
-for error_file in "elements_not_in_caseA.csv" "elements_not_in_caseB.csv"; do 
-    if [ -f "$CONTG_CASE"/"$error_file" ]; then
-        xz -c9 "$CONTG_CASE"/"$error_file" > "$outDir"/pf_sol/"$prefix"-"$error_file".xz
-    fi
-done
-
-
-########################################
-# Extract automata changes
+# Post-processing
 ########################################
-# Extracts EVENTS from the xml output to CSV, using standardized
-# labels to allow comparison
-scripts_basedir=$(dirname "$0")/../../commons
-python3 "$scripts_basedir"/extract_automata_changes.py "$CONTG_CASE" "$outDir"/../
-
-scripts_basedir=$(dirname "$0")
-# Collect and compress all results
-if [ "$CASE_TYPE" = "dwohds" ]; then
-    xz -c9 "$CONTG_CASE"/Dynawo_automata_changes.csv      > "$outDir"/aut/"$prefix"-DynawoAutomata.csv.xz
-    python3 "$scripts_basedir"/group_dwo_events.py "$outDir"/aut/"$prefix"-DynawoAutomata.csv.xz \
-            "$outDir"/../"$basecase_name"/ "$outDir"/aut/"$prefix"-aut-groups.csv 0
-else
-    xz -c9 "$CONTG_CASE"/DynawoA_automata_changes.csv      > "$outDir"/aut/"$prefix"-DynawoAutomataA.csv.xz
-    xz -c9 "$CONTG_CASE"/DynawoB_automata_changes.csv      > "$outDir"/aut/"$prefix"-DynawoAutomataB.csv.xz
-    python3 "$scripts_basedir"/group_dwo_events.py "$outDir"/aut/"$prefix"-DynawoAutomataA.csv.xz \
-            "$outDir"/../"$basecase_name"/ "$outDir"/aut/"$prefix"-autA-groups.csv 1
-    python3 "$scripts_basedir"/group_dwo_events.py "$outDir"/aut/"$prefix"-DynawoAutomataB.csv.xz \
-            "$outDir"/../"$basecase_name"/ "$outDir"/aut/"$prefix"-autB-groups.csv 2
+# Extracts the automata diffs w.r.t. the BASECASE, the PF solution values, and the
+# automata events (using standardized labels to allow comparisons), all in a single
+# python3 process. When run from the contingency scheduler (option -p), this is
+# instead done by its pool of post-processing workers. With option -N, there's
+# nothing to post-process (just one side's raw results).
+if [ $p = "y" ] || [ $N = "y" ]; then
+    exit 0
 fi
-
-
-
-########################################
-# Clean up
-########################################
-# Delete input dir if cleanup was requested
+declare -a POSTPROC_OPTS=("-o" "$outDir")
 if [ $c = "y" ]; then
-    rm -rf "$CONTG_CASE"
+    POSTPROC_OPTS+=("-c")
 fi
-
+python3 "$scripts_basedir"/contg_postproc.py "${POSTPROC_OPTS[@]}" "$BASECASE" "$CONTG_CASE"
@@ -22,6 +22,29 @@ def run_pipeline(
     cleanup=False,
     randomseed=None,
     weights=None,
+    jobs=None,
+    resume=False,
+    timeout=None,
+    cpu_limit=None,
+    stall=None,
+    cache=None,
+    only_side=None,
+    shared_prefix=False,
+    queue=None,
+    mem_budget=None,
+    overlap=False,
+    scratch=None,
+    scratch_size=None,
+    threads=None,
+    pin=False,
+    calibrate=False,
+    launchers=None,
+    estimate=False,
+    time_budget=None,
+    shard=None,
+    merge=None,
+    jit=False,
+    upfront=False,
 ):
     file_path = os.path.abspath(os.path.dirname(__file__))
     runallopts = ""
@@ -40,6 +63,78 @@ def run_pipeline(
     if weights is not None:
         runallopts += "-w %s " % (weights)
 
+    if jobs is not None:
+        runallopts += "-j %s " % (jobs)
+
+    if resume:
+        runallopts += "-R "
+
+    if timeout is not None:
+        runallopts += "-t %s " % timeout
+
+    if cpu_limit is not None:
+        runallopts += "-T %s " % cpu_limit
+
+    if stall is not None:
+        runallopts += "-W %s " % stall
+
+    if only_side is not None:
+        runallopts += "-S %s " % only_side
+
+    if shared_prefix:
+        runallopts += "-P "
+
+    if queue is not None:
+        runallopts += "-Q %s " % os.path.abspath(queue)
+
+    if mem_budget is not None:
+        runallopts += "-m %s " % mem_budget
+
+    if overlap:
+        runallopts += "-O "
+
+    if scratch is not None:
+        runallopts += "-Z %s " % os.path.abspath(scratch)
+
+    if scratch_size is not None:
+        runallopts += "-z %s " % scratch_size
+
+    if threads is not None:
+        runallopts += "-n %s " % threads
+
+    if pin:
+        runallopts += "-k "
+
+    if calibrate:
+        runallopts += "-C "
+
+    if launchers is not None:
+        for launcher in launchers:
+            runallopts += "-L %s " % launcher
+
+    if estimate:
+        runallopts += "-e "
+
+    if time_budget is not None:
+        runallopts += "-b %s " % time_budget
+
+    if shard is not None:
+        runallopts += "-H %s " % shard
+
+    if merge is not None:
+        for shard_dir in merge:
+            runallopts += "-M %s " % os.path.abspath(shard_dir)
+
+    if jit:
+        runallopts += "-J "
+
+    if upfront:
+        runallopts += "-U "
+
+    # The simulation cache is enabled through the environment (see run_one_contg.sh)
+    if cache is not None:
+        os.environ["DWO_VALIDATION_CACHE"] = os.path.abspath(cache)
+
     if allcontg:
         if regexlist is None:
             if randomseed is not None:
@@ -11,6 +11,10 @@
 #
 # top_10_diffs.py
 #
+# The top 10 values of each kind are also saved in the pf_metrics dir (TOPS_FILE), so
+# that those of several shards of a campaign can be combined with option --shards
+# (see commons/contg_shard.py), instead of reading all their pf_solutions again.
+#
 
 import os
 import re
@@ -24,8 +28,27 @@ parser = argparse.ArgumentParser()
 parser.add_argument("pf_solutions_dir", help="enter pf_solutions_dir directory")
 parser.add_argument("pf_metrics_dir", help="enter pf_metrics_dir directory")
 parser.add_argument("--regex", nargs="+", help="enter prefix name", default=[".*"])
+parser.add_argument(
+    "--shards",
+    nargs="+",
+    help="combine the top 10 values saved in the pf_metrics dirs of these shards, "
+    "instead of reading the pf_solutions",
+)
 args = parser.parse_args()
 
+TOPS_FILE = "top_10_values.csv"
+# The top 10 values of each kind, in the order they are printed
+TOPS = [
+    "BUS-V OF ABS_ERR",
+    "BUS-V OF REL_ERR",
+    "BRANCH-P OF ABS_ERR",
+    "BRANCH-P OF REL_ERR",
+    "BUS-P OF ABS_ERR",
+    "BUS-P OF REL_ERR",
+    "BUS-Q OF ABS_ERR",
+    "BUS-Q OF REL_ERR",
+]
+
 
 def main():
     # display format
@@ -46,8 +69,10 @@ def main():
     data_files = os.listdir(pf_solutions_dir)
     first_iteration = True
 
-    # regex list
+    # regex list (with shards, their saved top 10 values are used instead)
     data_files_list = []
+    if args.shards is not None:
+        data_files = []
     for i in data_files:
         for j in args.regex:
             if i not in data_files_list and re.match(j + "_pfsolutionAB.csv.xz", i):
@@ -226,10 +251,34 @@ def main():
                 else:
                     break
 
-    if first_iteration:
+    if args.shards is not None:
+        (
+            databusvoltsortedabstotal,
+            databusvoltsortedreltotal,
+            databranchpsortedabstotal,
+            databranchpsortedreltotal,
+            databuspsortedabstotal,
+            databuspsortedreltotal,
+            databusqsortedabstotal,
+            databusqsortedreltotal,
+        ) = combine_tops(args.shards)
+    elif first_iteration:
         raise ValueError(
             f"Neither regular expression matches or there are no cases defined"
         )
+    save_tops(
+        pf_metrics_dir,
+        [
+            databusvoltsortedabstotal,
+            databusvoltsortedreltotal,
+            databranchpsortedabstotal,
+            databranchpsortedreltotal,
+            databuspsortedabstotal,
+            databuspsortedreltotal,
+            databusqsortedabstotal,
+            databusqsortedreltotal,
+        ],
+    )
 
     df_metrics = pd.read_csv(pf_metrics_dir + "metrics.csv.xz", index_col=0)
     df_weights = pd.read_csv(
@@ -315,6 +364,25 @@ def main():
     print(databusqsortedreltotal.to_string(index=False))
 
 
+# Save the top 10 values of each kind, in a single table
+def save_tops(pf_metrics_dir, tops):
+    df = pd.concat([x.assign(TOP=name) for name, x in zip(TOPS, tops)])
+    df.to_csv(pf_metrics_dir + TOPS_FILE, sep=";", index=False)
+
+
+# Combine the top 10 values of each kind saved by several shards
+def combine_tops(pf_metrics_dirs):
+    df = pd.concat(
+        [pd.read_csv(os.path.join(x, TOPS_FILE), sep=";") for x in pf_metrics_dirs]
+    )
+    tops = []
+    for name in TOPS:
+        err = name.split(" OF ")[1]
+        top = df.loc[df.TOP == name].drop(columns="TOP")
+        tops.append(top.sort_values(err, ascending=False)[:10])
+    return tops
+
+
 # Read a specific contingency
 def read_case(pf_solutions_dir):
     data = pd.read_csv(pf_solutions_dir, sep=";", index_col=False, compression="infer")
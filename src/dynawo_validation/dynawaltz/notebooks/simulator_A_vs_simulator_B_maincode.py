@@ -6,10 +6,18 @@ import seaborn as sns
 import qgrid
 from ipywidgets import widgets
 from IPython.display import display, HTML, Markdown
+from dynawo_validation.commons.contg_ledger import LEDGER_FILE, read_ledger
 
 PLOTLY_MAXPOINTS = 5000  # Plotly becomes *very* slow when charts exceed this
 
 
+# Read the cases that timed out (killed by the scheduler because they hung or took
+# too long, so they have no results)
+def read_timedout_cases(crv_dir):
+    ledger = read_ledger(os.path.join(crv_dir, "..", LEDGER_FILE))
+    return sorted(case for case, row in ledger.items() if row["STATE"] == "timeout")
+
+
 # Auxiliary function for calculating delta levelK at the aut_tw_metrics points
 def getDeltaLevelK(df_ast, df_dwo, t_end):
     df_m = pd.DataFrame(np.linspace(0, t_end, 41))  # same no. of points as aut_tw
@@ -715,6 +723,14 @@ def main(
             f"  * Q_THRESH: {Q_THRESH:.2f} MW\n"
         )
     )
+    timedout_cases = read_timedout_cases(CRV_DIR)
+    if len(timedout_cases) != 0:
+        display(
+            Markdown(
+                "## Contingency cases that timed out (hung or too slow; no results): \n"
+                + "".join(f"  * {case}\n" for case in timedout_cases)
+            )
+        )
 
     display(Markdown("# SCORING BY VARIABLE"))
     display(grid_bycasevar)
@@ -3,6 +3,7 @@ import os
 import sys
 import subprocess
 from lxml import etree
+from dynawo_validation.commons.dwo_index import DydIndex, ParIndex
 from collections import namedtuple
 
 
@@ -158,7 +159,7 @@ def dedup_save(basename, edited_case, deduped_case):
 
 def parse_basecase(base_case, dwo_paths, astre_path, dwo_pathsA, dwo_pathsB):
     Parsed_case = namedtuple(
-        "Parsed_case", "astreTree iidmTree parTree dydTree crvTree"
+        "Parsed_case", "astreTree iidmTree parTree dydTree crvTree dydIndex parIndex"
     )
     Parsed_dwodwo_case = namedtuple("Parsed_dwodwo_case", "A B")
 
@@ -186,6 +187,8 @@ def parse_basecase(base_case, dwo_paths, astre_path, dwo_pathsA, dwo_pathsB):
             parTree=parTree,
             dydTree=dydTree,
             crvTree=crvTree,
+            dydIndex=DydIndex(dydTree),
+            parIndex=ParIndex(parTree),
         )
     else:
         iidmTreeA = etree.parse(
@@ -210,6 +213,8 @@ def parse_basecase(base_case, dwo_paths, astre_path, dwo_pathsA, dwo_pathsB):
             parTree=parTreeA,
             dydTree=dydTreeA,
             crvTree=crvTreeA,
+            dydIndex=DydIndex(dydTreeA),
+            parIndex=ParIndex(parTreeA),
         )
 
         iidmTreeB = etree.parse(
@@ -234,6 +239,8 @@ def parse_basecase(base_case, dwo_paths, astre_path, dwo_pathsA, dwo_pathsB):
             parTree=parTreeB,
             dydTree=dydTreeB,
             crvTree=crvTreeB,
+            dydIndex=DydIndex(dydTreeB),
+            parIndex=ParIndex(parTreeB),
         )
 
         return Parsed_dwodwo_case(A=parsed_caseA, B=parsed_caseB)
@@ -59,6 +59,8 @@ import random
 import re
 import sys
 from collections import namedtuple
+from dynawo_validation.commons.contg_create import create_cases
+from dynawo_validation.commons.contg_scheduler import parse_njobs
 from dynawo_validation.dynawaltz.pipeline.common_funcs import (
     copy_astdwo_basecase,
     copy_dwodwo_basecase,
@@ -113,6 +115,39 @@ parser.add_argument(
     help="enter regular expressions or contingencies in "
     "string form separated with pipe(|)",
 )
+parser.add_argument(
+    "-x",
+    "--exclude",
+    help="file listing the contingency cases to skip (e.g. those already completed "
+    "by a run that is being resumed), one case name per line",
+)
+parser.add_argument(
+    "-m",
+    "--max-ncases",
+    type=int,
+    help="limit the no. of contingency cases to about this many, via random "
+    "sampling (default: %d)" % MAX_NCASES,
+)
+parser.add_argument(
+    "-n",
+    "--dry-run",
+    help="do not create the contingency cases, just list their names",
+    action="store_true",
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    default="1",
+    help="create this many contingency cases in parallel, either a number or a "
+    "percentage of the CPU cores (default: 1)",
+)
+parser.add_argument(
+    "-s",
+    "--serve",
+    help="do not create the contingency cases up front, but just in time, as they "
+    "are requested on stdin (see commons/contg_create.py)",
+    action="store_true",
+)
 parser.add_argument("base_case", help="enter base case directory")
 args = parser.parse_args()
 
@@ -136,6 +171,10 @@ def main():
                 filter_list.remove(re.compile(""))
     if args.randomc:
         RNG_SEED = random.randint(1, 1000)
+    skip_cases = set()
+    if args.exclude:
+        with open(args.exclude) as f:
+            skip_cases = set(f.read().splitlines())
     # remove a possible trailing slash
     if base_case[-1] == "/":
         base_case = base_case[:-1]
@@ -177,21 +216,20 @@ def main():
         dynawo_gens = matching_in_dwoB(dynawo_gens, dynawo_gensB)
 
     # Prepare for random sampling if there's too many
+    max_ncases = MAX_NCASES if args.max_ncases is None else args.max_ncases
     if args.allcontg == False:
-        sampling_ratio = MAX_NCASES / len(dynawo_gens)
+        sampling_ratio = max_ncases / len(dynawo_gens)
         random.seed(RNG_SEED)
         if len(filter_list) == 0 and sampling_ratio < 1:
             print(
                 "LIMITING to a sample of about %d cases (%.2f%% of all cases)"
-                % (MAX_NCASES, 100 * sampling_ratio)
+                % (max_ncases, 100 * sampling_ratio)
             )
     else:
         sampling_ratio = 1
-    # This dict will keep track of which contingencies are actually processed
-    # It will also keep Astre's (P,Q) of each gen
-    processed_gensPQ = dict()
-
-    # For each matching GEN, generate the contingency case
+    # Select the contingency cases (serially, so that the random sample does not
+    # depend on the number of jobs)
+    contg_gens = []
     for gen_name in dynawo_gens:
 
         # If the script was passed a list of generators, filter for them here
@@ -203,6 +241,22 @@ def main():
         if len(filter_list) == 0 and random.random() > sampling_ratio:
             continue
 
+        # Skip the cases already completed (when resuming a previous run)
+        if "gen_" + gen_name.replace("/", "+") in skip_cases:
+            continue
+
+        # In a dry run, just list the case
+        if args.dry_run:
+            print("DRY_RUN_CASE=gen_" + gen_name.replace("/", "+"))
+            continue
+
+        contg_gens.append(gen_name)
+
+    if args.dry_run:
+        print("DRY_RUN_ALL=%d" % len(dynawo_gens))
+        return 0
+
+    def create_gen_case(gen_name):
         print(
             "Generating contingency case for gen %s (at bus: %s)"
             % (gen_name, dynawo_gens[gen_name].bus)
@@ -224,7 +278,7 @@ def main():
                 dynawo_gens[gen_name],
             )
             # Modify the Astre case, and obtain the disconnected generation (P,Q)
-            processed_gensPQ[gen_name] = config_astre_gen_contingency(
+            return config_astre_gen_contingency(
                 contg_casedir, parsed_case.astreTree, gen_name, dynawo_gens[gen_name]
             )
         else:
@@ -248,10 +302,19 @@ def main():
                 dynawo_gens[gen_name],
             )
             # Get the disconnected generation (P,Q) for case B
-            processed_gensPQ[gen_name] = (
-                dynawo_gensB[gen_name].P,
-                dynawo_gensB[gen_name].Q,
-            )
+            return dynawo_gensB[gen_name].P, dynawo_gensB[gen_name].Q
+
+    case_dirs = None
+    if args.serve:
+        # Just in time: only as requested by the scheduler (see contg_create.py)
+        case_dirs = [dirname + "/gen_" + x.replace("/", "+") for x in contg_gens]
+
+    # Main loop: generate the contingency cases (in parallel, see contg_create.py)
+    # This dict will keep track of which contingencies are actually processed
+    # It will also keep Astre's (P,Q) of each gen
+    processed_gensPQ = create_cases(
+        create_gen_case, contg_gens, parse_njobs(args.jobs), case_dirs
+    )
 
     # Finally, save the (P,Q) values of disconnected gens in all *processed* cases
     save_total_genpq(dirname, astdwo, dynawo_gens, processed_gensPQ)
@@ -358,26 +421,16 @@ def config_dynawo_gen_contingency(
     cnx_id2 = "NETWORK"
     cnx_var2 = gen_name + "_state_value"
     param_eventname = "event_open"
-    for dyn_gen in root.iterfind("./blackBoxModel", root.nsmap):
-        if (
-            dyn_gen.get("lib")[0:9] == "Generator"
-            and dyn_gen.get("staticId") == gen_name
-        ):
-            disconn_eventmodel = "EventSetPointBoolean"
-            cnx_id2 = dyn_gen.get("id")
-            cnx_var2 = "generator_switchOffSignal2_value"
-            param_eventname = "event_stateEvent1"
-            break
+    dyn_gen = case_trees.dydIndex.generator(gen_name)
+    if dyn_gen is not None:
+        disconn_eventmodel = "EventSetPointBoolean"
+        cnx_id2 = dyn_gen.get("id")
+        cnx_var2 = "generator_switchOffSignal2_value"
+        param_eventname = "event_stateEvent1"
 
-    # Erase all existing Event models (keep the IDs to remove their
-    # connections later below)
-    old_eventIds = []
-    old_parIds = []
-    for event in root.iterfind("./blackBoxModel", root.nsmap):
-        if event.get("lib")[0:5] == "Event":
-            old_eventIds.append(event.get("id"))
-            old_parIds.append(event.get("parId"))
-            event.getparent().remove(event)
+    # Erase all existing Event models, and all their connections (keep their
+    # parIds to remove their parsets later below)
+    old_parIds = case_trees.dydIndex.remove_events()
 
     # Declare a new Event
     ns = etree.QName(root).namespace
@@ -388,17 +441,13 @@ def config_dynawo_gen_contingency(
     event.set("parFile", dwo_paths.parFile)
     event.set("parId", "99991234")
 
-    # Erase all connections of the previous Events we removed above
-    for cnx in root.iterfind("./connect", root.nsmap):
-        if cnx.get("id1") in old_eventIds or cnx.get("id2") in old_eventIds:
-            cnx.getparent().remove(cnx)
-
     # Declare a new Connect between the Event model and the gen
     cnx = etree.SubElement(root, "{%s}connect" % ns)
     cnx.set("id1", event_id)
     cnx.set("var1", "event_state1_value")
     cnx.set("id2", cnx_id2)
     cnx.set("var2", cnx_var2)
+    case_trees.dydIndex.add_event(event, [cnx])
 
     # Write out the DYD file, preserving the XML format
     dyd_tree.write(
@@ -417,9 +466,7 @@ def config_dynawo_gen_contingency(
     root = par_tree.getroot()
 
     # Erase all existing parsets used by the Events removed above
-    for parset in root.iterfind("./set", root.nsmap):
-        if parset.get("id") in old_parIds:
-            parset.getparent().remove(parset)
+    case_trees.parIndex.remove_sets(old_parIds)
 
     # The event time was already read from the BASECASE (taken from the first event)
     event_tEvent = str(round(dwo_tparams.event_tEvent))
@@ -436,6 +483,7 @@ def config_dynawo_gen_contingency(
         etree.Element("{%s}par" % ns, type="BOOL", name=param_eventname, value="true")
     )
     root.append(new_parset)
+    case_trees.parIndex.add_set(new_parset)
 
     # Write out the PAR file, preserving the XML format
     par_tree.write(
@@ -43,6 +43,8 @@ import random
 import re
 import sys
 from collections import namedtuple
+from dynawo_validation.commons.contg_create import create_cases
+from dynawo_validation.commons.contg_scheduler import parse_njobs
 from common_funcs import copy_astdwo_basecase, copy_dwodwo_basecase, parse_basecase
 from lxml import etree
 import pandas as pd
@@ -93,6 +95,39 @@ parser.add_argument(
     help="enter regular expressions or contingencies in "
     "string form separated with pipe(|)",
 )
+parser.add_argument(
+    "-x",
+    "--exclude",
+    help="file listing the contingency cases to skip (e.g. those already completed "
+    "by a run that is being resumed), one case name per line",
+)
+parser.add_argument(
+    "-m",
+    "--max-ncases",
+    type=int,
+    help="limit the no. of contingency cases to about this many, via random "
+    "sampling (default: %d)" % MAX_NCASES,
+)
+parser.add_argument(
+    "-n",
+    "--dry-run",
+    help="do not create the contingency cases, just list their names",
+    action="store_true",
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    default="1",
+    help="create this many contingency cases in parallel, either a number or a "
+    "percentage of the CPU cores (default: 1)",
+)
+parser.add_argument(
+    "-s",
+    "--serve",
+    help="do not create the contingency cases up front, but just in time, as they "
+    "are requested on stdin (see commons/contg_create.py)",
+    action="store_true",
+)
 parser.add_argument("base_case", help="enter base case directory")
 args = parser.parse_args()
 
@@ -116,6 +151,10 @@ def main():
                 filter_list.remove(re.compile(""))
     if args.randomc:
         RNG_SEED = random.randint(1, 1000)
+    skip_cases = set()
+    if args.exclude:
+        with open(args.exclude) as f:
+            skip_cases = set(f.read().splitlines())
     # remove a possible trailing slash
     if base_case[-1] == "/":
         base_case = base_case[:-1]
@@ -163,20 +202,20 @@ def main():
         dynawo_loads = matching_in_dwoB(dynawo_loads, dynawo_loadsB)
 
     # Prepare for random sampling if there's too many
+    max_ncases = MAX_NCASES if args.max_ncases is None else args.max_ncases
     if args.allcontg == False:
-        sampling_ratio = MAX_NCASES / len(dynawo_loads)
+        sampling_ratio = max_ncases / len(dynawo_loads)
         random.seed(RNG_SEED)
         if len(filter_list) == 0 and sampling_ratio < 1:
             print(
                 "LIMITING to a sample of about %d cases (%.2f%% of all cases)"
-                % (MAX_NCASES, 100 * sampling_ratio)
+                % (max_ncases, 100 * sampling_ratio)
             )
     else:
         sampling_ratio = 1
-    # Initialize another dict to keep Astre's (P,Q) of each load
-    processed_loadsPQ = dict()
-
-    # For each matching LOAD, generate the contingency cases
+    # Select the contingency cases (serially, so that the random sample does not
+    # depend on the number of jobs)
+    contg_loads = []
     for load_name in dynawo_loads:
 
         # If the script was passed a list of loads, filter for them here
@@ -188,6 +227,22 @@ def main():
         if len(filter_list) == 0 and random.random() > sampling_ratio:
             continue
 
+        # Skip the cases already completed (when resuming a previous run)
+        if "load_" + load_name.replace("/", "+") in skip_cases:
+            continue
+
+        # In a dry run, just list the case
+        if args.dry_run:
+            print("DRY_RUN_CASE=load_" + load_name.replace("/", "+"))
+            continue
+
+        contg_loads.append(load_name)
+
+    if args.dry_run:
+        print("DRY_RUN_ALL=%d" % len(dynawo_loads))
+        return 0
+
+    def create_load_case(load_name):
         print(
             "Generating contingency case for load %s (at bus: %s)"
             % (load_name, dynawo_loads[load_name].bus)
@@ -210,7 +265,7 @@ def main():
                 dynawo_loads[load_name],
             )
             # Modify the Astre case, and obtain the disconnected generation (P,Q)
-            processed_loadsPQ[load_name] = config_astre_load_contingency(
+            return config_astre_load_contingency(
                 contg_casedir, parsed_case.astreTree, load_name, dynawo_loads[load_name]
             )
         else:
@@ -234,10 +289,18 @@ def main():
                 dynawo_loads[load_name],
             )
             # Get the disconnected generation (P,Q) for case B
-            processed_loadsPQ[load_name] = (
-                dynawo_loadsB[load_name].P,
-                dynawo_loadsB[load_name].Q,
-            )
+            return dynawo_loadsB[load_name].P, dynawo_loadsB[load_name].Q
+
+    case_dirs = None
+    if args.serve:
+        # Just in time: only as requested by the scheduler (see contg_create.py)
+        case_dirs = [dirname + "/load_" + x.replace("/", "+") for x in contg_loads]
+
+    # Main loop: generate the contingency cases (in parallel, see contg_create.py)
+    # This dict will keep Astre's (P,Q) of each load
+    processed_loadsPQ = create_cases(
+        create_load_case, contg_loads, parse_njobs(args.jobs), case_dirs
+    )
 
     # Finally, save the (P,Q) values of disconnected loads in all processed cases
     save_total_loadpq(dirname, astdwo, dynawo_loads, processed_loadsPQ)
@@ -359,15 +422,9 @@ def config_dynawo_load_contingency(
     dyd_tree = case_trees.dydTree
     root = dyd_tree.getroot()
 
-    # Erase all existing Event models (keep the IDs to remove their
-    # connections later below)
-    old_eventIds = []
-    old_parIds = []
-    for event in root.iterfind("./blackBoxModel", root.nsmap):
-        if event.get("lib")[0:5] == "Event":
-            old_eventIds.append(event.get("id"))
-            old_parIds.append(event.get("parId"))
-            event.getparent().remove(event)
+    # Erase all existing Event models, and all their connections (keep their
+    # parIds to remove their parsets later below)
+    old_parIds = case_trees.dydIndex.remove_events()
 
     # Declare a new Event
     ns = etree.QName(root).namespace
@@ -378,17 +435,13 @@ def config_dynawo_load_contingency(
     event.set("parFile", dwo_paths.parFile)
     event.set("parId", "99991234")
 
-    # Erase all connections of the previous Events we removed above
-    for cnx in root.iterfind("./connect", root.nsmap):
-        if cnx.get("id1") in old_eventIds or cnx.get("id2") in old_eventIds:
-            cnx.getparent().remove(cnx)
-
     # Declare a new Connect between the Event model and the load model
     cnx = etree.SubElement(root, "{%s}connect" % ns)
     cnx.set("id1", event_id)
     cnx.set("var1", "event_state1_value")
     cnx.set("id2", load_info.dydId)
     cnx.set("var2", "load_switchOffSignal2_value")
+    case_trees.dydIndex.add_event(event, [cnx])
 
     # Write out the DYD file, preserving the XML format
     dyd_tree.write(
@@ -407,9 +460,7 @@ def config_dynawo_load_contingency(
     root = par_tree.getroot()
 
     # Erase all existing parsets used by the Events removed above
-    for parset in root.iterfind("./set", root.nsmap):
-        if parset.get("id") in old_parIds:
-            parset.getparent().remove(parset)
+    case_trees.parIndex.remove_sets(old_parIds)
 
     # The event time was already read from the BASECASE (taken from the first event)
     event_tEvent = str(round(dwo_tparams.event_tEvent))
@@ -428,6 +479,7 @@ def config_dynawo_load_contingency(
         )
     )
     root.append(new_parset)
+    case_trees.parIndex.add_set(new_parset)
 
     # Write out the PAR file, preserving the XML format
     par_tree.write(
@@ -43,6 +43,8 @@ import random
 import re
 import sys
 from collections import namedtuple
+from dynawo_validation.commons.contg_create import create_cases
+from dynawo_validation.commons.contg_scheduler import parse_njobs
 from dynawo_validation.dynawaltz.pipeline.common_funcs import (
     copy_astdwo_basecase,
     copy_dwodwo_basecase,
@@ -97,6 +99,39 @@ parser.add_argument(
     help="enter regular expressions or contingencies in "
     "string form separated with pipe(|)",
 )
+parser.add_argument(
+    "-x",
+    "--exclude",
+    help="file listing the contingency cases to skip (e.g. those already completed "
+    "by a run that is being resumed), one case name per line",
+)
+parser.add_argument(
+    "-m",
+    "--max-ncases",
+    type=int,
+    help="limit the no. of contingency cases to about this many, via random "
+    "sampling (default: %d)" % MAX_NCASES,
+)
+parser.add_argument(
+    "-n",
+    "--dry-run",
+    help="do not create the contingency cases, just list their names",
+    action="store_true",
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    default="1",
+    help="create this many contingency cases in parallel, either a number or a "
+    "percentage of the CPU cores (default: 1)",
+)
+parser.add_argument(
+    "-s",
+    "--serve",
+    help="do not create the contingency cases up front, but just in time, as they "
+    "are requested on stdin (see commons/contg_create.py)",
+    action="store_true",
+)
 parser.add_argument("base_case", help="enter base case directory")
 args = parser.parse_args()
 
@@ -120,6 +155,10 @@ def main():
                 filter_list.remove(re.compile(""))
     if args.randomc:
         RNG_SEED = random.randint(1, 1000)
+    skip_cases = set()
+    if args.exclude:
+        with open(args.exclude) as f:
+            skip_cases = set(f.read().splitlines())
     # remove a possible trailing slash
     if base_case[-1] == "/":
         base_case = base_case[:-1]
@@ -161,20 +200,20 @@ def main():
         dynawo_shunts = matching_in_dwoB(dynawo_shunts, dynawo_shuntsB)
 
     # Prepare for random sampling if there's too many
+    max_ncases = MAX_NCASES if args.max_ncases is None else args.max_ncases
     if args.allcontg == False:
-        sampling_ratio = MAX_NCASES / len(dynawo_shunts)
+        sampling_ratio = max_ncases / len(dynawo_shunts)
         random.seed(RNG_SEED)
         if len(filter_list) == 0 and sampling_ratio < 1:
             print(
                 "LIMITING to a sample of about %d cases (%.2f%% of all cases)"
-                % (MAX_NCASES, 100 * sampling_ratio)
+                % (max_ncases, 100 * sampling_ratio)
             )
     else:
         sampling_ratio = 1
-    # Initialize another dict to keep Astre's Q of each disconnected shunt
-    processed_shuntsPQ = dict()
-
-    # For each matching SHUNT, generate the contingency case
+    # Select the contingency cases (serially, so that the random sample does not
+    # depend on the number of jobs)
+    contg_shunts = []
     for shunt_name in dynawo_shunts:
 
         # If the script was passed a list of shunts, filter for them here
@@ -186,6 +225,22 @@ def main():
         if len(filter_list) == 0 and random.random() > sampling_ratio:
             continue
 
+        # Skip the cases already completed (when resuming a previous run)
+        if "shunt_" + shunt_name.replace("/", "+") in skip_cases:
+            continue
+
+        # In a dry run, just list the case
+        if args.dry_run:
+            print("DRY_RUN_CASE=shunt_" + shunt_name.replace("/", "+"))
+            continue
+
+        contg_shunts.append(shunt_name)
+
+    if args.dry_run:
+        print("DRY_RUN_ALL=%d" % len(dynawo_shunts))
+        return 0
+
+    def create_shunt_case(shunt_name):
         print(
             "Generating contingency case for shunt %s (at bus: %s)"
             % (shunt_name, dynawo_shunts[shunt_name].bus)
@@ -208,7 +263,7 @@ def main():
                 dynawo_shunts[shunt_name],
             )
             # Modify the Astre case, and obtain the disconnected generation (P,Q)
-            processed_shuntsPQ[shunt_name] = config_astre_shunt_contingency(
+            return config_astre_shunt_contingency(
                 contg_casedir,
                 parsed_case.astreTree,
                 shunt_name,
@@ -235,7 +290,18 @@ def main():
                 dynawo_shunts[shunt_name],
             )
             # Get the disconnected generation (P,Q) for case B
-            processed_shuntsPQ[shunt_name] = dynawo_shuntsB[shunt_name].Q
+            return dynawo_shuntsB[shunt_name].Q
+
+    case_dirs = None
+    if args.serve:
+        # Just in time: only as requested by the scheduler (see contg_create.py)
+        case_dirs = [dirname + "/shunt_" + x.replace("/", "+") for x in contg_shunts]
+
+    # Main loop: generate the contingency cases (in parallel, see contg_create.py)
+    # This dict will keep Astre's Q of each disconnected shunt
+    processed_shuntsPQ = create_cases(
+        create_shunt_case, contg_shunts, parse_njobs(args.jobs), case_dirs
+    )
 
     # Finally, save the values of disconnected shunts in all processed cases
     save_total_shuntq(dirname, astdwo, dynawo_shunts, processed_shuntsPQ)
@@ -325,15 +391,9 @@ def config_dynawo_shunt_contingency(
     dyd_tree = case_trees.dydTree
     root = dyd_tree.getroot()
 
-    # Erase all existing Event models (keep the IDs to remove their
-    # connections later below)
-    old_eventIds = []
-    old_parIds = []
-    for event in root.iterfind("./blackBoxModel", root.nsmap):
-        if event.get("lib")[0:5] == "Event":
-            old_eventIds.append(event.get("id"))
-            old_parIds.append(event.get("parId"))
-            event.getparent().remove(event)
+    # Erase all existing Event models, and all their connections (keep their
+    # parIds to remove their parsets later below)
+    old_parIds = case_trees.dydIndex.remove_events()
 
     # Declare a new Event
     ns = etree.QName(root).namespace
@@ -344,17 +404,13 @@ def config_dynawo_shunt_contingency(
     event.set("parFile", dwo_paths.parFile)
     event.set("parId", "99991234")
 
-    # Erase all connections of the previous Events we removed above
-    for cnx in root.iterfind("./connect", root.nsmap):
-        if cnx.get("id1") in old_eventIds or cnx.get("id2") in old_eventIds:
-            cnx.getparent().remove(cnx)
-
     # Declare a new Connect between the Event model and the shunt
     cnx = etree.SubElement(root, "{%s}connect" % ns)
     cnx.set("id1", event_id)
     cnx.set("var1", "event_state1_value")
     cnx.set("id2", "NETWORK")
     cnx.set("var2", shunt_name + "_state_value")
+    case_trees.dydIndex.add_event(event, [cnx])
 
     # Write out the DYD file, preserving the XML format
     dyd_tree.write(
@@ -373,9 +429,7 @@ def config_dynawo_shunt_contingency(
     root = par_tree.getroot()
 
     # Erase all existing parsets used by the Events removed above
-    for parset in root.iterfind("./set", root.nsmap):
-        if parset.get("id") in old_parIds:
-            parset.getparent().remove(parset)
+    case_trees.parIndex.remove_sets(old_parIds)
 
     # The event time was already read from the BASECASE (taken from the first event)
     event_tEvent = str(round(dwo_tparams.event_tEvent))
@@ -392,6 +446,7 @@ def config_dynawo_shunt_contingency(
         etree.Element("{%s}par" % ns, type="BOOL", name="event_open", value="true")
     )
     root.append(new_parset)
+    case_trees.parIndex.add_set(new_parset)
 
     # Write out the PAR file, preserving the XML format
     par_tree.write(
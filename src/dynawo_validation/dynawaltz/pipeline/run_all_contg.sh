@@ -6,8 +6,8 @@
 # given a directory containing contingency cases (which can be of
 # EITHER Astre vs. Dynawo OR Dynawo vs. Dynawo type), all of them
 # derived from a common BASECASE, this script runs all cases having a
-# given prefix in their name (possibly in parallel, using GNU
-# parallel).
+# given prefix in their name (possibly in parallel, using the job
+# scheduler commons/contg_scheduler.py).
 #
 # (c) Grupo AIA
 # marinjl@aia.es
@@ -30,8 +30,40 @@ Usage: $0 [OPTIONS] CASE_DIR BASECASE CASE_PREFIX
     -o | --output     Specify a directory (no whitespace!) for collecting results (default: RESULTS)
     -v | --verbose    More verbose output
     -s | --sequential Run jobs sequentially (defult is parallel)
+    -R | --resume     Skip the cases already completed in the output dir
+    -j | --jobs       Number of parallel jobs, or percentage of CPU cores (default: 50%)
+    -t | --timeout    Wall-clock limit per case, in seconds (default: 0, i.e. no limit)
+    -T | --cpu-limit  CPU-time limit per case, in seconds (default: 0, i.e. no limit)
+    -W | --stall      Kill a case if its files show no progress for this many seconds
+                      (default: 3600; 0 means no limit)
     -A | --launcherA  Defines the launcher of simulator A
     -B | --launcherB  Defines the launcher of simulator B
+    -S | --only-side  Only simulate side A or B of the cases, reusing the results of
+                      the other side already collected in the output dir (with "none",
+                      both sides are reused, and the cases are just post-processed)
+    -N | --no-restore With -S, just collect the raw results of the simulated side,
+                      without restoring the other side nor post-processing the cases
+    -P | --shared-prefix  Simulate the pre-contingency interval only once, and start all
+                      cases from its dumped state (Dynawo sides only)
+    -K | --keep-prefix  With -P, keep the shared prefix in CASE_DIR, and reuse it in later
+                      calls (e.g. for other types of devices) as long as it has all the
+                      curves that their cases need
+    -Q | --queue      Publish the cases in this work queue dir (on shared storage), so
+                      that workers on other hosts can run them too
+    -m | --mem-budget Memory budget for the running cases, in MB or as a percentage of
+                      the RAM (default: 80%; 0 means no memory-aware admission control)
+    -Z | --scratch    Run and post-process each case in a copy under this scratch dir
+                      (e.g. /dev/shm), writing only its final results to the output dir
+    -z | --scratch-size  Size cap of the scratch area, in MB or as a percentage of its
+                      filesystem (default: 50%); the cases that don't fit are run in place
+    -n | --threads    Threads per case (OpenMP, BLAS, xz...); with -j as a percentage, the
+                      jobs are the CPU cores divided by this (default: 1)
+    -k | --pin        Pin each case to its own CPUs
+    -C | --calibrate  Don't run the campaign: find the split of the CPUs between jobs and
+                      threads per case that gives the best throughput, on a sample of the
+                      cases, and record it in calibration.csv in the results basedir
+    -J | --jit        Create each case just in time, with this command (a create script in
+                      serve mode, see commons/contg_create.py), and delete it once done
 
   Example: $0 PtFige-Lille load
     (will run all cases PtFige-Lille/load* and leave the collected results under RESULTS) 
@@ -55,8 +87,8 @@ if [[ ${PIPESTATUS[0]} -ne 4 ]]; then
     exit 1
 fi
 
-OPTIONS=cdho:vsA:B:
-LONGOPTS=cleanup,debug,help,output:,verbose,sequential,launcherA:,launcherB:
+OPTIONS=cdho:vsRj:t:T:W:A:B:S:NPKQ:m:Z:z:n:kCJ:
+LONGOPTS=cleanup,debug,help,output:,verbose,sequential,resume,jobs:,timeout:,cpu-limit:,stall:,launcherA:,launcherB:,only-side:,no-restore,shared-prefix,keep-prefix,queue:,mem-budget:,scratch:,scratch-size:,threads:,pin,calibrate,jit:
 
 # -regarding ! and PIPESTATUS see above
 # -temporarily store output to be able to check for errors
@@ -72,7 +104,7 @@ fi
 # read getopt’s output this way to handle the quoting right:
 eval set -- "$PARSED"
 
-c=n d=n h=n outDir="RESULTS" v=n s=n A="dynawo.sh" B="dynawo.sh"
+c=n d=n h=n outDir="RESULTS" v=n s=n R=n j="50%" t=0 T=0 W=3600 A="dynawo.sh" B="dynawo.sh" S="" N=n P=n K=n Q="" m="80%" Z="" z="50%" n="" k=n C=n J=""
 # now enjoy the options in order and nicely split until we see --
 while true; do
     case "$1" in
@@ -100,6 +132,26 @@ while true; do
             s=y
             shift
             ;;
+        -R|--resume)
+            R=y
+            shift
+            ;;
+        -j|--jobs)
+            j="$2"
+            shift 2
+            ;;
+        -t|--timeout)
+            t="$2"
+            shift 2
+            ;;
+        -T|--cpu-limit)
+            T="$2"
+            shift 2
+            ;;
+        -W|--stall)
+            W="$2"
+            shift 2
+            ;;
         -A|--launcherA)
             A="$2"   # it could contain whitespace, so remember to quote it!
             shift 2
@@ -108,6 +160,54 @@ while true; do
             B="$2"   # it could contain whitespace, so remember to quote it!
             shift 2
             ;;
+        -S|--only-side)
+            S="$2"
+            shift 2
+            ;;
+        -N|--no-restore)
+            N=y
+            shift
+            ;;
+        -P|--shared-prefix)
+            P=y
+            shift
+            ;;
+        -K|--keep-prefix)
+            K=y
+            shift
+            ;;
+        -Q|--queue)
+            Q="$2"
+            shift 2
+            ;;
+        -m|--mem-budget)
+            m="$2"
+            shift 2
+            ;;
+        -Z|--scratch)
+            Z="$2"
+            shift 2
+            ;;
+        -z|--scratch-size)
+            z="$2"
+            shift 2
+            ;;
+        -n|--threads)
+            n="$2"
+            shift 2
+            ;;
+        -k|--pin)
+            k=y
+            shift
+            ;;
+        -C|--calibrate)
+            C=y
+            shift
+            ;;
+        -J|--jit)
+            J="$2"
+            shift 2
+            ;;
         --)
             shift
             break
@@ -120,7 +220,7 @@ while true; do
 done
 
 if [ $v = "y" ]; then
-    echo "OPTIONS: cleanup: $c, debug: $d, help: $h, output: $outDir, verbose: $v, sequential: $s, launcherA: $A, launcherB: $B"
+    echo "OPTIONS: cleanup: $c, debug: $d, help: $h, output: $outDir, verbose: $v, sequential: $s, resume: $R, jobs: $j, timeout: $t, cpu-limit: $T, stall: $W, launcherA: $A, launcherB: $B, only-side: $S, no-restore: $N, shared-prefix: $P, keep-prefix: $K, queue: $Q, mem-budget: $m, scratch: $Z, scratch-size: $z, threads: $n, pin: $k, calibrate: $C, jit: $J"
     echo "PARAMS: $*"
 fi
 
@@ -159,34 +259,206 @@ if [ ! -d "$BASECASE" ]; then
    exit 1
 fi
 
+# (with -P, the curves of the shared prefix are those of the cases found when it is
+# run, which with -J don't exist yet)
+if [ -n "$J" ] && { [ $C = "y" ] || [ -n "$Q" ] || [ $P = "y" ]; }; then
+   echo "Option --jit isn't supported together with --calibrate, --queue or --shared-prefix"
+   exit 1
+fi
+
+# (with -J, the cases don't exist yet)
 dirList=$(find_cmd)
-if [ -z "$dirList" ]; then
+if [ -z "$dirList" ] && [ $R = "n" ] && [ -z "$J" ]; then
    echo -e "No cases with pattern $CASE_PREFIX* found under $CASE_DIR"
    exit 1
 fi
 
+# In calibration mode (option -C), the sample cases are run into a temporary output
+# dir, without the shared prefix, and without deleting them
+if [ $C = "y" ]; then
+    CALIBRATION_FILE="$outDir"/../calibration.csv
+    outDir="$outDir"/.calibration
+    rm -rf "$outDir"
+    c=n P=n
+fi
+
 # Create the output dir if it doesn't exist
 mkdir -p "$outDir"
 
-# Run each contingency case (using GNU parallel if available)
+# With a work queue (option -Q), the cases may be run by other hosts, so all the
+# paths passed to them must be absolute
+if [ -n "$Q" ]; then
+    outDir=$(cd "$outDir" && pwd)
+    BASECASE=$(cd "$BASECASE" && pwd)
+fi
+
+# Run each contingency case (using our own job scheduler, which keeps a ledger
+# of the state of all jobs under the output dir, and retries failed cases). The
+# results are compressed by the scheduler, in the background (run_one_contg.sh's
+# option -z; see commons/contg_compress.py), so it's the scheduler who deletes the
+# cases (-c).
 declare -a OPTS
-if [ $c = "y" ]; then
-    OPTS=("-c" "-o" "$outDir" "-A" "$A" "-B" "$B" "$BASECASE")
-else
-    OPTS=("-o" "$outDir" "-A" "$A" "-B" "$B" "$BASECASE")
+OPTS=("-z" "-o" "$outDir" "-A" "$A" "-B" "$B" "$BASECASE")
+if [ -n "$S" ]; then
+    OPTS=("-S" "$S" "${OPTS[@]}")
+fi
+if [ $N = "y" ]; then
+    OPTS=("-N" "${OPTS[@]}")
+fi
+
+# All cases share the same undisturbed interval before the contingency event. With
+# option -P, it is simulated just once (for each Dynawo side), and the cases then
+# start from its dumped state (see commons/shared_prefix.py). The prefix case is a
+# hidden dir next to the cases, so that it doesn't match the case prefix. With option
+# -K, it is named after what it simulates instead, and it is kept for later calls,
+# which reuse it as long as it has all the curves of their cases.
+PREFIX_CASE=""
+if [ $P = "y" ] && [ "$S" != "none" ]; then
+    DWO_JOBINFO=$(python3 "$(dirname "$0")"/dwo_jobinfo.py "$BASECASE")
+    CASE_TYPE=$(echo "$DWO_JOBINFO" | grep -F "CASE_TYPE" | cut -d'=' -f2)
+    T_EVENT=$(echo "$DWO_JOBINFO" | grep -F "event_tEvent" | head -1 | cut -d'=' -f2)
+    declare -a PREFIX_JOBS=()
+    if [ "$CASE_TYPE" = "dwodwo" ]; then
+        if [ "$S" != "B" ]; then
+            JOB_FILE=$(echo "$DWO_JOBINFO" | grep -F "job_fileA" | cut -d'=' -f2)
+            PREFIX_JOBS+=("$(basename "$JOB_FILE")" "$A")
+        fi
+        if [ "$S" != "A" ]; then
+            JOB_FILE=$(echo "$DWO_JOBINFO" | grep -F "job_fileB" | cut -d'=' -f2)
+            PREFIX_JOBS+=("$(basename "$JOB_FILE")" "$B")
+        fi
+    else
+        JOB_FILE=$(echo "$DWO_JOBINFO" | grep -F "job_file" | cut -d'=' -f2)
+        if [ "${A:0:5}" = "astre" ]; then
+            [ "$S" = "A" ] || PREFIX_JOBS+=("$(basename "$JOB_FILE")" "$B")
+        else
+            [ "$S" = "B" ] || PREFIX_JOBS+=("$(basename "$JOB_FILE")" "$A")
+        fi
+    fi
+    if [ ${#PREFIX_JOBS[@]} -gt 0 ]; then
+        PREFIX_CASE=$(cd "$CASE_DIR" && pwd)/.PREFIX_"$CASE_PREFIX"
+        PREFIX_REUSED=n
+        if [ $K = "y" ]; then
+            PREFIX_KEY=$(echo "$(cd "$BASECASE" && pwd) $T_EVENT ${PREFIX_JOBS[*]}" | cksum | cut -d' ' -f1)
+            PREFIX_CASE=$(cd "$CASE_DIR" && pwd)/.PREFIX_"$PREFIX_KEY"
+            PREFIX_REUSED=y
+            for ((i = 0; i < ${#PREFIX_JOBS[@]}; i += 2)); do
+                python3 "$(dirname "$0")"/../../commons/shared_prefix.py covers "$PREFIX_CASE" \
+                        "${PREFIX_JOBS[$i]}" "$CASE_PREFIX" || PREFIX_REUSED=n
+            done
+        fi
+        if [ $PREFIX_REUSED = "y" ]; then
+            echo "*** Reusing the shared pre-contingency prefix: $PREFIX_CASE"
+            OPTS=("-x" "$PREFIX_CASE" "${OPTS[@]}")
+        else
+            echo "*** Simulating the shared pre-contingency prefix (event at t=$T_EVENT)"
+            if "$(dirname "$0")"/../../commons/run_shared_prefix.sh "$BASECASE" "$PREFIX_CASE" \
+                   "$CASE_PREFIX" "$T_EVENT" "${PREFIX_JOBS[@]}"; then
+                OPTS=("-x" "$PREFIX_CASE" "${OPTS[@]}")
+            else
+                echo "WARNING: the shared prefix failed; running the full simulation for all cases"
+            fi
+        fi
+    fi
+fi
+run_case=$(cd "$(dirname "$0")" && pwd)/run_one_contg.sh
+scheduler=$(dirname "$0")/../../commons/contg_scheduler.py
+
+# Calibration mode: run a sample of the cases under each split of the CPUs between
+# jobs and threads per case, and report the best one (see commons/contg_calibrate.py)
+if [ $C = "y" ]; then
+    declare -a CALIB_OPTS
+    CALIB_OPTS=("-C" "$CALIBRATION_FILE")
+    if [ -z "$S" ]; then
+        CALIB_OPTS=("${CALIB_OPTS[@]}" "--ab-opt=-C")
+    fi
+    set +e
+    python3 "$(dirname "$0")"/../../commons/contg_calibrate.py "${CALIB_OPTS[@]}" \
+            "$CASE_DIR" "$CASE_PREFIX" -- "$run_case" "${OPTS[@]}"
+    EXIT_VAL=$?
+    set -e
+    rm -rf "$outDir"
+    exit $EXIT_VAL
 fi
-run_case=$(dirname "$0")/run_one_contg.sh
-if [ $s = "y" ] || ! [ -x "$(type -p parallel)" ]; then
+
+if [ $s = "y" ]; then
     echo "*** Running sequentially"
-    # set +e   # allow to continue if any case fails
-    set -e 
-    find_cmd | while read -r CONTG_CASE; do
-	echo "   $CONTG_CASE"
-	$run_case "${OPTS[@]}" "$CONTG_CASE"	
-    done
-    set +e 
+    j=1
 else
-    echo "*** Running in parallel"
-    find_cmd | parallel -j 50% --verbose "$run_case" "${OPTS[@]}" {}
+    echo "*** Running in parallel (jobs: $j)"
+fi
+declare -a SCHED_OPTS
+# When there are more free job slots than cases left (i.e., at the tail end of the
+# run, or when running just a few cases), the scheduler runs the A and B sides of
+# each case concurrently (run_one_contg.sh's option -C), unless only one side is run
+SCHED_OPTS=("--verbose" "-j" "$j" "-l" "$outDir"/jobs_ledger.csv)
+if [ -z "$S" ]; then
+    SCHED_OPTS=("${SCHED_OPTS[@]}" "--ab-opt=-C")
+fi
+if [ $R = "y" ]; then
+    SCHED_OPTS=("${SCHED_OPTS[@]}" "--resume")
+fi
+if [ -n "$Q" ]; then
+    SCHED_OPTS=("${SCHED_OPTS[@]}" "--queue" "$Q")
+fi
+# Hung or too slow cases get killed, instead of blocking the run
+SCHED_OPTS=("${SCHED_OPTS[@]}" "--timeout" "$t" "--cpu-limit" "$T" "--stall" "$W")
+# The cases are dispatched longest-expected first, using the runtimes recorded in
+# previous runs. By default the runtime history is kept in the results basedir; set
+# DWO_VALIDATION_RUNTIMES to use a different file (e.g. to share it among campaigns
+# that are run on the same BASECASE but on different results dirs). Runs of a
+# single side are not recorded, since they only take about half the usual time.
+if [ -z "$S" ]; then
+    SCHED_OPTS=("${SCHED_OPTS[@]}" "-H" "${DWO_VALIDATION_RUNTIMES:-$outDir/../runtime_history.csv}")
+fi
+# New cases are only started when their expected peak memory (learnt from previous
+# runs, just like the runtimes) fits in the memory budget, and cases killed by the
+# OOM killer are retried at a lower concurrency. DWO_VALIDATION_MEMORY plays the same
+# role as DWO_VALIDATION_RUNTIMES, for the peak memory history. Runs that only
+# post-process the cases (-S none) are not recorded, since they don't simulate.
+if [ "$S" != "none" ]; then
+    SCHED_OPTS=("${SCHED_OPTS[@]}" "--mem-budget" "$m"
+                "-M" "${DWO_VALIDATION_MEMORY:-$outDir/../memory_history.csv}")
+fi
+# Each case is limited to the given threads (by default, one per case, unless set in
+# the environment), and optionally pinned to its own CPUs
+if [ -n "$n" ]; then
+    SCHED_OPTS=("${SCHED_OPTS[@]}" "--threads" "$n")
+fi
+if [ $k = "y" ]; then
+    SCHED_OPTS=("${SCHED_OPTS[@]}" "--pin")
+fi
+# When several campaigns are run at once (see commons/contg_campaign.py), their job
+# slots are taken from the pool of slots they share
+if [ -n "${DWO_VALIDATION_POOL:-}" ]; then
+    SCHED_OPTS=("${SCHED_OPTS[@]}" "--slot-pool" "$DWO_VALIDATION_POOL")
+fi
+# With a scratch area, the cases are run (and post-processed) in a copy of them
+if [ -n "$Z" ]; then
+    SCHED_OPTS=("${SCHED_OPTS[@]}" "--scratch" "$Z" "--scratch-size" "$z")
+fi
+if [ $c = "y" ]; then
+    SCHED_OPTS=("${SCHED_OPTS[@]}" "--cleanup")
+fi
+# With -J, each case is only created when it's about to be run (and it's deleted
+# once done), so that the disk used by the cases is bounded by the concurrency
+if [ -n "$J" ]; then
+    SCHED_OPTS=("${SCHED_OPTS[@]}" "--materialize" "$J")
+fi
+set +e    # allow the script to continue if any case fails
+python3 "$scheduler" "${SCHED_OPTS[@]}" \
+        "$CASE_DIR" "$CASE_PREFIX" -- "$run_case" "${OPTS[@]}"
+EXIT_VAL=$?
+set -e
+if [ -n "$PREFIX_CASE" ] && [ $K = "n" ]; then
+    rm -rf "$PREFIX_CASE"
+fi
+if [ "$EXIT_VAL" -ne 0 ]; then
+    if [ "$EXIT_VAL" -ge 1 ] && [ "$EXIT_VAL" -le 100 ]; then
+        echo "WARNING: $EXIT_VAL contingency jobs failed or timed out (see $outDir/jobs_ledger.csv)"
+    elif [ "$EXIT_VAL" = 101 ]; then
+        echo "WARNING: more than 100 contingency jobs failed or timed out (see $outDir/jobs_ledger.csv)"
+    else
+        echo "WARNING: contingency scheduler: unexpected exit value: $EXIT_VAL"
+    fi
 fi
-
@@ -38,6 +38,17 @@ Usage: $0 [OPTIONS] BASECASE CONTINGENCY_CASE
     -v | --verbose  More verbose output
     -A | --launcherA  Defines the launcher of simulator A
     -B | --launcherB  Defines the launcher of simulator B
+    -C | --concurrent Run the A and B simulations of the case concurrently
+    -S | --only-side  Only simulate this side (A or B); the results of the other side
+                      are restored from the ones already collected in the output dir
+                      (with "none", both sides are restored, and just post-processed)
+    -N | --no-restore With -S, don't restore the other side, and don't post-process:
+                      just collect the raw results of the simulated side
+    -x | --prefix     Start the Dynawo simulations from the state dumped by this shared
+                      prefix case (see run_shared_prefix.sh); absolute path
+    -z | --defer-compression  Don't compress the results, but just list them in
+                      CONTINGENCY_CASE/.compress_list, for the caller to compress them
+                      (see commons/contg_compress.py)
 
 EOF
 }
@@ -64,6 +75,44 @@ set_launcher() {
     esac
 }
 
+# Simulation results cache (see commons/sim_cache.py): enabled by pointing the
+# environment variable DWO_VALIDATION_CACHE to a cache dir. Each side of the case is
+# looked up separately, keyed on its input files and its launcher. These are called
+# from within the simulator's run dir, with the case dir given relative to it.
+cache_restore(){
+    CACHE_KEY=""
+    if [ -z "${DWO_VALIDATION_CACHE:-}" ]; then
+        return 1
+    fi
+    local version=""
+    if [ "${2:0:7}" = "dynawo:" ]; then
+        version=$($LAUNCHER version 2>&1 || true)
+    fi
+    CACHE_KEY=$(python3 "$SIM_CACHE_SCRIPT" key "$DWO_VALIDATION_CACHE" "$1" "$2" "$LAUNCHER" "$version")
+    if python3 "$SIM_CACHE_SCRIPT" restore "$DWO_VALIDATION_CACHE" "$CACHE_KEY" "$1"; then
+        echo "   (simulation results found in the cache: $CACHE_KEY)"
+        return 0
+    fi
+    return 1
+}
+
+# Compress a result into the output dir or, with option -z, just add it to the list
+# of results to be compressed later by the contingency scheduler, in the background
+# (see commons/contg_compress.py), so that this job doesn't have to wait for xz
+compress_result(){
+    if [ $z = "y" ]; then
+        echo "$1;$2" >> "$CONTG_CASE"/.compress_list
+    else
+        xz -c9 "$1" > "$2"
+    fi
+}
+
+cache_store(){
+    if [ -n "$CACHE_KEY" ]; then
+        python3 "$SIM_CACHE_SCRIPT" store "$DWO_VALIDATION_CACHE" "$CACHE_KEY" "$@" || true
+    fi
+}
+
 run_astre(){
     if [ ! -d "$CONTG_CASE"/Astre ]; then
         echo "Directory $CONTG_CASE/Astre not found."
@@ -74,17 +123,21 @@ run_astre(){
     RUNLOG=Astre.runStdout
     echo "Running Astre for case: $CONTG_CASE"
     set_launcher "$1"
-    $LAUNCHER donneesModelesEntree.xml > "$RUNLOG" 2>&1
-    if [ ! -f donneesModelesSortie.csv ]; then
-        echo "Astre run failed. Check the runlog: $CONTG_CASE/Astre/$RUNLOG"
-        exit 1
+    if ! cache_restore .. astre; then
+        $LAUNCHER donneesModelesEntree.xml > "$RUNLOG" 2>&1
+        if [ ! -f donneesModelesSortie.csv ]; then
+            echo "Astre run failed. Check the runlog: $CONTG_CASE/Astre/$RUNLOG"
+            exit 1
+        fi
+        cache_store .. Astre/donneesModelesSortie.csv Astre/donneesModelesSortie.xml \
+                    Astre/donneesModelesLog.xml Astre/"$RUNLOG"
     fi
     # Collect and compress all results
     cd "$OLD_PWD"
-    xz -c9 "$CONTG_CASE"/Astre/donneesModelesSortie.csv > "$outDir"/crv/"$prefix"-AstreCurves.csv.xz
-    xz -c9 "$CONTG_CASE"/Astre/donneesModelesSortie.xml > "$outDir"/xml/"$prefix"-AstreSortie.xml.xz
-    xz -c9 "$CONTG_CASE"/Astre/donneesModelesLog.xml    > "$outDir"/log/"$prefix"-AstreLog.xml.xz
-    xz -c9 "$CONTG_CASE"/Astre/"$RUNLOG"                > "$outDir"/log/"$prefix"-"$RUNLOG".xz
+    compress_result "$CONTG_CASE"/Astre/donneesModelesSortie.csv "$outDir"/crv/"$prefix"-AstreCurves.csv.xz
+    compress_result "$CONTG_CASE"/Astre/donneesModelesSortie.xml "$outDir"/xml/"$prefix"-AstreSortie.xml.xz
+    compress_result "$CONTG_CASE"/Astre/donneesModelesLog.xml    "$outDir"/log/"$prefix"-AstreLog.xml.xz
+    compress_result "$CONTG_CASE"/Astre/"$RUNLOG"                "$outDir"/log/"$prefix"-"$RUNLOG".xz
 }
 
 
@@ -97,22 +150,100 @@ run_dynawo(){
     cd "$CONTG_CASE"
     RUNLOG=Dynawo"$1".runStdout
     set_launcher "$2"
-    $LAUNCHER jobs "$DWO_JOBFILE" > "$RUNLOG" 2>&1 || true  # allow it to fail while using errexit flag
-    if [ ! -f ./"$DWO_OUTPUT_DIR"/curves/curves.csv ]; then
-        if [ -f ./"$DWO_OUTPUT_DIR"/curves/curves.xml ]; then
-            echo "Dynawo$1 run: output curves file found in XML format; required format is CSV"
-        else
-            echo "Dynawo$1 run: no curves output found. Check Dynawo's log and the run-log: $CONTG_CASE/$RUNLOG"
+    # With a shared prefix (option -x), a copy of the JOB that starts from its dumped
+    # state is run instead (see shared_prefix.py), and its outputs are then stitched
+    RUN_JOBFILE=$DWO_JOBFILE
+    if [ -n "$x" ]; then
+        RUN_JOBFILE=$(python3 "$SHARED_PREFIX_SCRIPT" apply . "$DWO_JOBFILE" "$x")
+    fi
+    if ! cache_restore . dynawo:"$RUN_JOBFILE"; then
+        $LAUNCHER jobs "$RUN_JOBFILE" > "$RUNLOG" 2>&1 || true  # allow it to fail while using errexit flag
+        if [ -n "$x" ]; then
+            rm -f "$RUN_JOBFILE"
         fi
-        exit 1
+        if [ ! -f ./"$DWO_OUTPUT_DIR"/curves/curves.csv ]; then
+            if [ -f ./"$DWO_OUTPUT_DIR"/curves/curves.xml ]; then
+                echo "Dynawo$1 run: output curves file found in XML format; required format is CSV"
+            else
+                echo "Dynawo$1 run: no curves output found. Check Dynawo's log and the run-log: $CONTG_CASE/$RUNLOG"
+            fi
+            exit 1
+        fi
+        if [ -n "$x" ]; then
+            python3 "$SHARED_PREFIX_SCRIPT" stitch . "$DWO_JOBFILE" "$x"
+        fi
+        cache_store . "$DWO_OUTPUT_DIR" "$RUNLOG"
+    fi
+    if [ -n "$x" ]; then
+        rm -f "$RUN_JOBFILE"
     fi
     # Collect and compress all results
     cd "$OLD_PWD"
-    xz -c9 "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/curves/curves.csv           > "$outDir"/crv/"$prefix"-DynawoCurves"$1".csv.xz
-    xz -c9 "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/constraints/constraints.xml > "$outDir"/xml/"$prefix"-DynawoConstraints"$1".xml.xz
-    xz -c9 "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/timeLine/timeline.xml       > "$outDir"/xml/"$prefix"-DynawoTimeLine"$1".xml.xz
-    xz -c9 "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/logs/dynawo.log             > "$outDir"/log/"$prefix"-Dynawo"$1".log.xz
-    xz -c9 "$CONTG_CASE"/"$RUNLOG"                                     > "$outDir"/log/"$prefix"-"$RUNLOG".xz
+    compress_result "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/curves/curves.csv           "$outDir"/crv/"$prefix"-DynawoCurves"$1".csv.xz
+    compress_result "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/constraints/constraints.xml "$outDir"/xml/"$prefix"-DynawoConstraints"$1".xml.xz
+    compress_result "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/timeLine/timeline.xml       "$outDir"/xml/"$prefix"-DynawoTimeLine"$1".xml.xz
+    compress_result "$CONTG_CASE"/"$DWO_OUTPUT_DIR"/logs/dynawo.log             "$outDir"/log/"$prefix"-Dynawo"$1".log.xz
+    compress_result "$CONTG_CASE"/"$RUNLOG"                                     "$outDir"/log/"$prefix"-"$RUNLOG".xz
+}
+
+# When re-simulating only one side of a case (option -S), the raw results of the
+# other side are restored from the compressed ones already collected in the output
+# dir (by a previous run), so that the post-processing finds the usual case dir
+restore_astre(){
+    echo "Restoring the Astre results for case: $CONTG_CASE"
+    xzcat "$outDir"/crv/"$prefix"-AstreCurves.csv.xz > "$CONTG_CASE"/Astre/donneesModelesSortie.csv
+    xzcat "$outDir"/xml/"$prefix"-AstreSortie.xml.xz > "$CONTG_CASE"/Astre/donneesModelesSortie.xml
+    xzcat "$outDir"/log/"$prefix"-AstreLog.xml.xz    > "$CONTG_CASE"/Astre/donneesModelesLog.xml
+}
+
+
+restore_dynawo(){
+    DWO_DIR="$CONTG_CASE"/"$DWO_OUTPUT_DIR"
+    echo "Restoring the Dynawo$1 results for case: $CONTG_CASE"
+    mkdir -p "$DWO_DIR"/curves "$DWO_DIR"/constraints "$DWO_DIR"/timeLine "$DWO_DIR"/logs
+    xzcat "$outDir"/crv/"$prefix"-DynawoCurves"$1".csv.xz      > "$DWO_DIR"/curves/curves.csv
+    xzcat "$outDir"/xml/"$prefix"-DynawoConstraints"$1".xml.xz > "$DWO_DIR"/constraints/constraints.xml
+    xzcat "$outDir"/xml/"$prefix"-DynawoTimeLine"$1".xml.xz    > "$DWO_DIR"/timeLine/timeline.xml
+    xzcat "$outDir"/log/"$prefix"-Dynawo"$1".log.xz            > "$DWO_DIR"/logs/dynawo.log
+}
+
+# When running the A and B simulations of a case concurrently (option -C), each
+# side is started in the background and then waited for; otherwise, each side just
+# runs right away
+declare -a SIDE_PIDS=()
+start_side(){
+    if [ "$C" = "y" ]; then
+        "$@" &
+        SIDE_PIDS+=($!)
+    else
+        "$@"
+    fi
+}
+
+# Runs side A or B (i.e., the given run_* command), unless only the other side is
+# being simulated (option -S), in which case its results are restored instead (or
+# just skipped, with option -N)
+start_sim(){
+    local side=$1
+    shift
+    if [ -n "$S" ] && [ "$S" != "$side" ]; then
+        if [ $N = "n" ]; then
+            "${1/run_/restore_}" "${@:2}"
+        fi
+    else
+        start_side "$@"
+    fi
+}
+
+wait_sides(){
+    local pid rc=0
+    for pid in "${SIDE_PIDS[@]}"; do
+        wait "$pid" || rc=$?
+    done
+    SIDE_PIDS=()
+    if [ $rc -ne 0 ]; then
+        exit $rc
+    fi
 }
 
 
@@ -128,8 +259,8 @@ if [[ ${PIPESTATUS[0]} -ne 4 ]]; then
     exit 1
 fi
 
-OPTIONS=cdho:vA:B:
-LONGOPTS=cleanup,debug,help,output:,verbose,launcherA:,launcherB:
+OPTIONS=cdho:vA:B:CS:Nx:z
+LONGOPTS=cleanup,debug,help,output:,verbose,launcherA:,launcherB:,concurrent,only-side:,no-restore,prefix:,defer-compression
 
 # -regarding ! and PIPESTATUS see above
 # -temporarily store output to be able to check for errors
@@ -145,7 +276,7 @@ fi
 # read getopt’s output this way to handle the quoting right:
 eval set -- "$PARSED"
 
-c=n d=n h=n outDir="RESULTS" v=n A="dynawo.sh" B="dynawo.sh"
+c=n d=n h=n outDir="RESULTS" v=n A="dynawo.sh" B="dynawo.sh" C=n S="" N=n x="" z=n
 # now enjoy the options in order and nicely split until we see --
 while true; do
     case "$1" in
@@ -177,6 +308,26 @@ while true; do
             B="$2"   # it could contain whitespace, so remember to quote it!
             shift 2
             ;;
+        -C|--concurrent)
+            C=y
+            shift
+            ;;
+        -S|--only-side)
+            S="$2"
+            shift 2
+            ;;
+        -N|--no-restore)
+            N=y
+            shift
+            ;;
+        -x|--prefix)
+            x="$2"
+            shift 2
+            ;;
+        -z|--defer-compression)
+            z=y
+            shift
+            ;;
         --)
             shift
             break
@@ -189,7 +340,7 @@ while true; do
 done
 
 if [ $v = "y" ]; then
-    echo "OPTIONS: cleanup: $c, debug: $d, help: $h, outDir: $outDir, verbose: $v, launcherA: $A, launcherB: $B"
+    echo "OPTIONS: cleanup: $c, debug: $d, help: $h, outDir: $outDir, verbose: $v, launcherA: $A, launcherB: $B, concurrent: $C, only-side: $S, no-restore: $N, prefix: $x, defer-compression: $z"
     echo "PARAMS: $*"
 fi
 
@@ -198,6 +349,11 @@ if [ $h = "y" ]; then
     exit 0
 fi
 
+if [ -n "$S" ] && [ "$S" != "A" ] && [ "$S" != "B" ] && [ "$S" != "none" ]; then
+    echo "$0: option --only-side must be either A, B or none"
+    exit 4
+fi
+
 # handle non-option arguments
 if [[ $# -ne 2 ]]; then
     echo
@@ -226,6 +382,8 @@ if [ ! -d "$CONTG_CASE" ]; then
    exit 1
 fi
 prefix=$(basename "$CONTG_CASE")
+SIM_CACHE_SCRIPT=$(cd "$(dirname "$0")"/../../commons && pwd)/sim_cache.py
+SHARED_PREFIX_SCRIPT=$(cd "$(dirname "$0")"/../../commons && pwd)/shared_prefix.py
 
 # Create the output dirs if they don't exist
 mkdir -p "$outDir"/crv
@@ -235,6 +393,10 @@ mkdir -p "$outDir"/log
 mkdir -p "$outDir"/casediffs
 
 
+# (a list left by a previous attempt would show up in the diffs below)
+rm -f "$CONTG_CASE"/.compress_list
+
+
 #################################################
 # Save the case compactly as diffs from BASECASE
 #################################################
@@ -271,33 +433,36 @@ CASE_TYPE=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "CASE_TYPE" |
 astrestring=${A:0:5}
 if [ "$CASE_TYPE" = "astdwo" ]; then
     if [ "$astrestring" == "astre" ]; then
-        run_astre "$A"
         DWO_JOBFILE=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "job_file" | cut -d'=' -f2)
         DWO_JOBFILE=$(basename "$DWO_JOBFILE")
         DWO_OUTPUT_DIR=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "outputs_directory" | cut -d'=' -f2)
-        run_dynawo "" "$B"
-        basename "$A" > "$outDir"/../.LAUNCHER_A_WAS_"$A" 2>&1 "$outDir"/../.LAUNCHER_A_WAS_"$A" || true
-        basename "$B" version > "$outDir"/../.LAUNCHER_B_WAS_"$B" 2>&1 "$outDir"/../.LAUNCHER_B_WAS_"$B" || true
+        start_sim A run_astre "$A"
+        start_sim B run_dynawo "" "$B"
+        wait_sides
+        [ "$S" = "B" ] || basename "$A" > "$outDir"/../.LAUNCHER_A_WAS_"$A" 2>&1 "$outDir"/../.LAUNCHER_A_WAS_"$A" || true
+        [ "$S" = "A" ] || basename "$B" version > "$outDir"/../.LAUNCHER_B_WAS_"$B" 2>&1 "$outDir"/../.LAUNCHER_B_WAS_"$B" || true
     else
         DWO_JOBFILE=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "job_file" | cut -d'=' -f2)
         DWO_JOBFILE=$(basename "$DWO_JOBFILE")
         DWO_OUTPUT_DIR=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "outputs_directory" | cut -d'=' -f2)
-        run_dynawo "" "$A"
-        run_astre "$B"
-        basename "$A" version > "$outDir"/../.LAUNCHER_A_WAS_"$A" 2>&1 "$outDir"/../.LAUNCHER_A_WAS_"$A" || true 
-        basename "$B" > "$outDir"/../.LAUNCHER_B_WAS_"$B" 2>&1 "$outDir"/../.LAUNCHER_B_WAS_"$B" || true 
+        start_sim A run_dynawo "" "$A"
+        start_sim B run_astre "$B"
+        wait_sides
+        [ "$S" = "B" ] || basename "$A" version > "$outDir"/../.LAUNCHER_A_WAS_"$A" 2>&1 "$outDir"/../.LAUNCHER_A_WAS_"$A" || true 
+        [ "$S" = "A" ] || basename "$B" > "$outDir"/../.LAUNCHER_B_WAS_"$B" 2>&1 "$outDir"/../.LAUNCHER_B_WAS_"$B" || true 
     fi
 else
     DWO_JOBFILE=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "job_fileA" | cut -d'=' -f2)
     DWO_JOBFILE=$(basename "$DWO_JOBFILE")
     DWO_OUTPUT_DIR=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "outputs_directoryA" | cut -d'=' -f2)
-    run_dynawo "A" "$A"
+    start_sim A run_dynawo "A" "$A"
     DWO_JOBFILE=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "job_fileB" | cut -d'=' -f2)
     DWO_JOBFILE=$(basename "$DWO_JOBFILE")
     DWO_OUTPUT_DIR=$(python3 "$DWO_JOBINFO_SCRIPT" "$CONTG_CASE" | grep -F "outputs_directoryB" | cut -d'=' -f2)
-    run_dynawo "B" "$B"
-    basename "$A" version > "$outDir"/../.LAUNCHER_A_WAS_"$A" 2>&1 "$outDir"/../.LAUNCHER_A_WAS_"$A" || true 
-    basename "$B" version > "$outDir"/../.LAUNCHER_B_WAS_"$B" 2>&1 "$outDir"/../.LAUNCHER_B_WAS_"$B" || true
+    start_sim B run_dynawo "B" "$B"
+    wait_sides
+    [ "$S" = "B" ] || basename "$A" version > "$outDir"/../.LAUNCHER_A_WAS_"$A" 2>&1 "$outDir"/../.LAUNCHER_A_WAS_"$A" || true 
+    [ "$S" = "A" ] || basename "$B" version > "$outDir"/../.LAUNCHER_B_WAS_"$B" 2>&1 "$outDir"/../.LAUNCHER_B_WAS_"$B" || true
 fi
 
 
@@ -305,17 +470,19 @@ fi
 # Extract automata changes
 ########################################
 # Extracts EVENTS from the xml output to CSV, using standardized
-# labels to allow comparison
+# labels to allow comparison (unless there's just one side's raw results, with -N)
 scripts_basedir=$(dirname "$0")
-python3 "$scripts_basedir"/extract_automata_changes.py "$CONTG_CASE" "$outDir"/../
+if [ $N = "n" ]; then
+    python3 "$scripts_basedir"/extract_automata_changes.py "$CONTG_CASE" "$outDir"/../
 
-# Collect and compress all results
-if [ "$CASE_TYPE" = "astdwo" ]; then
-    xz -c9 "$CONTG_CASE"/Astre/Astre_automata_changes.csv > "$outDir"/aut/"$prefix"-AstreAutomata.csv.xz
-    xz -c9 "$CONTG_CASE"/Dynawo_automata_changes.csv      > "$outDir"/aut/"$prefix"-DynawoAutomata.csv.xz
-else
-    xz -c9 "$CONTG_CASE"/DynawoA_automata_changes.csv      > "$outDir"/aut/"$prefix"-DynawoAutomataA.csv.xz
-    xz -c9 "$CONTG_CASE"/DynawoB_automata_changes.csv      > "$outDir"/aut/"$prefix"-DynawoAutomataB.csv.xz
+    # Collect and compress all results
+    if [ "$CASE_TYPE" = "astdwo" ]; then
+        compress_result "$CONTG_CASE"/Astre/Astre_automata_changes.csv "$outDir"/aut/"$prefix"-AstreAutomata.csv.xz
+        compress_result "$CONTG_CASE"/Dynawo_automata_changes.csv      "$outDir"/aut/"$prefix"-DynawoAutomata.csv.xz
+    else
+        compress_result "$CONTG_CASE"/DynawoA_automata_changes.csv      "$outDir"/aut/"$prefix"-DynawoAutomataA.csv.xz
+        compress_result "$CONTG_CASE"/DynawoB_automata_changes.csv      "$outDir"/aut/"$prefix"-DynawoAutomataB.csv.xz
+    fi
 fi
 
 
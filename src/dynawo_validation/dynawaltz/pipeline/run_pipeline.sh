@@ -61,6 +61,7 @@ RUN_OPTS=("-v" "-c")
 
 # Nothing else to configure below this point
 CONTG_SRC=$DWO_VALIDATION_SRC/pipeline
+COMMONS_SRC=$DWO_VALIDATION_SRC/../commons
 GREEN="\\033[1;32m"
 NC="\\033[0m"
 
@@ -76,9 +77,42 @@ Usage: $0 [OPTIONS] BASECASE RESULTS_DIR
   Options:
     -A | --launcherA  Defines the launcher of simulator A
     -B | --launcherB  Defines the launcher of simulator B
+    -L | --launchers  Compare N launchers in one run, giving this once per launcher, as
+                      LAUNCHER or LABEL=LAUNCHER (overrides -A and -B); on Astre vs.
+                      Dynawo basecases, only Astre vs. Dynawo pairs are compared
     -a | --allcontg   Run all the contingencies
     -l | --regexlist  Run all the contingencies of a .txt file
     -r | --random     Run a different random sample of contingencies
+    -s | --sequential Run jobs sequentially (defult is parallel)
+    -R | --resume     Resume an interrupted run, skipping the cases already completed
+    -j | --jobs       Number of parallel jobs, or percentage of CPU cores (default: 50%)
+    -t | --timeout    Wall-clock limit per case, in seconds
+    -T | --cpu-limit  CPU-time limit per case, in seconds
+    -W | --stall      Kill a case if its files show no progress for this many seconds
+    -S | --only-side  Re-simulate only side A or B of the cases already in RESULTS_DIR
+    -P | --shared-prefix  Simulate the pre-contingency interval only once, for all cases
+    -Q | --queue      Work queue dir (on shared storage), for running the cases on several hosts
+    -m | --mem-budget Memory budget for the running cases, in MB or % of the RAM (0: no limit)
+    -O | --overlap    Create the cases of the next device type, and aggregate the results of
+                      the previous one, while simulating the current one
+    -Z | --scratch    Run each case in a scratch dir (e.g. /dev/shm), writing back only its results
+    -z | --scratch-size  Size cap of the scratch area, in MB or % of its filesystem (default: 50%)
+    -n | --threads    Threads per case (OpenMP, BLAS, xz...) (default: 1)
+    -k | --pin        Pin each case to its own CPUs
+    -C | --calibrate  Only find the best split of the CPUs between jobs and threads per case,
+                      on a sample of the cases of each device type (see calibration.csv)
+    -e | --estimate   Only estimate the wall time and disk usage of the run, from the runtime
+                      history and the BASECASE (without creating or running any cases)
+    -b | --time-budget  Sample as many contingencies of each device type as fit in this many
+                      hours (needs a runtime history, or the Dynawo logs of the BASECASE)
+    -H | --shard      Run only one shard of the contingencies: device:DEV[,DEV...], hash:K/N
+                      or region:K/N (K-th of N, by case name or by substation)
+    -M | --merge      Don't run anything: merge the results dirs of the shards given (once per
+                      shard) into RESULTS_DIR, as if the whole campaign had been run in one go
+    -J | --jit        Create each case just in time, right before simulating it, and delete it
+                      once done, so that the disk used by the cases is bounded by the concurrency
+    -d | --debug      More debug messages
+    -c | --cleanup    Delete input cases after getting the results
     -h | --help       This help message
 EOF
 }
@@ -102,8 +136,8 @@ if [[ ${PIPESTATUS[0]} -ne 4 ]]; then
 fi
 
 
-OPTIONS=A:B:hal:rsdc
-LONGOPTS=launcherB:,launcherA:,help,allcontg,regexlist:,random,sequential,debug,cleanup
+OPTIONS=A:B:L:hal:rsRj:t:T:W:S:PQ:m:OZ:z:n:kCeb:H:M:Jdc
+LONGOPTS=launcherB:,launcherA:,launchers:,help,allcontg,regexlist:,random,sequential,resume,jobs:,timeout:,cpu-limit:,stall:,only-side:,shared-prefix,queue:,mem-budget:,overlap,scratch:,scratch-size:,threads:,pin,calibrate,estimate,time-budget:,shard:,merge:,jit,debug,cleanup
 
 # -regarding ! and PIPESTATUS see above
 # -temporarily store output to be able to check for errors
@@ -119,7 +153,8 @@ fi
 # read getopt’s output this way to handle the quoting right:
 eval set -- "$PARSED"
 
-A="dynawo.sh" B="dynawo.sh" h=n allcontg=n regexlist="None" random=n sequential=n debug=n cleanup=n
+A="dynawo.sh" B="dynawo.sh" h=n allcontg=n regexlist="None" random=n sequential=n debug=n cleanup=n jobs="None" resume=n timeout="None" cpulimit="None" stall="None" onlyside="None" sharedprefix=n queue="None" membudget="None" overlap=n scratch="None" scratchsize="None" threads="None" pin=n calibrate=n estimate=n timebudget="None" shard="None" jit=n
+declare -a LAUNCHERS=() SHARDS=()
 # now enjoy the options in order and nicely split until we see --
 while true; do
     case "$1" in
@@ -133,6 +168,10 @@ while true; do
             echo "Launcher B defined as $B"
             shift 2
             ;;
+        -L|--launchers)
+            LAUNCHERS+=("$2")
+            shift 2
+            ;;
         -h|--help)
             h=y
             shift
@@ -154,6 +193,86 @@ while true; do
             sequential=y
             shift
             ;;
+        -R|--resume)
+            resume=y
+            shift
+            ;;
+        -j|--jobs)
+            jobs="$2"
+            shift 2
+            ;;
+        -t|--timeout)
+            timeout="$2"
+            shift 2
+            ;;
+        -T|--cpu-limit)
+            cpulimit="$2"
+            shift 2
+            ;;
+        -W|--stall)
+            stall="$2"
+            shift 2
+            ;;
+        -S|--only-side)
+            onlyside="$2"
+            shift 2
+            ;;
+        -P|--shared-prefix)
+            sharedprefix=y
+            shift
+            ;;
+        -Q|--queue)
+            queue="$2"
+            shift 2
+            ;;
+        -m|--mem-budget)
+            membudget="$2"
+            shift 2
+            ;;
+        -O|--overlap)
+            overlap=y
+            shift
+            ;;
+        -Z|--scratch)
+            scratch="$2"
+            shift 2
+            ;;
+        -z|--scratch-size)
+            scratchsize="$2"
+            shift 2
+            ;;
+        -n|--threads)
+            threads="$2"
+            shift 2
+            ;;
+        -k|--pin)
+            pin=y
+            shift
+            ;;
+        -C|--calibrate)
+            calibrate=y
+            shift
+            ;;
+        -e|--estimate)
+            estimate=y
+            shift
+            ;;
+        -b|--time-budget)
+            timebudget="$2"
+            shift 2
+            ;;
+        -H|--shard)
+            shard="$2"
+            shift 2
+            ;;
+        -M|--merge)
+            SHARDS+=("$2")
+            shift 2
+            ;;
+        -J|--jit)
+            jit=y
+            shift
+            ;;
         -d|--debug)
             debug=y
             shift
@@ -197,6 +316,74 @@ if [ "$allcontg" == "y" ]; then
     fi    
 fi
 
+if [ "$resume" == "y" ]; then
+    if [ "$random" == "y" ]; then
+        echo "ERROR: Option --resume and --random aren't supported together"
+        exit 1
+    fi
+fi
+
+
+if [ "$onlyside" != "None" ]; then
+    if [ "$onlyside" != "A" ] && [ "$onlyside" != "B" ]; then
+        echo "ERROR: Option --only-side must be either A or B"
+        exit 1
+    fi
+    if [ "$resume" == "y" ]; then
+        echo "ERROR: Option --only-side and --resume aren't supported together"
+        exit 1
+    fi
+fi
+
+if [ ${#LAUNCHERS[@]} -gt 0 ]; then
+    if [ ${#LAUNCHERS[@]} -eq 1 ]; then
+        echo "ERROR: Option --launchers must be given at least twice"
+        exit 1
+    fi
+    if [ "$onlyside" != "None" ] || [ "$resume" == "y" ] || [ "$overlap" == "y" ] || [ "$calibrate" == "y" ]; then
+        echo "ERROR: Option --launchers isn't supported together with --only-side, --resume, --overlap or --calibrate"
+        exit 1
+    fi
+fi
+
+if [ "$estimate" == "y" ] || [ "$timebudget" != "None" ]; then
+    if [ "$onlyside" != "None" ] || [ "$resume" == "y" ] || [ "$calibrate" == "y" ] || [ ${#LAUNCHERS[@]} -gt 0 ]; then
+        echo "ERROR: Options --estimate and --time-budget aren't supported together with --only-side, --resume, --calibrate or --launchers"
+        exit 1
+    fi
+fi
+
+if [ "$shard" != "None" ]; then
+    if [ "$random" == "y" ] || [ "$estimate" == "y" ] || [ "$timebudget" != "None" ] || [ ${#LAUNCHERS[@]} -gt 0 ]; then
+        echo "ERROR: Option --shard isn't supported together with --random, --estimate, --time-budget or --launchers"
+        exit 1
+    fi
+    if ! SHARD_TXT=$(python3 "$COMMONS_SRC"/contg_shard.py devices "$shard"); then
+        echo "$SHARD_TXT"
+        exit 1
+    fi
+fi
+
+if [ ${#SHARDS[@]} -gt 0 ]; then
+    if [ "$shard" != "None" ] || [ "$onlyside" != "None" ] || [ "$resume" == "y" ] || [ "$calibrate" == "y" ] || [ "$estimate" == "y" ] || [ "$timebudget" != "None" ] || [ ${#LAUNCHERS[@]} -gt 0 ]; then
+        echo "ERROR: Option --merge isn't supported together with --shard, --only-side, --resume, --calibrate, --estimate, --time-budget or --launchers"
+        exit 1
+    fi
+fi
+
+if [ "$jit" = "y" ]; then
+    if [ "$onlyside" != "None" ] || [ "$queue" != "None" ] || [ "$calibrate" == "y" ] || [ "$sharedprefix" = "y" ] || [ ${#LAUNCHERS[@]} -gt 0 ] || [ ${#SHARDS[@]} -gt 0 ]; then
+        echo "ERROR: Option --jit isn't supported together with --only-side, --queue, --calibrate, --shared-prefix, --launchers or --merge"
+        exit 1
+    fi
+fi
+
+if [ "$timebudget" != "None" ]; then
+    if [ "$allcontg" == "y" ] || [ "$regexlist" != "None" ]; then
+        echo "ERROR: Option --time-budget isn't supported together with --allcontg or --regexlist"
+        exit 1
+    fi
+fi
 
 if [ $h = "y" ]; then
     usage
@@ -209,6 +396,87 @@ if [ $sequential = "y" ]; then
     runallopts+=$space
 fi
 
+if [ $resume = "y" ]; then
+    runallopts+=-R
+    runallopts+=$space
+fi
+
+if [ "$jobs" != "None" ]; then
+    runallopts+="-j $jobs"
+    runallopts+=$space
+fi
+
+# The contingency cases are also created in parallel (see commons/contg_create.py)
+if [ $sequential = "y" ]; then
+    CREATE_JOBS_OPTS=("-j" "1")
+elif [ "$jobs" != "None" ]; then
+    CREATE_JOBS_OPTS=("-j" "$jobs")
+else
+    CREATE_JOBS_OPTS=("-j" "100%")
+fi
+
+if [ "$timeout" != "None" ]; then
+    runallopts+="-t $timeout"
+    runallopts+=$space
+fi
+
+if [ "$cpulimit" != "None" ]; then
+    runallopts+="-T $cpulimit"
+    runallopts+=$space
+fi
+
+if [ "$stall" != "None" ]; then
+    runallopts+="-W $stall"
+    runallopts+=$space
+fi
+
+if [ "$onlyside" != "None" ]; then
+    runallopts+="-S $onlyside"
+    runallopts+=$space
+fi
+
+# (the shared prefix is simulated once for the whole run, and reused for all types
+# of devices; see run_all_contg.sh's option -K)
+if [ $sharedprefix = "y" ]; then
+    runallopts+="-P -K"
+    runallopts+=$space
+fi
+
+if [ "$queue" != "None" ]; then
+    runallopts+="-Q $queue"
+    runallopts+=$space
+fi
+
+if [ "$membudget" != "None" ]; then
+    runallopts+="-m $membudget"
+    runallopts+=$space
+fi
+
+if [ "$scratch" != "None" ]; then
+    runallopts+="-Z $scratch"
+    runallopts+=$space
+fi
+
+if [ "$scratchsize" != "None" ]; then
+    runallopts+="-z $scratchsize"
+    runallopts+=$space
+fi
+
+if [ "$threads" != "None" ]; then
+    runallopts+="-n $threads"
+    runallopts+=$space
+fi
+
+if [ $pin = "y" ]; then
+    runallopts+=-k
+    runallopts+=$space
+fi
+
+if [ $calibrate = "y" ]; then
+    runallopts+=-C
+    runallopts+=$space
+fi
+
 if [ $debug = "y" ]; then
     runallopts+=-d
     runallopts+=$space
@@ -240,77 +508,401 @@ if [ -f "$RESULTS_BASEDIR" ]; then
    echo "ERROR: Results directory $RESULTS_BASEDIR is an existing file!!!"
    exit 1
 fi
+
+##################################################################
+# Estimate the cost of the run, or fit it in a time budget: dry
+# runs of the contingency creation, with the costs taken from the
+# runtime history and the BASECASE (see commons/contg_estimate.py)
+##################################################################
+declare -A MAX_NCASES_BY_DEVICE=()
+if [ "$estimate" = "y" ] || [ "$timebudget" != "None" ]; then
+    colormsg "*** ESTIMATING THE COST OF THE RUN:"
+    DRY_RUN_DIR=$(mktemp -d)
+    declare -a DRY_RUN_OPTS=()
+    declare -a ESTIMATE_OPTS=("-j" "50%")
+    if [ "$allcontg" = "y" ] || [ "$timebudget" != "None" ]; then
+        # (with a time budget, the whole population, to sample from)
+        DRY_RUN_OPTS+=("-a")
+    fi
+    if [ "$regexlist" != "None" ]; then
+        DRY_RUN_OPTS+=("-t" "$regexlist")
+    elif [ "$random" = "y" ]; then
+        DRY_RUN_OPTS+=("-r")
+    fi
+    if [ "$timebudget" != "None" ]; then
+        ESTIMATE_OPTS+=("-b" "$timebudget" "-o" "$DRY_RUN_DIR"/ncases.csv)
+    fi
+    if [ $sequential = "y" ]; then
+        ESTIMATE_OPTS+=("-j" "1")
+    elif [ "$jobs" != "None" ]; then
+        ESTIMATE_OPTS+=("-j" "$jobs")
+    fi
+    if [ "$threads" != "None" ]; then
+        ESTIMATE_OPTS+=("-n" "$threads")
+    fi
+    declare -a DRY_RUNS=()
+    for DEVICE in "${!create_contg[@]}"; do
+        python3 "$CONTG_SRC"/"${create_contg[$DEVICE]}" "${DRY_RUN_OPTS[@]}" -n "$BASECASE" \
+                >| "$DRY_RUN_DIR"/"$DEVICE".txt
+        DRY_RUNS+=("$DEVICE"="$DRY_RUN_DIR"/"$DEVICE".txt)
+    done
+    set -x
+    python3 "$COMMONS_SRC"/contg_estimate.py "${ESTIMATE_OPTS[@]}" \
+            -H "${DWO_VALIDATION_RUNTIMES:-$RESULTS_BASEDIR/runtime_history.csv}" \
+            "$BASECASE" "$RESULTS_BASEDIR" "${DRY_RUNS[@]}"
+    set +x
+    echo
+    if [ "$estimate" = "y" ]; then
+        rm -rf "$DRY_RUN_DIR"
+        exit 0
+    fi
+    while IFS=";" read -r DEVICE NCASES; do
+        MAX_NCASES_BY_DEVICE[$DEVICE]=$NCASES
+    done < "$DRY_RUN_DIR"/ncases.csv
+    rm -rf "$DRY_RUN_DIR"
+fi
+
 echo "Generating results under directory: $RESULTS_BASEDIR"
 mkdir -p "$RESULTS_BASEDIR"
+if [ "$shard" != "None" ]; then
+    echo "$shard" >| "$RESULTS_BASEDIR"/shard.txt
+fi
 
+# When re-simulating only one side, the launcher of the other side is the one
+# recorded by the original run (it's only used for telling the case types apart),
+# and the record of the previous launcher of the re-simulated side is replaced
+if [ "$onlyside" = "A" ]; then
+    marker=$(find "$RESULTS_BASEDIR" -maxdepth 1 -name ".LAUNCHER_B_WAS_*" | head -1)
+    if [ -n "$marker" ]; then
+        B=${marker##*/.LAUNCHER_B_WAS_}
+    fi
+    rm -f "$RESULTS_BASEDIR"/.LAUNCHER_A_WAS_*
+elif [ "$onlyside" = "B" ]; then
+    marker=$(find "$RESULTS_BASEDIR" -maxdepth 1 -name ".LAUNCHER_A_WAS_*" | head -1)
+    if [ -n "$marker" ]; then
+        A=${marker##*/.LAUNCHER_A_WAS_}
+    fi
+    rm -f "$RESULTS_BASEDIR"/.LAUNCHER_B_WAS_*
+fi
+
+
+# Run a create script; or, with --jit, just keep its command line for the contingency
+# scheduler, which keeps it running in serve mode, and has each case created right
+# before simulating it (see commons/contg_materialize.py)
+run_create()
+{
+    if [ "$jit" = "y" ]; then
+        JIT_CREATE_CMD=$(printf '%q ' python3 "$1" -s "${@:2}")
+        echo "The cases will be created just in time, by: $JIT_CREATE_CMD"
+    else
+        set -x
+        python3 "$@"
+        set +x
+    fi
+}
 
 # Process all devices from the list
-for DEVICE in "${!create_contg[@]}"; do
-    colormsg "****** PROCESSING: $DEVICE"s
-    echo
-    
+create_cases()
+{
+    local DEVICE=$1
+    local RESULTS_DIR="$RESULTS_BASEDIR"/"$DEVICE"
     colormsg "*** CREATING CONTINGENCY CASES:"
     rm -rf "$CASE_DIR"/"$DEVICE"_*
-    if [ "$allcontg" = "n" ]; then
+    declare -a RESUME_OPTS=()
+    if [ "$resume" = "y" ] && [ -d "$RESULTS_DIR" ]; then
+        # Don't create again the cases that were already completed
+        python3 "$COMMONS_SRC"/contg_resume.py "$RESULTS_DIR" "$DEVICE"_ >| "$RESULTS_DIR"/resume_done_cases.txt
+        echo "Resuming: $(wc -l < "$RESULTS_DIR"/resume_done_cases.txt) cases already completed"
+        RESUME_OPTS=("-x" "$RESULTS_DIR"/resume_done_cases.txt)
+    fi
+    # In a shard, also skip the cases of the other shards (see commons/contg_shard.py)
+    if [ "$shard" != "None" ] && [ "$onlyside" = "None" ]; then
+        local EXCLUDE_FILE="$RESULTS_BASEDIR"/.shard_exclude_"$DEVICE".txt
+        declare -a SHARD_OPTS=()
+        if [ "$allcontg" = "y" ]; then
+            SHARD_OPTS+=("-a")
+        fi
+        if [ "$regexlist" != "None" ]; then
+            SHARD_OPTS+=("-t" "$regexlist")
+        fi
+        python3 "$CONTG_SRC"/"${create_contg[$DEVICE]}" "${SHARD_OPTS[@]}" -n "$BASECASE" \
+            | python3 "$COMMONS_SRC"/contg_shard.py exclude "$shard" >| "$EXCLUDE_FILE"
+        if [ ${#RESUME_OPTS[@]} -gt 0 ]; then
+            cat "${RESUME_OPTS[1]}" >> "$EXCLUDE_FILE"
+        fi
+        RESUME_OPTS=("-x" "$EXCLUDE_FILE")
+    fi
+    if [ "$onlyside" != "None" ]; then
+       # Re-create exactly the contingency set of the original run, from the case diffs
+       if [ -d "$RESULTS_DIR" ]; then
+          ncases=$(python3 "$COMMONS_SRC"/contg_casediffs.py "$BASECASE" "$RESULTS_DIR" "$DEVICE"_ | wc -l)
+          echo "Re-simulating side $onlyside of $ncases cases already in $RESULTS_DIR"
+       fi
+    elif [ "$allcontg" = "n" ]; then
        if [ "$regexlist" = "None" ]; then
+          # The sample size that fits in the time budget (if any)
+          declare -a BUDGET_OPTS=()
+          if [ -n "${MAX_NCASES_BY_DEVICE[$DEVICE]:-}" ]; then
+             BUDGET_OPTS=("-m" "${MAX_NCASES_BY_DEVICE[$DEVICE]}")
+          fi
           if [ "$random" = "n" ]; then
-             set -x
-             python3 "$CONTG_SRC"/"${create_contg[$DEVICE]}" "$BASECASE"
-             set +x
+             run_create "$CONTG_SRC"/"${create_contg[$DEVICE]}" "${RESUME_OPTS[@]}" "${CREATE_JOBS_OPTS[@]}" "${BUDGET_OPTS[@]}" "$BASECASE"
           else
-             set -x
-             python3 "$CONTG_SRC"/"${create_contg[$DEVICE]}" "-r" "$BASECASE"
-             set +x   
+             run_create "$CONTG_SRC"/"${create_contg[$DEVICE]}" "${RESUME_OPTS[@]}" "${CREATE_JOBS_OPTS[@]}" "${BUDGET_OPTS[@]}" "-r" "$BASECASE"
           fi   
        else
-          set -x
-          python3 "$CONTG_SRC"/"${create_contg[$DEVICE]}" "-t" "$regexlist" "$BASECASE"
-          set +x
+          run_create "$CONTG_SRC"/"${create_contg[$DEVICE]}" "${RESUME_OPTS[@]}" "${CREATE_JOBS_OPTS[@]}" "-t" "$regexlist" "$BASECASE"
        fi
     else
        if [ "$regexlist" = "None" ]; then
-          set -x
-          python3 "$CONTG_SRC"/"${create_contg[$DEVICE]}" "-a" "$BASECASE"
-          set +x
+          run_create "$CONTG_SRC"/"${create_contg[$DEVICE]}" "${RESUME_OPTS[@]}" "${CREATE_JOBS_OPTS[@]}" "-a" "$BASECASE"
        else
-          set -x
-          python3 "$CONTG_SRC"/"${create_contg[$DEVICE]}" "-t" "$regexlist" "-a" "$BASECASE"
-          set +x
+          run_create "$CONTG_SRC"/"${create_contg[$DEVICE]}" "${RESUME_OPTS[@]}" "${CREATE_JOBS_OPTS[@]}" "-t" "$regexlist" "-a" "$BASECASE"
        fi
     fi
     echo
-    
+}
+
+run_cases()
+{
+    local DEVICE=$1
+    local RESULTS_DIR="$RESULTS_BASEDIR"/"$DEVICE"
+    CASES_RUN=n
     dirList=$(find_cmd "$DEVICE"_)
-    if [ -z "$dirList" ]; then
+    if [ -z "$dirList" ] && [ "$jit" = "n" ] && { [ "$resume" = "n" ] || [ ! -d "$RESULTS_DIR"/crv ]; }; then
        echo -e "No cases with pattern $DEVICE""_* found under $CASE_DIR"
+       return
+    fi
+    colormsg "*** RUNNING CONTINGENCY CASES:"
+    mkdir -p "$RESULTS_DIR"
+    declare -a JIT_OPTS=()
+    if [ "$jit" = "y" ]; then
+        JIT_OPTS=("-J" "$JIT_CREATE_CMD")
+    fi
+    set -x
+    "$CONTG_SRC"/run_all_contg.sh "${RUN_OPTS[@]}" "${JIT_OPTS[@]}" $runallopts -o "$RESULTS_DIR" -A "$A" -B "$B" "$CASE_DIR" "$BASECASE" "$DEVICE"_
+    set +x
+    echo
+    # In calibration mode, there are no results to aggregate. When resuming, they
+    # are always aggregated again, even if no case was left to run, since the
+    # interrupted run may have been killed while aggregating them.
+    if [ $calibrate = "n" ]; then
+        CASES_RUN=y
+    fi
+}
+
+aggregate_results()
+{
+    local DEVICE=$1
+    local RESULTS_DIR="$RESULTS_BASEDIR"/"$DEVICE"
+    colormsg "*** COMPUTING CURVE METRICS:"
+    python3 "$CONTG_SRC"/calc_curve_diffmetrics.py "$RESULTS_DIR"/crv "$DEVICE"_ "$BASECASE"
+    echo
+
+    colormsg "*** COMPUTING TOP 10 DIFFS:"
+    python3 "$DWO_VALIDATION_SRC"/pipeline/top_10_diffs_dwaltz.py "$RESULTS_DIR"/metrics/crv_reducedparams.csv >| "$RESULTS_DIR"/../top_10_diffs_"$DEVICE".txt
+    echo
+
+    colormsg "*** COMPUTING AUTOMATA EVENT METRICS:"
+    python3 "$CONTG_SRC"/calc_automata_diffmetrics.py "$RESULTS_DIR"/aut "$DEVICE"_ "$BASECASE"
+    echo
+
+    create_notebook "$DEVICE"
+}
+
+create_notebook()
+{
+    local DEVICE=$1
+    local RESULTS_DIR="$RESULTS_BASEDIR"/"$DEVICE"
+    colormsg "*** CREATING NOTEBOOK:"
+    python3 "$DWO_VALIDATION_SRC"/notebooks/generate_notebooks.py "$(cd "$(dirname "$RESULTS_DIR")"; pwd)/$DEVICE" "$BASECASE" "$DEVICE"_
+    mkdir -p "$RESULTS_DIR"/notebooks
+    cp "$DWO_VALIDATION_SRC""/notebooks/simulator_A_vs_simulator_B_final.ipynb" "$RESULTS_DIR"/notebooks
+    rm "$DWO_VALIDATION_SRC""/notebooks/simulator_A_vs_simulator_B_final.ipynb"
+    echo
+}
+
+# Wait for a background phase (see below), and then show its output
+wait_phase()
+{
+    local PID=$1 PHASE_LOG=$2
+    if wait "$PID"; then
+        cat "$PHASE_LOG"
+        rm -f "$PHASE_LOG"
     else
-       colormsg "*** RUNNING CONTINGENCY CASES:"
-       RESULTS_DIR="$RESULTS_BASEDIR"/"$DEVICE"
-       mkdir -p "$RESULTS_DIR"
-       set -x
-       "$CONTG_SRC"/run_all_contg.sh "${RUN_OPTS[@]}" $runallopts -o "$RESULTS_DIR" -A "$A" -B "$B" "$CASE_DIR" "$BASECASE" "$DEVICE"_
-       set +x
-       echo
-
-       colormsg "*** COMPUTING CURVE METRICS:"
-       python3 "$CONTG_SRC"/calc_curve_diffmetrics.py "$RESULTS_DIR"/crv "$DEVICE"_ "$BASECASE"
-       echo
-       
-       colormsg "*** COMPUTING TOP 10 DIFFS:"
-       python3 "$DWO_VALIDATION_SRC"/pipeline/top_10_diffs_dwaltz.py "$RESULTS_DIR"/metrics/crv_reducedparams.csv > "$RESULTS_DIR"/../top_10_diffs_"$DEVICE".txt
-       echo
-    
-       colormsg "*** COMPUTING AUTOMATA EVENT METRICS:"
-       python3 "$CONTG_SRC"/calc_automata_diffmetrics.py "$RESULTS_DIR"/aut "$DEVICE"_ "$BASECASE"
-       echo
-
-       colormsg "*** CREATING NOTEBOOK:"
-       python3 "$DWO_VALIDATION_SRC"/notebooks/generate_notebooks.py "$(cd "$(dirname "$RESULTS_DIR")"; pwd)/$DEVICE" "$BASECASE" "$DEVICE"_
-       mkdir -p "$RESULTS_DIR"/notebooks
-       cp "$DWO_VALIDATION_SRC""/notebooks/simulator_A_vs_simulator_B_final.ipynb" "$RESULTS_DIR"/notebooks
-       rm "$DWO_VALIDATION_SRC""/notebooks/simulator_A_vs_simulator_B_final.ipynb"
-       echo
+        cat "$PHASE_LOG"
+        echo "ERROR: background phase failed (see $PHASE_LOG)"
+        exit 1
     fi
+}
 
-done
+# Comparison of N launchers (option -L): instead of one campaign per pair, every
+# launcher simulates the cases just once, into its own store of raw results, and
+# then each pair of launchers gets its own results dir, in which the stored results
+# of both are post-processed and aggregated (see commons/contg_nway.py)
+run_nway()
+{
+    local DEVICE=$1
+    local i k
+    dirList=$(find_cmd "$DEVICE"_)
+    if [ -z "$dirList" ]; then
+       echo -e "No cases with pattern $DEVICE""_* found under $CASE_DIR"
+       return
+    fi
+    for i in "${!NWAY_LABELS[@]}"; do
+        local STORE_DIR="$RESULTS_BASEDIR"/launchers/"${NWAY_LABELS[$i]}"/"$DEVICE"
+        colormsg "*** RUNNING CONTINGENCY CASES WITH LAUNCHER: ${NWAY_LABELS[$i]}"
+        mkdir -p "$STORE_DIR"
+        set -x
+        "$CONTG_SRC"/run_all_contg.sh "${STORE_OPTS[@]}" -S A -N -o "$STORE_DIR" -A "${NWAY_LAUNCHERS[$i]}" -B "${NWAY_LAUNCHERS[$i]}" "$CASE_DIR" "$BASECASE" "$DEVICE"_
+        set +x
+        echo
+    done
+    for k in "${!NWAY_PAIRS[@]}"; do
+        local PAIR LABEL_A LAUNCHER_A LABEL_B LAUNCHER_B
+        IFS=";" read -r PAIR LABEL_A LAUNCHER_A LABEL_B LAUNCHER_B <<< "${NWAY_PAIRS[$k]}"
+        local PAIR_DIR="$RESULTS_BASEDIR"/"$PAIR"
+        colormsg "*** POST-PROCESSING CONTINGENCY CASES FOR: $PAIR"
+        # (the cases are kept until the last pair is done)
+        declare -a OPTS=("${PAIR_OPTS[@]}")
+        if [ "$NWAY_CLEANUP" = "y" ] && [ $((k + 1)) -eq ${#NWAY_PAIRS[@]} ]; then
+            OPTS+=("-c")
+        fi
+        mkdir -p "$PAIR_DIR"/"$DEVICE"
+        set -x
+        python3 "$COMMONS_SRC"/contg_nway.py link "$CASE_TYPE" "$RESULTS_BASEDIR"/launchers/"$LABEL_A"/"$DEVICE" "$RESULTS_BASEDIR"/launchers/"$LABEL_B"/"$DEVICE" "$PAIR_DIR"/"$DEVICE"
+        "$CONTG_SRC"/run_all_contg.sh "${OPTS[@]}" -S none -o "$PAIR_DIR"/"$DEVICE" -A "$LAUNCHER_A" -B "$LAUNCHER_B" "$CASE_DIR" "$BASECASE" "$DEVICE"_
+        set +x
+        echo
+        # The pair dir is just like the results dir of a campaign of that pair
+        RESULTS_BASEDIR="$PAIR_DIR" aggregate_results "$DEVICE"
+    done
+}
+
+# Merge the results of several shards (option -M): the metrics, etc. are merged by
+# commons/contg_shard.py, and the top 10 diffs are computed on the merged metrics
+merge_results()
+{
+    local DEVICE=$1
+    local RESULTS_DIR="$RESULTS_BASEDIR"/"$DEVICE"
+    colormsg "*** COMPUTING TOP 10 DIFFS:"
+    python3 "$DWO_VALIDATION_SRC"/pipeline/top_10_diffs_dwaltz.py "$RESULTS_DIR"/metrics/crv_reducedparams.csv >| "$RESULTS_DIR"/../top_10_diffs_"$DEVICE".txt
+    echo
+    create_notebook "$DEVICE"
+}
+
+DEVICES=("${!create_contg[@]}")
+if [ "$shard" != "None" ]; then
+    mapfile -t DEVICES < <(python3 "$COMMONS_SRC"/contg_shard.py devices "$shard" "${DEVICES[@]}")
+fi
+# The shared prefix of a previous run may be stale (e.g. if the BASECASE or the
+# launchers have changed since then)
+if [ $sharedprefix = "y" ]; then
+    rm -rf "$CASE_DIR"/.PREFIX_*
+fi
+if [ ${#SHARDS[@]} -gt 0 ]; then
+    colormsg "*** MERGING ${#SHARDS[@]} SHARDS:"
+    python3 "$COMMONS_SRC"/contg_shard.py merge "$RESULTS_BASEDIR" "${SHARDS[@]}"
+    echo
+    for DEVICE in "${DEVICES[@]}"; do
+        if [ -f "$RESULTS_BASEDIR"/"$DEVICE"/jobs_ledger.csv ]; then
+            echo
+            colormsg "****** PROCESSING: $DEVICE"
+            echo
+            merge_results "$DEVICE"
+        fi
+    done
+elif [ ${#LAUNCHERS[@]} -gt 0 ]; then
+    # The pairs to compare (which depend on the case type), and the options for the
+    # runs of each launcher and of each pair: only the simulations of each launcher
+    # use the shared prefix, and the cases are only deleted after the last pair
+    CASE_TYPE=$(python3 "$CONTG_SRC"/dwo_jobinfo.py "$BASECASE" | grep -F "CASE_TYPE" | cut -d'=' -f2)
+    if ! NWAY_TXT=$(python3 "$COMMONS_SRC"/contg_nway.py pairs "$RESULTS_BASEDIR" "$CASE_TYPE" "${LAUNCHERS[@]}"); then
+        echo "$NWAY_TXT"
+        exit 1
+    fi
+    mapfile -t NWAY_PAIRS <<< "$NWAY_TXT"
+    NWAY_TXT=$(python3 "$COMMONS_SRC"/contg_nway.py launchers "${LAUNCHERS[@]}")
+    mapfile -t NWAY_LABELS < <(echo "$NWAY_TXT" | cut -d';' -f1)
+    mapfile -t NWAY_LAUNCHERS < <(echo "$NWAY_TXT" | cut -d';' -f2-)
+    declare -a RUNALL_ARGS STORE_OPTS=() PAIR_OPTS=()
+    read -ra RUNALL_ARGS <<< "$runallopts"
+    NWAY_CLEANUP=n
+    for opt in "${RUN_OPTS[@]}" "${RUNALL_ARGS[@]}"; do
+        case "$opt" in
+            -c) NWAY_CLEANUP=y ;;
+            -P|-K) STORE_OPTS+=("$opt") ;;
+            *) STORE_OPTS+=("$opt"); PAIR_OPTS+=("$opt") ;;
+        esac
+    done
+    colormsg "*** COMPARING ${#NWAY_LABELS[@]} LAUNCHERS (${#NWAY_PAIRS[@]} PAIRS):"
+    printf '   %s\n' "${NWAY_PAIRS[@]%%;*}"
+    for DEVICE in "${DEVICES[@]}"; do
+        echo
+        colormsg "****** PROCESSING: $DEVICE"
+        echo
+        create_cases "$DEVICE"
+        run_nway "$DEVICE"
+    done
+    echo
+    colormsg "*** RANKING THE PAIRS OF LAUNCHERS:"
+    python3 "$COMMONS_SRC"/contg_nway.py summary "$RESULTS_BASEDIR"
+elif [ "$overlap" = "n" ]; then
+    for DEVICE in "${DEVICES[@]}"; do
+        echo
+        colormsg "****** PROCESSING: $DEVICE"
+        echo
+        create_cases "$DEVICE"
+        run_cases "$DEVICE"
+        if [ "$CASES_RUN" = "y" ]; then
+            aggregate_results "$DEVICE"
+        fi
+    done
+else
+    # Only the simulation of the cases uses all the cores, so the creation of the
+    # cases of the next type of device, and the metrics and notebook of the previous
+    # one, are run in the background while simulating the current one. Their output
+    # goes to a log under the results dir, shown once they finish. The aggregation
+    # phases are run one at a time, since the notebook generation writes a fixed
+    # file under the source tree.
+    CREATE_PID="" CREATE_LOG="" AGGR_PID="" AGGR_LOG=""
+    for i in "${!DEVICES[@]}"; do
+        DEVICE=${DEVICES[$i]}
+        echo
+        colormsg "****** PROCESSING: $DEVICE"
+        echo
+        if [ -z "$CREATE_PID" ]; then
+            create_cases "$DEVICE"
+        else
+            wait_phase "$CREATE_PID" "$CREATE_LOG"
+        fi
+        CREATE_PID=""
+        # (with --jit, the cases are created while simulating anyway)
+        if [ $((i + 1)) -lt ${#DEVICES[@]} ] && [ "$jit" = "n" ]; then
+            NEXT_DEVICE=${DEVICES[$((i + 1))]}
+            CREATE_LOG="$RESULTS_BASEDIR"/.create_"$NEXT_DEVICE".log
+            # (on a single core, since the simulations are already using all of them)
+            (CREATE_JOBS_OPTS=("-j" "1"); create_cases "$NEXT_DEVICE") >| "$CREATE_LOG" 2>&1 &
+            CREATE_PID=$!
+        fi
+        run_cases "$DEVICE"
+        if [ -n "$AGGR_PID" ]; then
+            wait_phase "$AGGR_PID" "$AGGR_LOG"
+            AGGR_PID=""
+        fi
+        if [ "$CASES_RUN" = "y" ]; then
+            AGGR_LOG="$RESULTS_BASEDIR"/.aggregate_"$DEVICE".log
+            # (single-threaded, so as not to compete with the simulations)
+            OMP_NUM_THREADS=1 OPENBLAS_NUM_THREADS=1 MKL_NUM_THREADS=1 \
+                aggregate_results "$DEVICE" >| "$AGGR_LOG" 2>&1 &
+            AGGR_PID=$!
+        fi
+    done
+    if [ -n "$AGGR_PID" ]; then
+        wait_phase "$AGGR_PID" "$AGGR_LOG"
+    fi
+fi
 
+if [ $sharedprefix = "y" ]; then
+    rm -rf "$CASE_DIR"/.PREFIX_*
+fi